@@ -0,0 +1,432 @@
+"""
+async_sync.py
+─────────────
+Concurrent service × region × currency sweep of the Retail Prices API – the
+replacement for the sequential runFullSync/runQuickSync loops that used to
+live in src/sync.js (which now just runs this script).
+
+Every (service, region, currency) is a cell. Up to --concurrency cells are
+fetched at once (each cell follows its own NextPageLink chain). Pages are
+decoded on a process pool (staged_ingest.decode_page) and streamed through a
+bounded queue into a single staged_ingest.StagingWriter. Nothing is held in
+memory beyond the queue and the current batch.
+
+Cells are tracked in `sync_cells`. A cell is marked done only once the batch
+holding its last page has been committed, or spooled to the dead-letter
+directory. A sweep that was interrupted or had failed cells is resumed by the
+next run of the same sweep, which fetches only the cells that are not done.
+429 and 5xx responses are retried with backoff, honouring Retry-After.
+
+The sweep holds the update_prices advisory lock (orchestrate.job_lock), so it
+never overlaps the nightly price load.
+
+Usage:
+    python async_sync.py                      # full sweep (resumes an unfinished one)
+    python async_sync.py --sweep quick        # 5 popular services, centralindia
+    python async_sync.py --restart            # start the sweep over
+    python async_sync.py --concurrency 16 --workers 4
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import threading
+import requests
+import psycopg2
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+from dotenv import load_dotenv
+from staged_ingest import StagingWriter, decode_page, init_worker, next_page_link
+from price_schema import require_schema
+from price_history import ensure_history_table
+from effective_rates import refresh_effective_rates
+from catalog_epoch import publish_epoch
+from sync_log import create_sync_log, complete_sync_log
+from orchestrate import job_lock
+from ingest_rules import RULES
+from telemetry import TELEMETRY
+import metrics
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+API_URL = "https://prices.azure.com/api/retail/prices"
+JOB = 'async_sync'
+LOCK_JOB = 'update_prices'
+
+SERVICES = [
+    'Virtual Machines',
+    'Storage',
+    'SQL Database',
+    'Azure Cosmos DB',
+    'Azure App Service',
+    'Container Instances',
+    'Azure Kubernetes Service',
+    'Azure Functions',
+    'Bandwidth',
+    'Load Balancer',
+    'VPN Gateway',
+    'Azure DNS',
+    'Azure Firewall',
+    'Azure Cache for Redis',
+    'Azure Database for PostgreSQL',
+    'Azure Database for MySQL',
+    'Cognitive Services',
+    'Azure Monitor',
+    'Key Vault',
+    'Azure Active Directory',
+    'Event Hubs',
+    'Service Bus',
+    'Azure Blob Storage',
+    'Content Delivery Network',
+    'Azure DevOps',
+    'Azure Machine Learning',
+    'Azure Synapse Analytics',
+]
+
+REGIONS = [
+    'eastus', 'eastus2', 'westus', 'westus2', 'westus3',
+    'centralus', 'northeurope', 'westeurope', 'uksouth',
+    'southeastasia', 'eastasia', 'japaneast',
+    'australiaeast', 'canadacentral', 'centralindia',
+    'brazilsouth', 'koreacentral', 'francecentral',
+    'germanywestcentral', 'southafricanorth',
+]
+
+# The app reads USD rows only and converts with currency_rates
+# (update_currency_rates.py); other currencies would be stored and never read.
+CURRENCIES = ['USD']
+
+# Sweep name → (services, regions, currencies)
+SWEEPS = {
+    'full': (SERVICES, REGIONS, CURRENCIES),
+    'quick': (['Virtual Machines', 'Storage', 'SQL Database', 'Bandwidth', 'Azure App Service'],
+              ['centralindia'], CURRENCIES),
+}
+
+CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 8))
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+MAX_ATTEMPTS = 6
+REQUEST_TIMEOUT = 60
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS sync_cells (
+    sweep_id INTEGER NOT NULL,
+    sweep TEXT NOT NULL,
+    service_name TEXT NOT NULL,
+    arm_region_name TEXT NOT NULL,
+    currency_code TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    run_id INTEGER,
+    pages INTEGER DEFAULT 0,
+    items INTEGER DEFAULT 0,
+    error TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (sweep_id, service_name, arm_region_name, currency_code)
+);
+CREATE INDEX IF NOT EXISTS sync_cells_open_idx ON sync_cells (sweep, sweep_id) WHERE status NOT IN ('done', 'spooled');
+"""
+
+# Statuses a resumed sweep does not fetch again
+FINISHED = ('done', 'spooled')
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def sweep_cells(name):
+    services, regions, currencies = SWEEPS[name]
+    return [(s, r, c) for c in currencies for s in services for r in regions]
+
+
+def cell_url(service, region, currency):
+    query = f"serviceName eq '{service}' and armRegionName eq '{region}'"
+    return f"{API_URL}?currencyCode={currency}&$filter={quote(query)}"
+
+
+# ── Cell bookkeeping ───────────────────────────────────────────────────────────
+def open_sweep(conn, name, cells, run_id, resume=True):
+    """(sweep id, cells still to fetch). Resumes the latest unfinished sweep of this name."""
+    cur = conn.cursor()
+    cur.execute(CREATE_TABLE_SQL)
+    sweep_id = None
+    if resume:
+        cur.execute(
+            "SELECT MAX(sweep_id) FROM sync_cells WHERE sweep = %s AND status NOT IN %s",
+            (name, FINISHED)
+        )
+        sweep_id = cur.fetchone()[0]
+
+    if sweep_id is None:
+        sweep_id = run_id
+        cur.executemany(
+            "INSERT INTO sync_cells (sweep_id, sweep, service_name, arm_region_name, currency_code) "
+            "VALUES (%s, %s, %s, %s, %s) ON CONFLICT DO NOTHING",
+            [(sweep_id, name, *cell) for cell in cells]
+        )
+        todo = list(cells)
+    else:
+        cur.execute(
+            "SELECT service_name, arm_region_name, currency_code FROM sync_cells "
+            "WHERE sweep_id = %s AND status NOT IN %s ORDER BY currency_code, service_name, arm_region_name",
+            (sweep_id, FINISHED)
+        )
+        todo = [tuple(row) for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    return sweep_id, todo
+
+
+def mark_cells(conn, sweep_id, run_id, cells, status, error=None):
+    """cells: [(cell, pages, items)]"""
+    cur = conn.cursor()
+    cur.executemany(
+        "UPDATE sync_cells SET status = %s, run_id = %s, pages = %s, items = %s, error = %s, updated_at = NOW() "
+        "WHERE sweep_id = %s AND service_name = %s AND arm_region_name = %s AND currency_code = %s",
+        [(status, run_id, pages, items, error, sweep_id, *cell) for cell, pages, items in cells]
+    )
+    conn.commit()
+    cur.close()
+
+
+# ── Fetching ───────────────────────────────────────────────────────────────────
+class CellError(Exception):
+    pass
+
+
+_local = threading.local()
+
+
+def _get(url):
+    # One Session (connection pool) per fetch thread
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session.get(url, timeout=REQUEST_TIMEOUT)
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return min(2 ** attempt, 60)
+
+
+async def fetch_page(url):
+    """Raw page bytes; retries throttling, server errors and network failures."""
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = None
+        try:
+            with TELEMETRY.stage('http'):
+                response = await asyncio.to_thread(_get, url)
+            TELEMETRY.count_response(response)
+            if response.status_code == 200:
+                return response.content
+            error = f"API Error: {response.status_code}"
+            if response.status_code != 429 and response.status_code < 500:
+                raise CellError(f"{error} - {response.text[:200]}")
+        except requests.RequestException as e:
+            TELEMETRY.count('http_errors')
+            error = f"Request failed: {e}"
+        await asyncio.sleep(_retry_delay(response, attempt))
+    raise CellError(f"{error} (after {MAX_ATTEMPTS} attempts)")
+
+
+async def sync_cell(cell, queue, decode_pool):
+    """Follow one cell's page chain, queueing every decoded page for the writer."""
+    loop = asyncio.get_running_loop()
+    url = cell_url(*cell)
+    try:
+        while url:
+            raw = await fetch_page(url)
+            TELEMETRY.count('bytes', len(raw))
+            TELEMETRY.count('pages')
+            url = next_page_link(raw)
+            buffer, rows, fetched, rule_stats, stage_stats = await loop.run_in_executor(decode_pool, decode_page, raw)
+            RULES.merge_stats(rule_stats)
+            TELEMETRY.merge_stats(stage_stats)
+            await queue.put(('page', cell, buffer, rows, fetched, url is None))
+    except Exception as e:
+        await queue.put(('failed', cell, str(e)))
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+async def write_pages(queue, writer, conn, sweep_id, run_id, stats, total):
+    """
+    The only coroutine that touches the database. Cells whose last page has
+    been added are marked finished once the writer has flushed them.
+    """
+    progress = {}
+    finished = []
+    counts = Counter()
+    batches = stats["processed_batches"]
+    buffered = False
+
+    async def settle():
+        nonlocal finished, batches, buffered
+        # Rows were flushed but no batch committed: the writer spooled them
+        status = 'spooled' if buffered and stats["processed_batches"] == batches else 'done'
+        batches, buffered = stats["processed_batches"], False
+        if finished:
+            await asyncio.to_thread(mark_cells, conn, sweep_id, run_id,
+                                    [(cell, *progress.pop(cell)) for cell in finished], status)
+            counts[status] += len(finished)
+            finished = []
+
+    while True:
+        message = await queue.get()
+        if message is None:
+            break
+        if message[0] == 'failed':
+            _, cell, error = message
+            pages, items = progress.pop(cell, (0, 0))
+            await asyncio.to_thread(mark_cells, conn, sweep_id, run_id, [(cell, pages, items)], 'failed', error)
+            counts['failed'] += 1
+            print(f"\n⚠ {'/'.join(cell)}: {error}")
+            continue
+
+        _, cell, buffer, rows, fetched, last = message
+        pages, items = progress.get(cell, (0, 0))
+        progress[cell] = (pages + 1, items + fetched)
+        stats["fetched"] += fetched
+        buffered = buffered or rows > 0
+        await asyncio.to_thread(writer.add, buffer, rows)
+        if last:
+            finished.append(cell)
+        if writer.pending_rows == 0:
+            await settle()
+
+        sys.stdout.write(f"\rCells: {sum(counts.values())}/{total} | Fetched: {stats['fetched']} | "
+                         f"Changed: {stats['total_affected']} | Skipped: {stats['total_skipped']}")
+        sys.stdout.flush()
+
+    await asyncio.to_thread(writer.flush)
+    await settle()
+    return counts
+
+
+async def run_cells(cells, writer, conn, sweep_id, run_id, stats, concurrency, workers):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 1))
+    # Bounded: fetchers wait for the writer instead of piling pages up in memory
+    queue = asyncio.Queue(maxsize=2 * concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(cell):
+        async with semaphore:
+            await sync_cell(cell, queue, decode_pool)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as decode_pool:
+        writer_task = asyncio.create_task(
+            write_pages(queue, writer, conn, sweep_id, run_id, stats, len(cells))
+        )
+        await asyncio.gather(*(bounded(cell) for cell in cells))
+        await queue.put(None)
+        return await writer_task
+
+
+# ── Sweep ──────────────────────────────────────────────────────────────────────
+def run_sweep(name, cells, concurrency=CONCURRENCY, workers=None, resume=True):
+    """
+    Sync `cells` ([(service, region, currency)]) as sweep `name` under the
+    update_prices lock. Returns (cell status counts, error or None).
+    """
+    lock_conn = get_db_connection()
+    lock_conn.autocommit = True
+    try:
+        with job_lock(lock_conn, LOCK_JOB) as acquired:
+            if not acquired:
+                return Counter(), f"{LOCK_JOB} is already running elsewhere; {name} sweep not started"
+            return _run_locked(name, cells, concurrency, workers or DECODE_WORKERS, resume)
+    finally:
+        lock_conn.close()
+
+
+def _run_locked(name, cells, concurrency, workers, resume):
+    conn = get_db_connection()
+    require_schema(conn)
+    ensure_history_table(conn)
+    run_id = create_sync_log(conn, JOB)
+    metrics.start(JOB)
+    error = None
+    counts = Counter()
+    stats = {
+        "fetched": 0,
+        "processed_batches": 0,
+        "total_affected": 0,
+        "total_skipped": 0,
+        "history_rows": 0,
+        "service_changes": Counter()
+    }
+
+    start_time = datetime.now()
+    try:
+        sweep_id, todo = open_sweep(conn, name, cells, run_id, resume)
+        resumed = f", resuming sweep {sweep_id}" if sweep_id != run_id else ""
+        print(f"[{start_time}] {name} sweep (run {run_id}{resumed}): {len(todo)}/{len(cells)} cells, "
+              f"concurrency {concurrency}, {workers} decode workers")
+
+        writer = StagingWriter(conn, run_id, stats, job=JOB)
+        counts = asyncio.run(run_cells(todo, writer, conn, sweep_id, run_id, stats, concurrency, workers))
+
+        elapsed = (datetime.now() - start_time).total_seconds()
+        print(f"\n\nSweep Summary ({elapsed:.0f}s):")
+        print(f"  Cells: {counts['done']} done, {counts['spooled']} spooled, {counts['failed']} failed")
+        print(f"  Total Fetched: {stats['fetched']}")
+        print(f"  Total Changed (Inserted/Updated): {stats['total_affected']}")
+        print(f"  Total Skipped (Unchanged): {stats['total_skipped']}")
+        print(f"  Price Changes Recorded: {stats['history_rows']}")
+        RULES.report()
+        TELEMETRY.report()
+
+        if stats["total_affected"]:
+            print(f"  Effective Rates Refreshed: {refresh_effective_rates(conn)}")
+            print(f"  Catalog Epoch Published: {publish_epoch(conn, JOB, stats['service_changes'], run_id)}")
+        if counts['failed']:
+            error = f"{counts['failed']} cells failed; rerun to resume sweep {sweep_id}"
+    except KeyboardInterrupt:
+        error = "Stopped by user"
+        print("\nStopped by user.")
+    except Exception as e:
+        error = str(e)
+        print(f"\nUnexpected error: {e}")
+    finally:
+        TELEMETRY.count('items_fetched', stats["fetched"])
+        TELEMETRY.count('rows_changed', stats["total_affected"])
+        TELEMETRY.count('rows_unchanged', stats["total_skipped"])
+        TELEMETRY.count('history_rows', stats["history_rows"])
+        complete_sync_log(conn, run_id, stats["total_affected"], error, TELEMETRY.summary())
+        metrics.finish(conn, error)
+        conn.close()
+    return counts, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent service × region × currency price sync.")
+    parser.add_argument('--sweep', choices=sorted(SWEEPS), default='full')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="cells fetched at once")
+    parser.add_argument('--workers', type=int, default=None, help="decode processes")
+    parser.add_argument('--restart', action='store_true', help="don't resume an unfinished sweep")
+    args = parser.parse_args()
+
+    _, error = run_sweep(args.sweep, sweep_cells(args.sweep), args.concurrency, args.workers, resume=not args.restart)
+    if error:
+        print(f"❌ {error}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+bench_json_codec.py
+───────────────────
+Compares the JSON backends json_codec.py can use on real retail-price pages:
+
+  - page decode            stdlib json.loads vs orjson.loads
+  - raw_data encode        per-item json.dumps vs orjson.dumps
+  - raw pass-through       page_items_with_raw() (decode + keep item text)
+
+Pages are either fetched from the API or read from a saved page / dump file
+(a JSON array of items, e.g. the output of fetch_azure_prices.py).
+
+Usage:
+    python bench_json_codec.py [--pages 5] [--repeat 3]
+    python bench_json_codec.py --file azure_pricing_dump.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import requests
+import json_codec
+
+API_URL = "https://prices.azure.com/api/retail/prices"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def fetch_pages(count):
+    pages = []
+    url = API_URL + "?currencyCode=USD"
+    session = requests.Session()
+    while url and len(pages) < count:
+        response = session.get(url, timeout=30)
+        if response.status_code != 200:
+            print(f"API Error: {response.status_code} - {response.text}")
+            break
+        pages.append(response.content)
+        url = json_codec.loads(response.content).get('NextPageLink')
+        sys.stdout.write(f"\r📄 Fetched {len(pages)}/{count} pages")
+        sys.stdout.flush()
+    print()
+    return pages
+
+
+def load_file(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    if isinstance(data, list):
+        # A dump file: wrap it as one page so every case sees the same shape
+        raw = json.dumps({"Items": data, "NextPageLink": None}).encode('utf-8')
+    return [raw]
+
+
+def best_of(repeat, fn, pages):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON backends on retail-price pages.")
+    parser.add_argument('--pages', type=int, default=5, help="API pages to fetch (default 5)")
+    parser.add_argument('--file', help="Benchmark a saved page or dump file instead of fetching")
+    parser.add_argument('--repeat', type=int, default=3, help="Best of N runs (default 3)")
+    args = parser.parse_args()
+
+    pages = load_file(args.file) if args.file else fetch_pages(args.pages)
+    if not pages:
+        print("No pages to benchmark.")
+        sys.exit(1)
+    items = [item for page in pages for item in json.loads(page).get('Items', [])]
+    size_mb = sum(len(p) for p in pages) / 1e6
+    print(f"📦 {len(pages)} pages, {len(items)} items, {size_mb:.1f} MB | json_codec backend: {json_codec.BACKEND}")
+
+    cases = [
+        ("decode   stdlib", lambda page: json.loads(page)),
+        ("encode   stdlib", lambda page: [json.dumps(i, separators=(',', ':')) for i in json.loads(page)['Items']]),
+    ]
+    if orjson is not None:
+        cases += [
+            ("decode   orjson", lambda page: orjson.loads(page)),
+            ("encode   orjson", lambda page: [orjson.dumps(i) for i in orjson.loads(page)['Items']]),
+        ]
+    else:
+        print("⚠️ orjson not installed – only the stdlib backend is measured (pip install orjson)")
+    cases.append(("raw pass-through", json_codec.page_items_with_raw))
+
+    print(f"\n{'case':<18} {'best (s)':>10} {'MB/s':>10} {'items/s':>12}")
+    print("─" * 53)
+    for name, fn in cases:
+        seconds = best_of(args.repeat, fn, pages)
+        print(f"{name:<18} {seconds:>10.3f} {size_mb / seconds:>10.1f} {len(items) / seconds:>12,.0f}")
+    print("\n'encode' rows include the page decode they need; compare them with 'raw pass-through'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+build_price_matrix.py
+─────────────────────
+Builds the dense SKU × region × (os, term) price matrix for Virtual Machines
+after each sync, so the VM comparison page and "cheapest region for this SKU"
+lookups never have to scan `azure_prices`.
+
+Two outputs are written from a single grouped query:
+
+  1. data/vm_price_matrix.bin – a single memory-mappable file:
+         magic 'VMPM' | uint32 format version | uint32 header length
+         | JSON header (sku / region / variant index dictionaries)
+         | padding to 8 bytes
+         | float64 prices   [n_skus × n_regions × n_variants]  (NaN = no price)
+         | int32 cheapest   [n_skus × n_variants]              (-1 = none)
+     The file is replaced atomically, so readers never see a half-written matrix.
+
+  2. vm_price_matrix table – the same cells as narrow rows
+     (sku_name, arm_region_name, os, term, price_per_hour, is_cheapest).
+
+All prices are USD per hour. Reservation totals are normalised by the term
+length so every variant is directly comparable.
+
+Usage:
+    python build_price_matrix.py [output_path]
+"""
+
+import os
+import sys
+import json
+import math
+import mmap
+import array
+import struct
+import psycopg2
+from psycopg2 import extras
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from catalog_epoch import publish_epoch, VM_PRICE_MATRIX
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+# ── Configuration ──────────────────────────────────────────────────────────────
+MATRIX_PATH = os.environ.get(
+    'VM_PRICE_MATRIX_PATH',
+    os.path.join(os.path.dirname(__file__), '../data/vm_price_matrix.bin')
+)
+MAGIC = b'VMPM'
+FORMAT_VERSION = 1
+HOURS_PER_MONTH = 730
+
+# (os, term) combinations stored per SKU × region.
+# Reservations only cover base compute, so they are recorded under 'linux'.
+VARIANTS = [
+    ('linux', 'payg'),
+    ('windows', 'payg'),
+    ('linux', '1y'),
+    ('linux', '3y'),
+]
+TERM_MONTHS = {'1y': 12, '3y': 36}
+
+MATRIX_SQL = """
+SELECT sku_name,
+       arm_region_name,
+       MIN(location) AS location,
+       CASE WHEN product_name ILIKE '%%Windows%%' THEN 'windows' ELSE 'linux' END AS os,
+       type,
+       reservation_term,
+       MIN(retail_price) AS price
+FROM azure_prices
+WHERE service_name = 'Virtual Machines'
+  AND currency_code = 'USD'
+  AND is_active = TRUE
+  AND retail_price > 0
+  AND type IN ('Consumption', 'Reservation')
+  AND product_name NOT ILIKE '%%Spot%%'
+  AND product_name NOT ILIKE '%%Low Priority%%'
+  AND sku_name NOT ILIKE '%%Spot%%'
+  AND sku_name NOT ILIKE '%%Low Priority%%'
+GROUP BY sku_name, arm_region_name, 4, type, reservation_term
+"""
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS vm_price_matrix (
+    sku_name         TEXT NOT NULL,
+    arm_region_name  TEXT NOT NULL,
+    location         TEXT,
+    os               TEXT NOT NULL,
+    term             TEXT NOT NULL,
+    price_per_hour   DOUBLE PRECISION NOT NULL,
+    is_cheapest      BOOLEAN DEFAULT FALSE,
+    generated_at     TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (sku_name, os, term, arm_region_name)
+);
+CREATE INDEX IF NOT EXISTS idx_vm_price_matrix_cheapest
+    ON vm_price_matrix(sku_name, os, term) WHERE is_cheapest;
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def term_key(price_type, reservation_term):
+    """Map (type, reservation_term) onto the matrix term axis ('payg', '1y', '3y')."""
+    if price_type == 'Consumption':
+        return 'payg'
+    term = (reservation_term or '').strip().lower()
+    if term.startswith('1 year'):
+        return '1y'
+    if term.startswith('3 year'):
+        return '3y'
+    return None
+
+
+# ── Build ──────────────────────────────────────────────────────────────────────
+def fetch_cells(conn):
+    """Return {(sku, region, variant_idx): price_per_hour} plus region → location."""
+    variant_index = {v: i for i, v in enumerate(VARIANTS)}
+    cells = {}
+    locations = {}
+
+    cur = conn.cursor()
+    cur.execute(MATRIX_SQL)
+    for sku, region, location, os_name, price_type, reservation_term, price in cur:
+        term = term_key(price_type, reservation_term)
+        if not sku or not region or term is None:
+            continue
+        if term != 'payg':
+            os_name = 'linux'
+            price = price / (TERM_MONTHS[term] * HOURS_PER_MONTH)
+        v = variant_index.get((os_name, term))
+        if v is None:
+            continue
+        key = (sku, region, v)
+        if key not in cells or price < cells[key]:
+            cells[key] = price
+        if location:
+            locations.setdefault(region, location)
+    cur.close()
+    return cells, locations
+
+
+def build_matrix(cells):
+    """Lay the sparse cells out as dense row-major arrays."""
+    skus = sorted({k[0] for k in cells})
+    regions = sorted({k[1] for k in cells})
+    sku_index = {s: i for i, s in enumerate(skus)}
+    region_index = {r: i for i, r in enumerate(regions)}
+    n_r, n_v = len(regions), len(VARIANTS)
+
+    prices = array.array('d', [math.nan]) * (len(skus) * n_r * n_v)
+    cheapest = array.array('i', [-1]) * (len(skus) * n_v)
+
+    for (sku, region, v), price in cells.items():
+        s, r = sku_index[sku], region_index[region]
+        prices[(s * n_r + r) * n_v + v] = price
+        best = cheapest[s * n_v + v]
+        if best < 0 or price < prices[(s * n_r + best) * n_v + v]:
+            cheapest[s * n_v + v] = r
+
+    return skus, regions, prices, cheapest
+
+
+def write_matrix_file(path, skus, regions, locations, prices, cheapest, generated_at):
+    header = json.dumps({
+        'generated_at': generated_at.isoformat(),
+        'byteorder': sys.byteorder,
+        'shape': [len(skus), len(regions), len(VARIANTS)],
+        'skus': skus,
+        'regions': regions,
+        'locations': locations,
+        'variants': [f"{o}/{t}" for o, t in VARIANTS],
+    }, separators=(',', ':')).encode('utf-8')
+
+    prefix = MAGIC + struct.pack('<II', FORMAT_VERSION, len(header)) + header
+    padding = b'\0' * (-len(prefix) % 8)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix + padding)
+        prices.tofile(f)
+        cheapest.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def write_matrix_table(conn, skus, regions, locations, prices, cheapest, generated_at):
+    n_r, n_v = len(regions), len(VARIANTS)
+    rows = []
+    for s, sku in enumerate(skus):
+        for v, (os_name, term) in enumerate(VARIANTS):
+            best = cheapest[s * n_v + v]
+            for r, region in enumerate(regions):
+                price = prices[(s * n_r + r) * n_v + v]
+                if math.isnan(price):
+                    continue
+                rows.append((sku, region, locations.get(region), os_name, term, price, r == best, generated_at))
+
+    cur = conn.cursor()
+    cur.execute(CREATE_TABLE_SQL)
+    # DELETE instead of TRUNCATE so readers keep seeing the previous matrix until commit
+    cur.execute("DELETE FROM vm_price_matrix")
+    extras.execute_values(
+        cur,
+        """
+        INSERT INTO vm_price_matrix (
+            sku_name, arm_region_name, location, os, term,
+            price_per_hour, is_cheapest, generated_at
+        ) VALUES %s
+        """,
+        rows,
+        page_size=1000
+    )
+    conn.commit()
+    cur.close()
+    return len(rows)
+
+
+def build_price_matrix(conn, path=MATRIX_PATH):
+    generated_at = datetime.now(timezone.utc)
+    cells, locations = fetch_cells(conn)
+    skus, regions, prices, cheapest = build_matrix(cells)
+    write_matrix_file(path, skus, regions, locations, prices, cheapest, generated_at)
+    row_count = write_matrix_table(conn, skus, regions, locations, prices, cheapest, generated_at)
+    publish_epoch(conn, 'build_price_matrix', {VM_PRICE_MATRIX: row_count})
+    return len(skus), len(regions), row_count
+
+
+# ── Read ───────────────────────────────────────────────────────────────────────
+class PriceMatrix:
+    """Memory-mapped reader for vm_price_matrix.bin. Every lookup is O(1)."""
+
+    def __init__(self, path=MATRIX_PATH):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:4] != MAGIC:
+            raise ValueError(f"{path} is not a VM price matrix file")
+        version, header_len = struct.unpack_from('<II', self._mm, 4)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported price matrix format version {version}")
+
+        header = json.loads(self._mm[12:12 + header_len])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError("Price matrix was written on a machine with a different byte order")
+
+        self.generated_at = header['generated_at']
+        self.skus = header['skus']
+        self.regions = header['regions']
+        self.locations = header['locations']
+        self.variants = [tuple(v.split('/')) for v in header['variants']]
+        self.sku_index = {s: i for i, s in enumerate(self.skus)}
+        self.region_index = {r: i for i, r in enumerate(self.regions)}
+        self.variant_index = {v: i for i, v in enumerate(self.variants)}
+        self._n_r = len(self.regions)
+        self._n_v = len(self.variants)
+
+        offset = 12 + header_len
+        offset += -offset % 8
+        n_prices = len(self.skus) * self._n_r * self._n_v
+        view = memoryview(self._mm)
+        self._prices = view[offset:offset + n_prices * 8].cast('d')
+        offset += n_prices * 8
+        self._cheapest = view[offset:offset + len(self.skus) * self._n_v * 4].cast('i')
+
+    def price(self, sku, region, os_name='linux', term='payg'):
+        s = self.sku_index.get(sku)
+        r = self.region_index.get(region)
+        v = self.variant_index.get((os_name, term))
+        if s is None or r is None or v is None:
+            return None
+        price = self._prices[(s * self._n_r + r) * self._n_v + v]
+        return None if math.isnan(price) else price
+
+    def regions_for(self, sku, os_name='linux', term='payg'):
+        """All (region, price_per_hour) pairs for one SKU, in region order."""
+        s = self.sku_index.get(sku)
+        v = self.variant_index.get((os_name, term))
+        if s is None or v is None:
+            return []
+        base = s * self._n_r * self._n_v + v
+        result = []
+        for r, region in enumerate(self.regions):
+            price = self._prices[base + r * self._n_v]
+            if not math.isnan(price):
+                result.append((region, price))
+        return result
+
+    def cheapest_region(self, sku, os_name='linux', term='payg'):
+        s = self.sku_index.get(sku)
+        v = self.variant_index.get((os_name, term))
+        if s is None or v is None:
+            return None
+        r = self._cheapest[s * self._n_v + v]
+        if r < 0:
+            return None
+        return self.regions[r], self._prices[(s * self._n_r + r) * self._n_v + v]
+
+    def close(self):
+        self._prices.release()
+        self._cheapest.release()
+        self._mm.close()
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else MATRIX_PATH
+    start = datetime.now()
+    print(f"[{start}] Building VM price matrix...")
+
+    conn = get_db_connection()
+    try:
+        n_skus, n_regions, row_count = build_price_matrix(conn, path)
+    finally:
+        conn.close()
+
+    elapsed = (datetime.now() - start).total_seconds()
+    print(f"✅ Matrix: {n_skus} SKUs × {n_regions} regions × {len(VARIANTS)} variants "
+          f"({row_count} priced cells) → {path} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+bulk_load.py
+────────────
+Bulk-load tuning for cold loads (`--bulk` in initial_pricing_load.py and
+json_to_postgres.py).
+
+While a loader runs inside bulk_load_mode():
+  - every secondary index on azure_prices is dropped, so inserts only
+    maintain the canonical unique key the upserts need; the definitions are
+    first saved to `bulk_load_index_backup`
+  - the loader's session runs with synchronous_commit = off and a larger
+    maintenance_work_mem; loaders that write on other connections (the
+    json_to_postgres.py workers) apply the same settings with bulk_session()
+
+On exit – normally or after an error – the saved indexes are rebuilt, several
+at a time on separate connections, and the table is ANALYZEd. If the process
+dies before that, the next bulk load restores them first, or run:
+
+Usage:
+    python bulk_load.py --restore [--workers 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+import psycopg2
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+# ── Configuration ──────────────────────────────────────────────────────────────
+BULK_WORKERS = int(os.environ.get('BULK_INDEX_WORKERS', 4))
+BULK_MAINTENANCE_WORK_MEM = os.environ.get('BULK_MAINTENANCE_WORK_MEM', '1GB')
+
+BACKUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bulk_load_index_backup (
+    index_name  TEXT PRIMARY KEY,
+    definition  TEXT NOT NULL,
+    saved_at    TIMESTAMPTZ DEFAULT NOW()
+)
+"""
+
+# Non-unique, non-constraint indexes defined on azure_prices itself
+SECONDARY_INDEXES_SQL = """
+SELECT c.relname, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE i.indrelid = 'azure_prices'::regclass
+  AND NOT i.indisunique
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)
+ORDER BY c.relname
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def drop_secondary_indexes(conn):
+    """Save the secondary index definitions, then drop the indexes. One transaction."""
+    cur = conn.cursor()
+    cur.execute(BACKUP_TABLE_SQL)
+    cur.execute(SECONDARY_INDEXES_SQL)
+    indexes = cur.fetchall()
+    for name, definition in indexes:
+        cur.execute("""
+            INSERT INTO bulk_load_index_backup (index_name, definition) VALUES (%s, %s)
+            ON CONFLICT (index_name) DO UPDATE SET definition = EXCLUDED.definition, saved_at = NOW()
+        """, (name, definition))
+        cur.execute(f"DROP INDEX {name}")
+    conn.commit()
+    cur.close()
+    return [name for name, _ in indexes]
+
+
+def _index_valid(cur, name):
+    """True / False for an existing index, None when there is none."""
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_index i
+        WHERE i.indexrelid = to_regclass(%s)
+    """, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _build_index(name, definition, maintenance_work_mem):
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+        start = time.time()
+        # On a partitioned azure_prices pg_get_indexdef() says "ON ONLY", which
+        # would build an invalid, parent-only index; build it on every partition
+        definition = definition.replace(" ON ONLY ", " ON ", 1)
+        if _index_valid(cur, name) is False:
+            # Left behind invalid (e.g. parent-only) by an earlier rebuild
+            cur.execute(f"DROP INDEX {name}")
+        cur.execute(definition.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1))
+        if not _index_valid(cur, name):
+            raise RuntimeError(f"{name} was created but is not valid")
+        cur.execute("DELETE FROM bulk_load_index_backup WHERE index_name = %s", (name,))
+        conn.commit()
+        cur.close()
+        return time.time() - start
+    finally:
+        conn.close()
+
+
+def restore_indexes(conn, workers=BULK_WORKERS, maintenance_work_mem=BULK_MAINTENANCE_WORK_MEM):
+    """Rebuild every saved index, `workers` at a time, then ANALYZE azure_prices."""
+    cur = conn.cursor()
+    cur.execute(BACKUP_TABLE_SQL)
+    cur.execute("SELECT index_name, definition FROM bulk_load_index_backup ORDER BY index_name")
+    pending = cur.fetchall()
+    conn.commit()
+    if not pending:
+        cur.close()
+        return 0
+
+    print(f"🔧 Rebuilding {len(pending)} indexes ({workers} at a time)...")
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_build_index, name, definition, maintenance_work_mem): name
+            for name, definition in pending
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                print(f"  {name} ({future.result():.1f}s)")
+            except Exception as e:
+                print(f"  ❌ {name}: {e}")
+                failed.append(name)
+
+    print("🔧 ANALYZE azure_prices...")
+    cur.execute("ANALYZE azure_prices")
+    conn.commit()
+    cur.close()
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} indexes could not be rebuilt ({', '.join(failed)}); "
+            "definitions kept in bulk_load_index_backup, run: python bulk_load.py --restore"
+        )
+    return len(pending)
+
+
+def bulk_session(conn, maintenance_work_mem=BULK_MAINTENANCE_WORK_MEM):
+    """Relaxed-durability session settings for a connection that writes a bulk load."""
+    cur = conn.cursor()
+    cur.execute("SET synchronous_commit = off")
+    cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+    conn.commit()
+    cur.close()
+
+
+@contextmanager
+def bulk_load_mode(conn, workers=BULK_WORKERS, maintenance_work_mem=BULK_MAINTENANCE_WORK_MEM):
+    """Run the enclosed load with secondary indexes dropped and relaxed durability."""
+    # Leftovers from a bulk load that died before it could restore
+    restore_indexes(conn, workers, maintenance_work_mem)
+
+    dropped = drop_secondary_indexes(conn)
+    print(f"⚡ Bulk mode: dropped {len(dropped)} secondary indexes, synchronous_commit=off")
+    bulk_session(conn, maintenance_work_mem)
+    try:
+        yield
+    finally:
+        try:
+            conn.rollback()
+            cur = conn.cursor()
+            cur.execute("RESET synchronous_commit")
+            cur.execute("RESET maintenance_work_mem")
+            conn.commit()
+            cur.close()
+        except psycopg2.Error:
+            # The load's connection is gone; its session settings went with it
+            pass
+        # Restore on a fresh connection so a broken load connection cannot block it
+        restore_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        try:
+            restore_indexes(restore_conn, workers, maintenance_work_mem)
+        finally:
+            restore_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore azure_prices indexes dropped by a bulk load.")
+    parser.add_argument('--restore', action='store_true', required=True)
+    parser.add_argument('--workers', type=int, default=BULK_WORKERS)
+    args = parser.parse_args()
+
+    start = datetime.now()
+    conn = get_db_connection()
+    try:
+        restored = restore_indexes(conn, args.workers)
+    finally:
+        conn.close()
+    print(f"✅ Restored {restored} indexes in {(datetime.now() - start).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    main()
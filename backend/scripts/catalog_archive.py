@@ -0,0 +1,364 @@
+"""
+catalog_archive.py
+──────────────────
+Point-in-time archive of the active pricing catalog: a full base snapshot
+once a week and a delta per day in between, compressed with lzma (default)
+or gzip.
+
+Run after each sync (it is the archive_catalog job of orchestrate.py).
+`write` exports every active azure_prices row as its full API item – the
+same item azure_price_item() rebuilds, see slim_raw_data.py – keyed by the
+canonical key and sorted by it, then:
+
+  - writes a base when there is none yet, the last one is BASE_INTERVAL_DAYS
+    (default 7) old, or --base is given
+  - otherwise merges the export against the previous day's catalog and
+    writes only the added, removed and changed meters
+  - writes nothing when the catalog epoch has not moved since the last
+    snapshot
+
+Files live in CATALOG_ARCHIVE_DIR (default scripts/catalog_archive/), one
+per day:
+
+    2025-06-01.base.jsonl.xz    line 1: JSON header; then  key<TAB>item
+    2025-06-02.delta.jsonl.xz   line 1: JSON header; then  +<TAB>key<TAB>item
+                                                           ~<TAB>key<TAB>item
+                                                           -<TAB>key
+
+Everything is sorted by key, so both writing and reading are streaming
+merges: a day is rebuilt from its base and the deltas up to it without
+holding the catalog in memory. `read` streams it as a JSON array dump, one
+item per line – the format fetch_azure_prices.py writes, so the output can be
+reloaded with json_to_postgres.py for a point-in-time rebuild.
+
+Usage:
+    python catalog_archive.py write [--base] [--codec xz|gz]
+    python catalog_archive.py read --date 2025-06-04 [--service "Virtual Machines"] [--out dump.json]
+    python catalog_archive.py list
+"""
+
+import os
+import sys
+import gzip
+import json
+import lzma
+import argparse
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+from contextlib import ExitStack
+from datetime import date, datetime, timezone
+from dotenv import load_dotenv
+from price_schema import CANONICAL_KEY
+from slim_raw_data import item_sql
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+ARCHIVE_DIR = os.environ.get('CATALOG_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_archive')
+BASE_INTERVAL_DAYS = int(os.environ.get('CATALOG_BASE_INTERVAL_DAYS', '7'))
+FETCH_ROWS = 20000
+CODECS = {'xz': lzma.open, 'gz': gzip.open}
+
+# Canonical key as one text value; COLLATE "C" sorts it in the same
+# (code point) order as Python compares strings
+KEY_SQL = "concat_ws('|', " + ", ".join(f"COALESCE(p.{column}::text, '')" for column in CANONICAL_KEY) + ")"
+CATALOG_SQL = f"""
+    SELECT {KEY_SQL} COLLATE "C" AS key, ({item_sql()})::text AS item
+    FROM azure_prices p
+    WHERE p.is_active = TRUE
+    ORDER BY key
+"""
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+# ── Files ──────────────────────────────────────────────────────────────────────
+class Snapshot:
+    """One archive file: its day, kind ('base' / 'delta') and codec."""
+
+    def __init__(self, path):
+        self.path = path
+        day, self.kind, _, self.codec = os.path.basename(path).split('.')
+        self.day = date.fromisoformat(day)
+        self._header = None
+
+    @classmethod
+    def path_for(cls, day, kind, codec):
+        return os.path.join(ARCHIVE_DIR, f"{day.isoformat()}.{kind}.jsonl.{codec}")
+
+    def open(self):
+        return CODECS[self.codec](self.path, 'rt', encoding='utf-8')
+
+    @property
+    def header(self):
+        if self._header is None:
+            with self.open() as f:
+                self._header = json.loads(f.readline())
+        return self._header
+
+    def records(self, f):
+        """(key, item) of a base, or (op, key, item) of a delta, from the open file `f`."""
+        f.readline()
+        for line in f:
+            if self.kind == 'base':
+                yield tuple(line.rstrip('\n').split('\t', 1))
+            else:
+                fields = line.rstrip('\n').split('\t', 2)
+                yield fields[0], fields[1], fields[2] if len(fields) == 3 else None
+
+
+def snapshots():
+    """Every archive file, oldest first."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    found = [
+        Snapshot(os.path.join(ARCHIVE_DIR, name)) for name in os.listdir(ARCHIVE_DIR)
+        if name.count('.') == 3 and name.split('.')[-1] in CODECS and '.jsonl.' in name
+    ]
+    return sorted(found, key=lambda s: s.day)
+
+
+def chain(day):
+    """The base at or before `day` and the deltas after it up to `day`, in order."""
+    files = [s for s in snapshots() if s.day <= day]
+    bases = [i for i, s in enumerate(files) if s.kind == 'base']
+    if not bases:
+        raise ArchiveError(f"no base snapshot on or before {day}")
+    links = files[bases[-1]:]
+    for parent, snapshot in zip(links, links[1:]):
+        if snapshot.header.get('parent') != parent.day.isoformat():
+            raise ArchiveError(f"{os.path.basename(snapshot.path)} was written against "
+                               f"{snapshot.header.get('parent')}, not {parent.day}")
+    return links
+
+
+# ── Merging ────────────────────────────────────────────────────────────────────
+def apply_delta(rows, ops):
+    """Sorted (key, item) rows with one sorted delta applied."""
+    ops = iter(ops)
+    op = next(ops, None)
+    for key, item in rows:
+        while op is not None and op[1] < key:
+            if op[0] != '-':
+                yield op[1], op[2]
+            op = next(ops, None)
+        if op is not None and op[1] == key:
+            if op[0] != '-':
+                yield key, op[2]
+            op = next(ops, None)
+            continue
+        yield key, item
+    while op is not None:
+        if op[0] != '-':
+            yield op[1], op[2]
+        op = next(ops, None)
+
+
+def diff(old, new):
+    """Delta ops turning the sorted (key, item) rows `old` into `new`."""
+    old, new = iter(old), iter(new)
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield '-', a[0], None
+            a = next(old, None)
+        elif a is None or b[0] < a[0]:
+            yield '+', b[0], b[1]
+            b = next(new, None)
+        else:
+            if a[1] != b[1]:
+                yield '~', b[0], b[1]
+            a, b = next(old, None), next(new, None)
+
+
+def read_catalog(day):
+    """Stream the archived catalog of `day` as sorted (key, item JSON text) pairs."""
+    links = chain(day)
+    with ExitStack() as stack:
+        base = links[0]
+        rows = base.records(stack.enter_context(base.open()))
+        for delta in links[1:]:
+            rows = apply_delta(rows, delta.records(stack.enter_context(delta.open())))
+        yield from rows
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+def current_epoch(cur):
+    cur.execute("SELECT to_regclass('catalog_epoch') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(epoch), 0) FROM catalog_epoch")
+    return cur.fetchone()[0]
+
+
+def catalog_rows(conn):
+    cur = conn.cursor(name='catalog_archive')
+    cur.itersize = FETCH_ROWS
+    cur.execute(CATALOG_SQL)
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+
+def write_snapshot(conn, codec='xz', force_base=False):
+    """Archive today's catalog (UTC). Returns the written path, or None when unchanged."""
+    day = datetime.now(timezone.utc).date()
+    earlier = [s for s in snapshots() if s.day <= day]
+    previous = [s for s in earlier if s.day < day]
+    parent = previous[-1] if previous else None
+
+    # Epoch and rows from one database snapshot
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    cur = conn.cursor()
+    epoch = current_epoch(cur)
+    cur.close()
+    if earlier and not force_base and earlier[-1].header.get('epoch') == epoch:
+        print(f"⏭️  Catalog unchanged since {earlier[-1].day} (epoch {epoch}), nothing to write.")
+        conn.rollback()
+        return None
+
+    kind = 'base'
+    if not force_base and parent is not None:
+        bases = [s for s in previous if s.kind == 'base']
+        if bases and (day - bases[-1].day).days < BASE_INTERVAL_DAYS:
+            try:
+                chain(parent.day)
+                kind = 'delta'
+            except ArchiveError as e:
+                print(f"⚠️ {e}; writing a new base.")
+
+    path = Snapshot.path_for(day, kind, codec)
+    header = {
+        'kind': kind,
+        'date': day.isoformat(),
+        'parent': parent.day.isoformat() if kind == 'delta' else None,
+        'epoch': epoch,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    counts = {'rows': 0, '+': 0, '~': 0, '-': 0}
+
+    def counted(rows):
+        for row in rows:
+            counts['rows'] += 1
+            yield row
+
+    print(f"📦 Writing {kind} snapshot for {day} (epoch {epoch})...")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    try:
+        with CODECS[codec](tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+            if kind == 'base':
+                for key, item in counted(catalog_rows(conn)):
+                    f.write(f"{key}\t{item}\n")
+            else:
+                for op, key, item in diff(read_catalog(parent.day), counted(catalog_rows(conn))):
+                    counts[op] += 1
+                    f.write(f"{op}\t{key}\t{item}\n" if item is not None else f"{op}\t{key}\n")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.rollback()
+
+    # Only complete files are ever visible to readers; a rerun replaces the day's file
+    os.replace(tmp_path, path)
+    for other in (s for s in earlier if s.day == day and s.path != path):
+        os.remove(other.path)
+
+    size = os.path.getsize(path)
+    if kind == 'base':
+        print(f"✅ {os.path.basename(path)}: {counts['rows']} rows, {size / 1e6:.1f} MB")
+    else:
+        print(f"✅ {os.path.basename(path)}: {counts['+']} added, {counts['~']} changed, "
+              f"{counts['-']} removed ({counts['rows']} rows), {size / 1e6:.2f} MB")
+    return path
+
+
+# ── Commands ───────────────────────────────────────────────────────────────────
+def list_archive():
+    files = snapshots()
+    if not files:
+        print(f"Catalog archive is empty ({ARCHIVE_DIR}).")
+        return
+    total = 0
+    for snapshot in files:
+        size = os.path.getsize(snapshot.path)
+        total += size
+        header = snapshot.header
+        parent = f"  parent={header['parent']}" if header.get('parent') else ''
+        print(f"{snapshot.day}  {snapshot.kind:<5}  epoch={header.get('epoch')}  {size / 1e6:>8.2f} MB{parent}")
+    print(f"\n{len(files)} snapshots, {total / 1e6:.1f} MB")
+
+
+def export_catalog(day, out, service=None):
+    """Write the catalog of `day` as a JSON array dump, one item per line."""
+    service_field = f"|{service}|" if service else None
+    count = 0
+    out.write('[\n')
+    for key, item in read_catalog(day):
+        # Key: meter_id|effective_start_date|currency_code|service_name|arm_region_name
+        if service_field and service_field not in key:
+            continue
+        if count:
+            out.write(',\n')
+        out.write(item)
+        count += 1
+    out.write('\n]\n')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive the pricing catalog as weekly bases and daily deltas.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    write_cmd = sub.add_parser('write', help="archive today's catalog")
+    write_cmd.add_argument('--base', action='store_true', help="write a full base even if a delta would do")
+    write_cmd.add_argument('--codec', choices=sorted(CODECS), default=os.environ.get('CATALOG_ARCHIVE_CODEC', 'xz'))
+    read_cmd = sub.add_parser('read', help="rebuild one day's catalog as a JSON dump")
+    read_cmd.add_argument('--date', type=date.fromisoformat, default=datetime.now(timezone.utc).date(),
+                          help="YYYY-MM-DD (default: today, UTC)")
+    read_cmd.add_argument('--service', help="only items of this serviceName")
+    read_cmd.add_argument('--out', help="output file (default: stdout)")
+    sub.add_parser('list', help="show archived snapshots")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_archive()
+        return
+
+    try:
+        if args.command == 'write':
+            conn = get_db_connection()
+            try:
+                write_snapshot(conn, args.codec, args.base)
+            finally:
+                conn.close()
+        elif args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                count = export_catalog(args.date, f, args.service)
+            print(f"✅ {count} items from {args.date} written to {args.out}")
+        else:
+            export_catalog(args.date, sys.stdout, args.service)
+    except ArchiveError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
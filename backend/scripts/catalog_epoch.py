@@ -0,0 +1,74 @@
+"""
+catalog_epoch.py
+────────────────
+Publishes a monotonically increasing catalog epoch after every successful
+ingest job, so the API layer knows exactly when pricing data changed.
+
+    catalog_epoch          – one row per publish: epoch, job, run id and the
+                             per-service change counts of that run
+    catalog_service_epoch  – latest epoch in which each service changed
+
+The Node API keys its response caches by the service epoch (see
+getCatalogEpochKey in src/db.js): services that did not change in a sync keep
+their cached responses, changed ones miss on the next request.
+"""
+
+from psycopg2.extras import Json
+
+CREATE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS catalog_epoch (
+    epoch            BIGSERIAL PRIMARY KEY,
+    job              TEXT NOT NULL,
+    run_id           INTEGER,
+    service_changes  JSONB NOT NULL DEFAULT '{}',
+    published_at     TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS catalog_service_epoch (
+    service_name  TEXT PRIMARY KEY,
+    epoch         BIGINT NOT NULL,
+    change_count  INTEGER NOT NULL,
+    updated_at    TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+# Pseudo-services for data that is not keyed by serviceName in azure_prices
+CURRENCY_RATES = 'currency_rates'
+VM_TYPES = 'vm_types'
+VM_PRICE_MATRIX = 'vm_price_matrix'
+
+
+def publish_epoch(conn, job, service_changes, run_id=None):
+    """
+    Bump the catalog epoch. Call only after the job's data has been committed.
+    service_changes: {service_name: rows_changed}; zero counts are ignored.
+    Returns the new epoch.
+    """
+    changes = {name: int(count) for name, count in service_changes.items() if name and count}
+
+    conn.rollback()
+    cur = conn.cursor()
+    try:
+        cur.execute(CREATE_TABLES_SQL)
+        # Serialise publishers so epochs become visible in the order they were allocated
+        cur.execute("LOCK TABLE catalog_epoch IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(
+            "INSERT INTO catalog_epoch (job, run_id, service_changes) VALUES (%s, %s, %s) RETURNING epoch",
+            (job, run_id, Json(changes))
+        )
+        epoch = cur.fetchone()[0]
+        for name, count in changes.items():
+            cur.execute("""
+                INSERT INTO catalog_service_epoch (service_name, epoch, change_count, updated_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (service_name) DO UPDATE SET
+                    epoch = EXCLUDED.epoch,
+                    change_count = EXCLUDED.change_count,
+                    updated_at = NOW()
+            """, (name, epoch, count))
+        conn.commit()
+        return epoch
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
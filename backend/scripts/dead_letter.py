@@ -0,0 +1,196 @@
+"""
+dead_letter.py
+──────────────
+Dead-letter spool for batches that still fail after a loader's retries.
+
+Instead of dropping the rows, a loader hands the failed batch to spool_records()
+(PriceRecords) or spool_copy() (COPY text from staged_ingest). Each batch
+becomes one gzip file in DEAD_LETTER_DIR:
+
+    line 1      JSON header – job, run id, error, row count, spooled_at
+    lines 2..   the rows as COPY text lines in price_rows.VALUE_COLUMNS order
+
+`replay` pushes every spooled batch back through staged_ingest.StagingWriter
+– COPY into a staging table, one set-based change-only upsert per file, with
+price_history deltas under a new sync_log run – and deletes each file once
+its rows are committed. Batches that fail again stay in the spool.
+
+Usage:
+    python dead_letter.py list
+    python dead_letter.py replay [--job update_prices] [--file PATH]
+"""
+
+import os
+import sys
+import json
+import gzip
+import uuid
+import argparse
+import psycopg2
+from collections import Counter
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from price_rows import copy_line
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+DEAD_LETTER_DIR = os.environ.get('DEAD_LETTER_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dead_letter')
+SUFFIX = '.dlq.gz'
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+# ── Spooling ───────────────────────────────────────────────────────────────────
+def spool_copy(job, run_id, data, rows, error):
+    """Write one failed batch of COPY text (bytes) to the spool. Returns the file path."""
+    os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+    spooled_at = datetime.now(timezone.utc)
+    name = f"{job}-{spooled_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}{SUFFIX}"
+    path = os.path.join(DEAD_LETTER_DIR, name)
+    header = {
+        'job': job,
+        'run_id': run_id,
+        'error': str(error),
+        'rows': rows,
+        'spooled_at': spooled_at.isoformat(),
+    }
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        f.write(data)
+    # Only complete files are ever visible to replay
+    os.replace(tmp_path, path)
+    print(f"\n📥 Spooled {rows} failed rows to {path}")
+    return path
+
+
+def spool_records(job, run_id, records, error):
+    """Write one failed batch of PriceRecords to the spool."""
+    data = "".join(copy_line(record) for record in records).encode('utf-8')
+    return spool_copy(job, run_id, data, len(records), error)
+
+
+def read_spool_file(path):
+    """(header, COPY bytes) of one spooled batch."""
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        return header, f.read()
+
+
+def spool_files(job=None):
+    if not os.path.isdir(DEAD_LETTER_DIR):
+        return []
+    paths = sorted(
+        os.path.join(DEAD_LETTER_DIR, name)
+        for name in os.listdir(DEAD_LETTER_DIR) if name.endswith(SUFFIX)
+    )
+    if job:
+        paths = [p for p in paths if os.path.basename(p).startswith(job + '-')]
+    return paths
+
+
+# ── Commands ───────────────────────────────────────────────────────────────────
+def list_spool(job=None):
+    paths = spool_files(job)
+    if not paths:
+        print(f"Dead-letter spool is empty ({DEAD_LETTER_DIR}).")
+        return
+    total = 0
+    for path in paths:
+        header, _ = read_spool_file(path)
+        total += header['rows']
+        print(f"{os.path.basename(path)}  run={header['run_id']}  rows={header['rows']}  error={header['error'][:80]}")
+    print(f"\n{len(paths)} batches, {total} rows")
+
+
+def replay(paths):
+    # Imported here: staged_ingest spools through this module
+    from staged_ingest import StagingWriter
+    from price_schema import require_schema
+    from price_history import ensure_history_table
+    from sync_log import create_sync_log, complete_sync_log
+    from catalog_epoch import publish_epoch
+    from effective_rates import refresh_effective_rates
+    from telemetry import TELEMETRY
+    import metrics
+
+    if not paths:
+        print("Nothing to replay.")
+        return
+
+    conn = get_db_connection()
+    require_schema(conn)
+    ensure_history_table(conn)
+    run_id = create_sync_log(conn, 'dead_letter_replay')
+    metrics.start('dead_letter_replay')
+    stats = {
+        "fetched": 0,
+        "processed_batches": 0,
+        "total_affected": 0,
+        "total_skipped": 0,
+        "history_rows": 0,
+        "service_changes": Counter()
+    }
+    writer = StagingWriter(conn, run_id, stats, job=None)
+    failed = 0
+    error = None
+    try:
+        for path in paths:
+            header, data = read_spool_file(path)
+            batch_error = writer.apply(data, header['rows'])
+            if batch_error:
+                failed += 1
+                print(f"❌ {os.path.basename(path)}: {batch_error}")
+                continue
+            os.remove(path)
+            print(f"✅ {os.path.basename(path)}: {header['rows']} rows ({header['job']}, run {header['run_id']})")
+
+        if stats["total_affected"]:
+            refresh_effective_rates(conn)
+            publish_epoch(conn, 'dead_letter_replay', stats["service_changes"], run_id)
+        if failed:
+            error = f"{failed} spooled batches failed again"
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        TELEMETRY.count('rows_changed', stats["total_affected"])
+        complete_sync_log(conn, run_id, stats["total_affected"], error, TELEMETRY.summary())
+        metrics.finish(conn, error)
+        conn.close()
+
+    print(f"\nReplayed {len(paths) - failed}/{len(paths)} batches: "
+          f"{stats['total_affected']} rows changed, {stats['history_rows']} price changes recorded.")
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay batches spooled by the loaders.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    list_cmd = sub.add_parser('list', help="show spooled batches")
+    list_cmd.add_argument('--job', help="only batches from this job")
+    replay_cmd = sub.add_parser('replay', help="retry spooled batches in bulk")
+    replay_cmd.add_argument('--job', help="only batches from this job")
+    replay_cmd.add_argument('--file', action='append', help="replay only this spool file (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_spool(args.job)
+    else:
+        replay(args.file or spool_files(args.job))
+
+
+if __name__ == "__main__":
+    main()
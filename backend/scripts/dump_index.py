@@ -0,0 +1,136 @@
+"""
+dump_index.py
+─────────────
+Sidecar byte-offset index for pricing dumps (azure_pricing_dump.json).
+
+fetch_azure_prices.py writes `<dump>.idx` next to the dump: for every
+(serviceName, armRegionName) the byte ranges its items occupy, with
+neighbouring items of the same key merged into one range. A partial reload
+(`json_to_postgres.py --service ... --region ...`) memory-maps the dump and
+decodes only those ranges instead of the whole file.
+
+The index records the dump's size; a dump rewritten after the index was
+built is refused rather than read at stale offsets.
+
+Usage:
+    python dump_index.py [azure_pricing_dump.json]     # (re)build the index of an existing dump
+"""
+
+import os
+import sys
+import json
+import mmap
+import json_codec
+
+INDEX_VERSION = 1
+
+
+def index_path(dump_path):
+    return dump_path + '.idx'
+
+
+class DumpIndexWriter:
+    """Collects item byte ranges while a dump is written; save() writes the sidecar."""
+
+    def __init__(self, dump_path):
+        self.dump_path = dump_path
+        self._ranges = {}
+        self._last_key = None
+
+    def add(self, item, start, end):
+        key = (item.get('serviceName') or '', item.get('armRegionName') or '')
+        ranges = self._ranges.setdefault(key, [])
+        if key == self._last_key and ranges:
+            # Same key as the previous item: extend its range over the separator
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+        self._last_key = key
+
+    def save(self):
+        index = {
+            'version': INDEX_VERSION,
+            'dump_size': os.path.getsize(self.dump_path),
+            'entries': [
+                {'service': service, 'region': region, 'ranges': ranges}
+                for (service, region), ranges in sorted(self._ranges.items())
+            ],
+        }
+        tmp_path = index_path(self.dump_path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_path, index_path(self.dump_path))
+        return len(index['entries'])
+
+
+def build_index(dump_path):
+    """Index an existing dump with one full scan. Returns the number of (service, region) keys."""
+    decoder = json.JSONDecoder()
+    writer = DumpIndexWriter(dump_path)
+    with open(dump_path, 'rb') as f:
+        text = f.read().decode('utf-8')
+    # Offsets are in bytes: keep a byte cursor alongside the character one
+    # (they only differ when the dump has non-ASCII text)
+    is_ascii = text.isascii()
+    pos = text.index('[') + 1
+    byte_pos = pos
+    n = len(text)
+    while pos < n:
+        skip = pos
+        while text[pos] in ' \t\r\n,':
+            pos += 1
+        byte_pos += pos - skip
+        if text[pos] == ']':
+            break
+        item, end = decoder.raw_decode(text, pos)
+        size = end - pos if is_ascii else len(text[pos:end].encode('utf-8'))
+        writer.add(item, byte_pos, byte_pos + size)
+        pos, byte_pos = end, byte_pos + size
+    return writer.save()
+
+
+def load_index(dump_path):
+    """The dump's index, or None if it has none. Exits if the index is stale."""
+    path = index_path(dump_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        index = json_codec.loads(f.read())
+    if index.get('version') != INDEX_VERSION or index.get('dump_size') != os.path.getsize(dump_path):
+        print(f"Error: {path} does not match {dump_path}. Rebuild it: python dump_index.py {dump_path}")
+        sys.exit(1)
+    return index
+
+
+def select_ranges(index, services=None, regions=None):
+    """Byte ranges of the selected services/regions, in file order."""
+    ranges = []
+    for entry in index['entries']:
+        if services and entry['service'] not in services:
+            continue
+        if regions and entry['region'] not in regions:
+            continue
+        ranges.extend(entry['ranges'])
+    ranges.sort()
+    return ranges
+
+
+def read_ranges(dump_path, ranges):
+    """Decode the items in `ranges` of the dump through a read-only memory map."""
+    items = []
+    if not ranges:
+        return items
+    with open(dump_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in ranges:
+            # A merged range is "item,\nitem,\n...item": wrap it as an array
+            items.extend(json_codec.loads(b'[' + mm[start:end] + b']'))
+    return items
+
+
+if __name__ == "__main__":
+    dump = sys.argv[1] if len(sys.argv) > 1 else "azure_pricing_dump.json"
+    if not os.path.exists(dump):
+        print(f"❌ Dump not found: {dump}")
+        sys.exit(1)
+    keys = build_index(dump)
+    print(f"✅ Indexed {dump}: {keys} (service, region) keys → {index_path(dump)}")
@@ -0,0 +1,167 @@
+"""
+effective_rates.py
+──────────────────
+Precomputes normalised effective prices on `azure_prices` so reservation
+comparisons are plain column reads instead of string matching on
+`reservation_term` and ad-hoc joins back to the pay-as-you-go row.
+
+Columns maintained:
+    term_months              – 12 / 36 / 60 for reservations, NULL otherwise
+    effective_hourly_price   – price per hour (reservation total / term hours)
+    effective_monthly_price  – price per month (730 h)
+    savings_pct              – % saved against the matching pay-as-you-go meter
+
+The whole catalog is refreshed in one set-based pass per sync: the handful of
+distinct term strings are parsed here, everything else runs inside Postgres.
+
+Usage:
+    python effective_rates.py
+"""
+
+import os
+import re
+import sys
+import psycopg2
+from psycopg2 import extras
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+HOURS_PER_MONTH = 730
+
+_TERM_RE = re.compile(r'(\d+)\s*(year|month)', re.IGNORECASE)
+
+ADD_COLUMNS_SQL = """
+ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS term_months SMALLINT;
+ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS effective_hourly_price DOUBLE PRECISION;
+ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS effective_monthly_price DOUBLE PRECISION;
+ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS savings_pct DOUBLE PRECISION;
+"""
+
+# Hourly pay-as-you-go meters: the effective rate is the list price itself.
+CONSUMPTION_SQL = f"""
+UPDATE azure_prices SET
+    term_months = NULL,
+    effective_hourly_price = retail_price,
+    effective_monthly_price = retail_price * {HOURS_PER_MONTH},
+    savings_pct = NULL
+WHERE type = 'Consumption'
+  AND raw_data->>'unitOfMeasure' = '1 Hour'
+  AND effective_hourly_price IS DISTINCT FROM retail_price
+"""
+
+# Reservations: normalise the term total and compare with the cheapest matching
+# Linux/base pay-as-you-go meter (same service, product, SKU, region, currency).
+RESERVATION_SQL = f"""
+WITH terms (reservation_term, term_months) AS (VALUES %s),
+payg AS (
+    SELECT service_name, product_name, sku_name, arm_region_name, currency_code,
+           MIN(retail_price) AS hourly
+    FROM azure_prices
+    WHERE type = 'Consumption'
+      AND is_active = TRUE
+      AND retail_price > 0
+      AND raw_data->>'unitOfMeasure' = '1 Hour'
+    GROUP BY service_name, product_name, sku_name, arm_region_name, currency_code
+),
+rates AS (
+    -- A ctid is only unique within one partition: address rows by (tableoid, ctid)
+    SELECT r.tableoid AS row_table, r.ctid AS row_id,
+           t.term_months,
+           r.retail_price / t.term_months AS monthly,
+           r.retail_price / (t.term_months * {HOURS_PER_MONTH}) AS hourly,
+           p.hourly AS payg_hourly
+    FROM azure_prices r
+    JOIN terms t ON t.reservation_term = r.reservation_term
+    LEFT JOIN payg p
+           ON p.service_name = r.service_name
+          AND p.product_name = r.product_name
+          AND p.sku_name = r.sku_name
+          AND p.arm_region_name = r.arm_region_name
+          AND p.currency_code = r.currency_code
+    WHERE r.type = 'Reservation'
+)
+UPDATE azure_prices a SET
+    term_months = rates.term_months,
+    effective_hourly_price = rates.hourly,
+    effective_monthly_price = rates.monthly,
+    savings_pct = CASE WHEN rates.payg_hourly > 0
+                       THEN ROUND(((1 - rates.hourly / rates.payg_hourly) * 100)::numeric, 2)
+                  END
+FROM rates
+WHERE a.tableoid = rates.row_table AND a.ctid = rates.row_id
+  AND (a.term_months IS DISTINCT FROM rates.term_months
+       OR a.effective_hourly_price IS DISTINCT FROM rates.hourly
+       OR a.savings_pct IS DISTINCT FROM CASE WHEN rates.payg_hourly > 0
+            THEN ROUND(((1 - rates.hourly / rates.payg_hourly) * 100)::numeric, 2) END)
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def parse_term_months(term):
+    """'1 Year' → 12, '3 Years' → 36, '6 Months' → 6; None when unparseable."""
+    if not term:
+        return None
+    match = _TERM_RE.search(term)
+    if not match:
+        return None
+    count = int(match.group(1))
+    return count * 12 if match.group(2).lower() == 'year' else count
+
+
+def ensure_effective_columns(conn):
+    cur = conn.cursor()
+    cur.execute(ADD_COLUMNS_SQL)
+    conn.commit()
+    cur.close()
+
+
+def refresh_effective_rates(conn):
+    """Recompute effective prices for the whole catalog. Returns rows changed."""
+    ensure_effective_columns(conn)
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT DISTINCT reservation_term FROM azure_prices
+        WHERE type = 'Reservation' AND reservation_term IS NOT NULL
+    """)
+    terms = [(t, parse_term_months(t)) for (t,) in cur.fetchall()]
+    terms = [(t, m) for t, m in terms if m]
+
+    try:
+        cur.execute(CONSUMPTION_SQL)
+        changed = cur.rowcount
+        if terms:
+            extras.execute_values(cur, RESERVATION_SQL, terms, template="(%s, %s)", page_size=len(terms))
+            changed += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return changed
+
+
+if __name__ == "__main__":
+    start = datetime.now()
+    print(f"[{start}] Refreshing effective reservation rates...")
+    conn = get_db_connection()
+    try:
+        changed = refresh_effective_rates(conn)
+    finally:
+        conn.close()
+    print(f"✅ Effective rates refreshed: {changed} rows updated in {(datetime.now() - start).total_seconds():.1f}s")
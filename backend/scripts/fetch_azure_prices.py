@@ -1,5 +1,6 @@
 import urllib.request
-import json
+import json_codec
+from dump_index import DumpIndexWriter, index_path
 import time
 import sys
 
@@ -19,9 +20,13 @@ def fetch_data():
 
     item_count = 0
     
+    # Byte offsets of every item go to the sidecar index (see dump_index.py)
+    index = DumpIndexWriter(OUTPUT_FILE)
+
     # Open file in write mode and start JSON array
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        f.write('[\n')
+    with open(OUTPUT_FILE, 'wb') as f:
+        f.write(b'[\n')
+        offset = 2
         
         # Hardcoded to USD only for canonical dataset
         currency = 'USD'
@@ -41,27 +46,31 @@ def fetch_data():
                             print(f"\n❌ Error: Status {response.status}")
                             break
                         
-                        data = json.loads(response.read().decode())
+                        pairs, next_link = json_codec.page_items_with_raw(response.read())
                 except Exception as e:
                     print(f"\n❌ Request failed: {e}")
                     # Retry logic could be added here
                     break
 
-                items = data.get('Items', [])
-                if not items:
+                if not pairs:
                     print("\n⚠️ No items found in this page.")
                 
                 # Write items to file
-                for i, item in enumerate(items):
+                # (each item's JSON text exactly as the API sent it, one per line)
+                for item, item_text in pairs:
                     # Add comma if this is not the very first item written
                     if item_count > 0:
-                        f.write(',\n')
+                        f.write(b',\n')
+                        offset += 2
                     
-                    json.dump(item, f, indent=2)
+                    data = item_text.encode('utf-8')
+                    f.write(data)
+                    index.add(item, offset, offset + len(data))
+                    offset += len(data)
                     item_count += 1
 
                 # Pagination
-                url = data.get('NextPageLink')
+                url = next_link
                 page_count += 1
 
                 # Progress update
@@ -74,13 +83,17 @@ def fetch_data():
         except KeyboardInterrupt:
             print("\n\n🛑 Process interrupted by user.")
             # We want to stop everything if user interrupts
-            f.write('\n]')
+            f.write(b'\n]')
+            f.close()
+            index.save()
             return
             
         # Close JSON array
-        f.write('\n]')
-    
+        f.write(b'\n]')
+
+    keys = index.save()
     print(f"\n\n✅ Done! Saved {item_count} items to {OUTPUT_FILE}")
+    print(f"🗂️ Index: {keys} (service, region) keys → {index_path(OUTPUT_FILE)}")
 
 if __name__ == "__main__":
     fetch_data()
@@ -0,0 +1,513 @@
+"""
+index_advisor.py
+────────────────
+Hot-query benchmark and index advisor for the pricing database.
+
+Replays a parameterized corpus of the API's hottest queries – queryPrices()
+and getBestVmPrices() in src/db.js, /api/vm-list in src/index.js and the
+VM / disk / bandwidth / IP / load balancer / monitor lookups in
+src/aiTools.js – and for every query records:
+
+  - latency percentiles (p50 / p95 / p99) over --runs executions per parameter set
+  - EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) of each parameter set: shared
+    buffer hits / reads, the indexes the plan used, sequential scans and the
+    rows they filtered away
+
+It then checks the indexes of the tables the corpus touches:
+
+  - unused    – no corpus plan used the index, and pg_stat_user_indexes has
+                no scans for it (unique / primary key indexes are kept)
+  - duplicate – same table, method, columns, expressions and predicate as
+                another index
+  - redundant – its columns are a leading prefix of another btree index with
+                the same predicate
+
+Indexes on partitions are reported under their parent index. Corpus SQL is
+kept in the JS form ($1, $2 …) so it can be pasted straight from the source.
+
+Every run writes a report to INDEX_REPORT_DIR (default
+scripts/index_reports/<timestamp>/): summary.json plus one EXPLAIN plan per
+query and parameter set under plans/.
+
+Usage:
+    python index_advisor.py [--runs 10] [--only vm_list,prices_search] [--timeout 30]
+    python index_advisor.py --list
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import psycopg2
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+REPORT_DIR = os.environ.get('INDEX_REPORT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_reports')
+TABLES = ('azure_prices', 'currency_rates', 'price_history', 'vm_price_matrix')
+REGIONS = ('eastus', 'westeurope', 'centralindia')
+
+# ── Corpus ─────────────────────────────────────────────────────────────────────
+PRICES_SELECT = """
+    SELECT
+        p.id, p.meter_id, p.sku_id, p.service_name, p.service_id, p.service_family,
+        p.product_name, p.sku_name, p.arm_region_name, p.location, p.currency_code,
+        p.retail_price, p.unit_price, p.effective_start_date, p.type, p.reservation_term,
+        p.is_active,
+        p.raw_data->>'meterName' AS meter_name,
+        p.raw_data->>'unitOfMeasure' AS unit_of_measure,
+        p.raw_data->>'armSkuName' AS arm_sku_name,
+        (p.raw_data->>'cores')::int AS cores,
+        (p.raw_data->>'ram')::numeric AS ram
+    FROM azure_prices p
+"""
+
+VM_NOT_SPOT = """
+      AND product_name NOT ILIKE '%Spot%'
+      AND product_name NOT ILIKE '%Low Priority%'
+      AND product_name NOT ILIKE '%Promo%'
+      AND product_name NOT ILIKE '%Dedicated Host%'
+      AND sku_name NOT ILIKE '%Spot%'
+      AND sku_name NOT ILIKE '%Low Priority%'
+"""
+
+# name → (source, SQL with $n placeholders, parameter sets)
+CORPUS = {
+    'prices_service_region': ('db.js queryPrices', PRICES_SELECT + """
+        WHERE p.currency_code = 'USD' AND p.is_active = TRUE
+          AND p.service_name = $1 AND p.arm_region_name = $2
+        ORDER BY p.retail_price ASC LIMIT $3
+    """, [(service, region, 200) for service in ('Virtual Machines', 'Storage', 'SQL Database') for region in REGIONS]),
+
+    'prices_service': ('db.js queryPrices', PRICES_SELECT + """
+        WHERE p.currency_code = 'USD' AND p.is_active = TRUE AND p.service_name = $1
+        ORDER BY p.retail_price ASC LIMIT $2
+    """, [('Virtual Machines', 200), ('Azure Cosmos DB', 200)]),
+
+    'prices_sku': ('db.js queryPrices', PRICES_SELECT + """
+        WHERE p.currency_code = 'USD' AND p.is_active = TRUE
+          AND p.service_name = $1 AND p.arm_region_name = $2 AND p.sku_name = $3
+        ORDER BY p.retail_price ASC LIMIT $4
+    """, [('Virtual Machines', region, 'D2s v5', 200) for region in REGIONS]),
+
+    'prices_search': ('db.js queryPrices / /api/prices/search', PRICES_SELECT + """
+        WHERE p.currency_code = 'USD' AND p.is_active = TRUE AND p.arm_region_name = $1
+          AND (p.product_name ILIKE $2 OR p.sku_name ILIKE $2 OR p.raw_data->>'meterName' ILIKE $2)
+        ORDER BY p.retail_price ASC LIMIT $3
+    """, [(region, f'%{term}%', 100) for term in ('D4s', 'redis', 'premium ssd') for region in REGIONS[:2]]),
+
+    'best_vm_prices': ('db.js getBestVmPrices', """
+        SELECT DISTINCT ON (sku_name)
+               sku_name, retail_price as min_price, arm_region_name
+        FROM azure_prices
+        WHERE service_name = 'Virtual Machines'
+          AND type = 'Consumption'
+          AND retail_price > 0
+          AND currency_code = 'USD'
+          AND LOWER(product_name) NOT LIKE '%windows%'
+          AND LOWER(product_name) NOT LIKE '%spot%'
+          AND LOWER(product_name) NOT LIKE '%low priority%'
+          AND is_active = TRUE
+        ORDER BY sku_name, retail_price ASC
+    """, [()]),
+
+    'vm_list': ('index.js /api/vm-list', """
+        SELECT
+            CONCAT('Standard_', REPLACE(TRIM(sku_name), ' ', '_')) AS sku_key,
+            MIN(CASE WHEN LOWER(product_name) NOT LIKE '%windows%' THEN retail_price END) AS linux_usd,
+            MIN(CASE WHEN LOWER(product_name) LIKE '%windows%' THEN retail_price END) AS windows_usd
+        FROM azure_prices
+        WHERE arm_region_name = $1
+          AND currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Virtual Machines'
+          AND type = 'Consumption'
+          AND LOWER(sku_name) NOT LIKE '%spot%'
+          AND LOWER(sku_name) NOT LIKE '%low priority%'
+          AND LOWER(sku_name) LIKE $2
+        GROUP BY sku_name
+        ORDER BY sku_name ASC
+    """, [(region, term) for region in REGIONS for term in ('%', '%d4s%')]),
+
+    'ai_vm_payg': ('aiTools.js virtual_machine (PAYG)', """
+        SELECT sku_name, product_name, raw_data->>'meterName' AS meter_name,
+               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure,
+               term_months, effective_monthly_price
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Virtual Machines'
+          AND arm_region_name = $1
+          AND product_name NOT ILIKE '%Windows%'
+          AND type = 'Consumption'
+    """ + VM_NOT_SPOT + """
+          AND raw_data->>'meterName' NOT ILIKE '%Windows%'
+          AND sku_name ILIKE $2
+          AND retail_price > 0 ORDER BY retail_price ASC LIMIT 1
+    """, [(region, f'%{sku}%') for region in REGIONS for sku in ('D2s%v5', 'E8as%v5')]),
+
+    'ai_vm_reserved': ('aiTools.js virtual_machine (reservation)', """
+        SELECT sku_name, product_name, raw_data->>'meterName' AS meter_name,
+               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure,
+               term_months, effective_monthly_price
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Virtual Machines'
+          AND arm_region_name = $1
+          AND product_name NOT ILIKE '%Windows%'
+          AND type = 'Reservation' AND term_months = 12
+    """ + VM_NOT_SPOT + """
+          AND sku_name ILIKE $2
+          AND retail_price > 0 ORDER BY retail_price ASC LIMIT 1
+    """, [(region, '%D4s%v5%') for region in REGIONS]),
+
+    'ai_managed_disk': ('aiTools.js managed_disk', """
+        SELECT sku_name, product_name, raw_data->>'meterName' AS meter_name,
+               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Storage'
+          AND arm_region_name = $1
+          AND product_name ILIKE '%Premium SSD%'
+          AND sku_name ILIKE $2
+          AND retail_price > 0
+          AND (raw_data->>'meterName' IS NULL OR (
+            raw_data->>'meterName' NOT ILIKE '%Transaction%' AND
+            raw_data->>'meterName' NOT ILIKE '%Operation%'
+          ))
+          AND sku_name NOT ILIKE '%Mount%'
+          AND sku_name NOT ILIKE '%Burst%'
+          AND sku_name NOT ILIKE '%Snapshot%'
+          AND (raw_data->>'meterName') NOT ILIKE '%Mount%'
+          AND (raw_data->>'meterName') NOT ILIKE '%Burst%'
+          AND (raw_data->>'meterName') NOT ILIKE '%Snapshot%'
+        ORDER BY retail_price ASC LIMIT 1
+    """, [(region, '%P10 LRS%') for region in REGIONS]),
+
+    'ai_disk_transactions': ('aiTools.js managed_disk (transactions)', """
+        SELECT retail_price, raw_data->>'meterName' AS meter_name
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Storage'
+          AND arm_region_name = $1
+          AND (raw_data->>'meterName' ILIKE '%Disk Operations%' OR raw_data->>'meterName' ILIKE '%Transaction%')
+          AND retail_price > 0
+        ORDER BY retail_price ASC LIMIT 1
+    """, [(region,) for region in REGIONS]),
+
+    'ai_bandwidth': ('aiTools.js bandwidth', """
+        SELECT sku_name, product_name, raw_data->>'meterName' AS meter_name,
+               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name = 'Bandwidth'
+          AND raw_data->>'meterName' ILIKE $1
+          AND (raw_data->>'meterName') NOT ILIKE '%Inbound%'
+          AND (raw_data->>'meterName') NOT ILIKE '%Peering%'
+          AND (raw_data->>'meterName') NOT ILIKE '%Ingress%'
+          AND retail_price > 0 ORDER BY retail_price ASC LIMIT 1
+    """, [(f'%Zone {zone}%',) for zone in (1, 2, 3)]),
+
+    'ai_ip_address': ('aiTools.js ip_address', """
+        SELECT retail_price, raw_data->>'meterName' AS meter_name, sku_name
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name ILIKE '%IP Addresses%'
+          AND raw_data->>'meterName' ILIKE $1
+          AND arm_region_name = $2
+          AND retail_price > 0
+        ORDER BY retail_price ASC LIMIT 1
+    """, [('%static%', region) for region in REGIONS]),
+
+    'ai_load_balancer': ('aiTools.js load_balancer', """
+        SELECT retail_price, raw_data->>'meterName' AS meter_name, sku_name
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name ILIKE '%Load Balancer%'
+          AND arm_region_name = $1
+          AND retail_price > 0
+          AND type = 'Consumption'
+        ORDER BY retail_price ASC LIMIT 1
+    """, [(region,) for region in REGIONS]),
+
+    'ai_monitor': ('aiTools.js monitor', """
+        SELECT retail_price, raw_data->>'meterName' AS meter_name, sku_name
+        FROM azure_prices
+        WHERE currency_code = 'USD'
+          AND is_active = TRUE
+          AND service_name ILIKE '%Monitor%'
+          AND raw_data->>'meterName' ILIKE '%Data Ingestion%'
+          AND retail_price > 0
+        ORDER BY retail_price ASC LIMIT 1
+    """, [()]),
+}
+
+INDEX_SQL = """
+SELECT ic.relname AS index_name,
+       t.relname AS table_name,
+       i.indkey::text AS key_columns,
+       pg_get_expr(i.indexprs, i.indrelid) AS expressions,
+       pg_get_expr(i.indpred, i.indrelid) AS predicate,
+       i.indisunique OR i.indisprimary AS is_unique,
+       am.amname AS method,
+       pg_get_indexdef(i.indexrelid) AS definition,
+       COALESCE(SUM(pg_relation_size(pt.relid)), 0) AS size_bytes,
+       COALESCE(SUM(s.idx_scan), 0) AS idx_scan
+FROM pg_index i
+JOIN pg_class ic ON ic.oid = i.indexrelid
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_am am ON am.oid = ic.relam
+CROSS JOIN LATERAL (
+    SELECT relid FROM pg_partition_tree(i.indexrelid) UNION SELECT i.indexrelid
+) pt
+LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = pt.relid
+WHERE t.relname = ANY(%s) AND NOT ic.relispartition
+GROUP BY ic.relname, t.relname, i.indkey, i.indexprs, i.indpred, i.indrelid, i.indisunique,
+         i.indisprimary, am.amname, i.indexrelid
+ORDER BY t.relname, ic.relname
+"""
+
+# Partition index → the partitioned index it belongs to
+PARTITION_INDEX_SQL = """
+SELECT c.relname, r.relname
+FROM pg_class c
+JOIN pg_class r ON r.oid = pg_partition_root(c.oid)
+WHERE c.relkind = 'i' AND c.relispartition
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def to_psycopg(sql, params):
+    """JS-style SQL ($1 …) → psycopg2 SQL with named placeholders, and its parameter dict."""
+    sql = re.sub(r'\$(\d+)', r'%(p\1)s', sql.replace('%', '%%'))
+    return sql, {f'p{i}': value for i, value in enumerate(params, 1)}
+
+
+# ── Plans ──────────────────────────────────────────────────────────────────────
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def summarize_plan(plan, root_index):
+    """Indexes used, sequential scans and buffer counts of one EXPLAIN (FORMAT JSON) result."""
+    top = plan['Plan']
+    indexes = set()
+    seq_scans = []
+    for node in plan_nodes(top):
+        if 'Index Name' in node:
+            indexes.add(root_index.get(node['Index Name'], node['Index Name']))
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.append({
+                'relation': node.get('Relation Name'),
+                'rows': node.get('Actual Rows', 0) * node.get('Actual Loops', 1),
+                'rows_removed': node.get('Rows Removed by Filter', 0) * node.get('Actual Loops', 1),
+            })
+    hit, read = top.get('Shared Hit Blocks', 0), top.get('Shared Read Blocks', 0)
+    return {
+        'execution_ms': plan.get('Execution Time'),
+        'planning_ms': plan.get('Planning Time'),
+        'shared_hit': hit,
+        'shared_read': read,
+        'hit_ratio': round(hit / (hit + read), 4) if hit + read else None,
+        'indexes': sorted(indexes),
+        'seq_scans': seq_scans,
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+# ── Benchmark ──────────────────────────────────────────────────────────────────
+def bench_query(cur, name, runs, root_index, plan_dir):
+    source, sql, param_sets = CORPUS[name]
+    latencies = []
+    plans = []
+    for n, params in enumerate(param_sets):
+        query, args = to_psycopg(sql, params)
+        cur.execute(query, args)  # warm-up
+        cur.fetchall()
+        for _ in range(runs):
+            start = time.perf_counter()
+            cur.execute(query, args)
+            cur.fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, args)
+        plan = cur.fetchone()[0][0]
+        with open(os.path.join(plan_dir, f"{name}-{n}.json"), 'w') as f:
+            json.dump({'params': list(params), 'plan': plan}, f, indent=2, default=str)
+        plans.append(summarize_plan(plan, root_index))
+
+    latencies.sort()
+    seq_scans = [scan for plan in plans for scan in plan['seq_scans']]
+    return {
+        'source': source,
+        'param_sets': len(param_sets),
+        'runs': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'shared_hit': sum(plan['shared_hit'] for plan in plans),
+        'shared_read': sum(plan['shared_read'] for plan in plans),
+        'indexes': sorted({index for plan in plans for index in plan['indexes']}),
+        'seq_scans': seq_scans,
+    }
+
+
+# ── Index checks ───────────────────────────────────────────────────────────────
+def load_indexes(cur):
+    cur.execute(INDEX_SQL, (list(TABLES),))
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def find_duplicates(indexes):
+    """[(index, duplicate_of, kind)] – exact duplicates and btree leading-prefix redundancy.
+
+    Each index is reported once, against the first index that covers it.
+    """
+    findings = []
+    for a in indexes:
+        cols_a = tuple(a['key_columns'].split())
+        for b in indexes:
+            if a is b or a['table_name'] != b['table_name'] or a['method'] != b['method']:
+                continue
+            if a['predicate'] != b['predicate'] or a['expressions'] != b['expressions']:
+                continue
+            cols_b = tuple(b['key_columns'].split())
+            if cols_a == cols_b:
+                # Report each exact pair once, keeping a unique index over a plain one
+                keep_b = b['is_unique'] and not a['is_unique']
+                if keep_b or (a['is_unique'] == b['is_unique'] and a['index_name'] > b['index_name']):
+                    findings.append((a['index_name'], b['index_name'], 'duplicate'))
+                    break
+            elif (a['method'] == 'btree' and not a['is_unique'] and not a['expressions']
+                  and len(cols_a) < len(cols_b) and cols_b[:len(cols_a)] == cols_a):
+                findings.append((a['index_name'], b['index_name'], 'redundant'))
+                break
+    return findings
+
+
+def advise(conn, names, runs, timeout):
+    started_at = datetime.now()
+    path = os.path.join(REPORT_DIR, f"{started_at:%Y%m%dT%H%M%S}")
+    plan_dir = os.path.join(path, 'plans')
+    os.makedirs(plan_dir, exist_ok=True)
+
+    conn.set_session(readonly=True, autocommit=True)
+    cur = conn.cursor()
+    cur.execute("SET statement_timeout = %s", (f"{timeout}s",))
+    cur.execute(PARTITION_INDEX_SQL)
+    root_index = dict(cur.fetchall())
+
+    results = {}
+    print(f"{'query':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'hit %':>7}  indexes / seq scans")
+    for name in names:
+        try:
+            result = bench_query(cur, name, runs, root_index, plan_dir)
+        except psycopg2.Error as e:
+            print(f"{name:<24} failed: {str(e).strip()}")
+            results[name] = {'error': str(e).strip()}
+            continue
+        results[name] = result
+        blocks = result['shared_hit'] + result['shared_read']
+        hit = f"{100 * result['shared_hit'] / blocks:.1f}" if blocks else '-'
+        used = ', '.join(result['indexes']) or '-'
+        seq = {scan['relation'] for scan in result['seq_scans']}
+        flag = f"  ⚠ Seq Scan on {', '.join(sorted(seq))}" if seq else ''
+        print(f"{name:<24} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {hit:>7}  {used}{flag}")
+
+    indexes = load_indexes(cur)
+    cur.close()
+    used_by_corpus = {index for result in results.values() for index in result.get('indexes', ())}
+    unused = [
+        index for index in indexes
+        if index['index_name'] not in used_by_corpus and not index['idx_scan'] and not index['is_unique']
+    ]
+    duplicates = find_duplicates(indexes)
+
+    print(f"\nIndexes ({len(indexes)} on {', '.join(TABLES)}):")
+    for index in indexes:
+        used = 'corpus' if index['index_name'] in used_by_corpus else f"{index['idx_scan']} scans"
+        print(f"  {index['index_name']:<40} {index['size_bytes'] / 2**20:>9.1f} MB  {used}")
+    if unused:
+        print("\n⚠ Unused (no corpus plan, no scans since stats reset):")
+        for index in unused:
+            print(f"  {index['index_name']:<40} {index['size_bytes'] / 2**20:>9.1f} MB  {index['definition']}")
+    if duplicates:
+        print("\n⚠ Duplicate / redundant:")
+        for name, other, kind in duplicates:
+            print(f"  {name:<40} {kind} of {other}")
+
+    summary = {
+        'started_at': started_at.isoformat(),
+        'runs': runs,
+        'queries': results,
+        'indexes': indexes,
+        'unused_indexes': [index['index_name'] for index in unused],
+        'duplicate_indexes': [{'index': n, 'of': o, 'kind': k} for n, o, k in duplicates],
+    }
+    with open(os.path.join(path, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    print(f"\n📄 Report: {path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot pricing queries and audit their indexes.")
+    parser.add_argument('--runs', type=int, default=10, help="timed executions per parameter set")
+    parser.add_argument('--only', help="comma-separated query names (see --list)")
+    parser.add_argument('--timeout', type=int, default=30, help="statement timeout in seconds")
+    parser.add_argument('--list', action='store_true', help="list the corpus and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (source, _, param_sets) in CORPUS.items():
+            print(f"  {name:<24} {len(param_sets):>2} parameter sets  ({source})")
+        return
+
+    names = args.only.split(',') if args.only else list(CORPUS)
+    unknown = [name for name in names if name not in CORPUS]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+
+    conn = get_db_connection()
+    try:
+        advise(conn, names, args.runs, args.timeout)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+ingest_rules.py
+───────────────
+The filter / transform stage every loader runs on decoded API items before
+they become PriceRecords.
+
+Rules are data: each names an action and the fields it matches on.
+
+    action      drop     – discard the item (later rules do not run)
+                tag      – append `tag` to the item's ingestTags list
+                           (kept in raw_data)
+                rewrite  – `set` fields to fixed values and/or `replace`
+                           regex matches in fields
+    match       field → pattern; every one must match
+    match_any   field → pattern; at least one must match (if given)
+
+A pattern "=value" compares for equality, anything else is a regex searched in
+the field (use (?i) for case-insensitive). Rules are compiled once, at import,
+into closures over precompiled regexes, so applying them costs a dict lookup
+and a C-level regex search per condition.
+
+RULES holds DEFAULT_RULES, or the JSON list in the file named by the
+INGEST_RULES_FILE env var. It counts per-rule evaluations and hits and
+samples the time spent in each rule; report() prints them.
+
+Usage:
+    python ingest_rules.py              # list the compiled rule set
+"""
+
+import os
+import re
+import json
+import time
+
+# Time one item in every SAMPLE_EVERY; cost is extrapolated from the samples
+SAMPLE_EVERY = 64
+
+_DISK_VARIANTS = '(?i)burst|snapshot|mount'
+
+DEFAULT_RULES = [
+    {
+        # Managed Disk variants the calculator never prices
+        'name': 'managed_disk_variants',
+        'action': 'drop',
+        'match': {'serviceName': '=Storage', 'productName': 'Managed Disks'},
+        'match_any': {'skuName': _DISK_VARIANTS, 'meterName': _DISK_VARIANTS},
+    },
+]
+
+ACTIONS = ('drop', 'tag', 'rewrite')
+
+
+def _compile_test(pattern):
+    if pattern.startswith('='):
+        expected = pattern[1:]
+        return lambda value: value == expected
+    search = re.compile(pattern).search
+    return lambda value: type(value) is str and search(value) is not None
+
+
+def _compile_match(match, match_any):
+    all_tests = [(field, _compile_test(p)) for field, p in match.items()]
+    any_tests = [(field, _compile_test(p)) for field, p in match_any.items()]
+
+    def matches(item):
+        get = item.get
+        for field, test in all_tests:
+            if not test(get(field)):
+                return False
+        if not any_tests:
+            return True
+        for field, test in any_tests:
+            if test(get(field)):
+                return True
+        return False
+    return matches
+
+
+def _compile_rewrite(rule):
+    sets = list(rule.get('set', {}).items())
+    replaces = [(field, re.compile(pattern).sub, repl)
+                for field, (pattern, repl) in rule.get('replace', {}).items()]
+
+    def rewrite(item):
+        for field, value in sets:
+            item[field] = value
+        for field, sub, repl in replaces:
+            value = item.get(field)
+            if type(value) is str:
+                item[field] = sub(repl, value)
+    return rewrite
+
+
+class Rule:
+    __slots__ = ('name', 'action', 'matches', 'apply', 'evaluated', 'hits', 'sampled', 'sampled_ns')
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.action = spec.get('action', 'drop')
+        if self.action not in ACTIONS:
+            raise ValueError(f"Rule {self.name}: unknown action {self.action!r}")
+        self.matches = _compile_match(spec.get('match', {}), spec.get('match_any', {}))
+        if self.action == 'tag':
+            tag = spec['tag']
+            self.apply = lambda item: item.setdefault('ingestTags', []).append(tag)
+        elif self.action == 'rewrite':
+            self.apply = _compile_rewrite(spec)
+        else:
+            self.apply = None
+        self.evaluated = self.hits = self.sampled = self.sampled_ns = 0
+
+
+class RuleSet:
+    """An ordered, compiled list of rules with per-rule hit and cost counters."""
+
+    def __init__(self, specs):
+        self.rules = [Rule(spec) for spec in specs]
+        self._tick = 0
+
+    def apply(self, item):
+        """
+        Run every rule on one item. Returns None if it was dropped, otherwise
+        whether a tag/rewrite rule changed it.
+        """
+        self._tick += 1
+        timed = self._tick % SAMPLE_EVERY == 0
+        changed = False
+        for rule in self.rules:
+            rule.evaluated += 1
+            if timed:
+                start = time.perf_counter_ns()
+            hit = rule.matches(item)
+            if hit:
+                rule.hits += 1
+                if rule.apply is not None:
+                    rule.apply(item)
+                    changed = True
+            if timed:
+                rule.sampled += 1
+                rule.sampled_ns += time.perf_counter_ns() - start
+            if hit and rule.apply is None:
+                return None
+        return changed
+
+    def filter(self, items):
+        """Items that survive the rules (tag/rewrite applied in place)."""
+        return [item for item in items if self.apply(item) is not None]
+
+    def filter_pairs(self, pairs):
+        """
+        Like filter() for (item, raw_text) pairs from json_codec.page_items_with_raw;
+        the raw text is dropped for items a rule changed, so they get re-encoded.
+        """
+        kept = []
+        for item, raw in pairs:
+            changed = self.apply(item)
+            if changed is not None:
+                kept.append((item, None if changed else raw))
+        return kept
+
+    # ── Counters ────────────────────────────────────────────────────────────────
+    def take_stats(self):
+        """Counters since the last call, as plain tuples (e.g. to ship from a worker process)."""
+        stats = [(r.name, r.evaluated, r.hits, r.sampled, r.sampled_ns) for r in self.rules]
+        for rule in self.rules:
+            rule.evaluated = rule.hits = rule.sampled = rule.sampled_ns = 0
+        return stats
+
+    def merge_stats(self, stats):
+        by_name = {rule.name: rule for rule in self.rules}
+        for name, evaluated, hits, sampled, sampled_ns in stats:
+            rule = by_name.get(name)
+            if rule is not None:
+                rule.evaluated += evaluated
+                rule.hits += hits
+                rule.sampled += sampled
+                rule.sampled_ns += sampled_ns
+
+    def summary(self):
+        """Per-rule counters as a JSON-ready dict (stored with the run's telemetry)."""
+        return {
+            rule.name: {
+                'action': rule.action,
+                'evaluated': rule.evaluated,
+                'hits': rule.hits,
+                'cost_ms': round(self._cost_ms(rule), 1),
+            }
+            for rule in self.rules
+        }
+
+    @staticmethod
+    def _cost_ms(rule):
+        return (rule.sampled_ns / rule.sampled * rule.evaluated / 1e6) if rule.sampled else 0.0
+
+    def report(self):
+        """Print per-rule evaluations, hits and estimated time spent."""
+        if not any(rule.evaluated for rule in self.rules):
+            return
+        print("\nIngest rules:")
+        for rule in self.rules:
+            print(f"  {rule.name:<28} {rule.action:<8} evaluated {rule.evaluated:>9}  "
+                  f"hits {rule.hits:>8}  ~{self._cost_ms(rule):.1f} ms")
+
+
+def load_rules():
+    path = os.environ.get('INGEST_RULES_FILE')
+    if not path:
+        return RuleSet(DEFAULT_RULES)
+    with open(path, 'r', encoding='utf-8') as f:
+        return RuleSet(json.load(f))
+
+
+RULES = load_rules()
+
+
+if __name__ == "__main__":
+    print(f"Ingest rules ({os.environ.get('INGEST_RULES_FILE') or 'DEFAULT_RULES'}):")
+    for rule in RULES.rules:
+        print(f"  {rule.name:<28} {rule.action}")
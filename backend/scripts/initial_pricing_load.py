@@ -5,10 +5,25 @@ import time
 import requests
 import psycopg2
 from psycopg2 import extras
+from collections import Counter
+from contextlib import nullcontext
 from datetime import datetime
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from effective_rates import refresh_effective_rates
+from catalog_epoch import publish_epoch
+from price_rows import COLUMN_SQL, RAW_DATA_MODE, build_row, values_template
+from price_record import PriceRecord
+from ingest_rules import RULES
+from dead_letter import spool_records
+from sync_log import create_sync_log, complete_sync_log
+from telemetry import TELEMETRY
+import metrics
+from profiling import profile_run
+from price_schema import CONFLICT_TARGET, partition_order, require_schema
+from bulk_load import bulk_load_mode
+import json_codec
 
 # Load .env from one level up
 load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
@@ -40,62 +55,6 @@ def get_db_connection():
         sys.exit(1)
     return psycopg2.connect(db_url)
 
-# ── Schema ────────────────────────────────────────────────────────────────────
-
-def init_schema(conn):
-    print("Initializing Database Schema...")
-    cur = conn.cursor()
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS azure_prices (
-            id BIGSERIAL PRIMARY KEY,
-            meter_id TEXT,
-            sku_id TEXT,
-            service_name TEXT,
-            service_id TEXT,
-            service_family TEXT,
-            product_name TEXT,
-            sku_name TEXT,
-            arm_region_name TEXT,
-            location TEXT,
-            currency_code TEXT,
-            retail_price DOUBLE PRECISION,
-            unit_price DOUBLE PRECISION,
-            effective_start_date TIMESTAMP,
-            type TEXT,
-            reservation_term TEXT,
-            raw_data JSONB,
-            is_active BOOLEAN DEFAULT TRUE,
-            last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-        )
-    """)
-
-    cur.execute("DROP INDEX IF EXISTS idx_prices_unique_key")
-
-    cur.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_prices_unique_key
-        ON azure_prices(meter_id, sku_id, currency_code, effective_start_date, arm_region_name)
-    """)
-
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_prices_service_region
-        ON azure_prices(service_name, arm_region_name)
-    """)
-
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_prices_sku_name
-        ON azure_prices(sku_name)
-    """)
-
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_prices_currency
-        ON azure_prices(currency_code)
-    """)
-
-    conn.commit()
-    cur.close()
-    print("Schema ready.")
-
 # ── Checkpoint ────────────────────────────────────────────────────────────────
 
 def load_checkpoint():
@@ -129,41 +88,37 @@ def clear_checkpoint():
 # ── Batch Insert with Retry ───────────────────────────────────────────────────
 
 def insert_batch(conn, items, retries=3):
+    """Insert a batch of PriceRecords; returns a Counter of newly inserted rows per serviceName."""
     if not items:
-        return
-
-    values = []
-    for item in items:
-        values.append((
-            item.get('meterId'), item.get('skuId'), item.get('serviceName'),
-            item.get('serviceId'), item.get('serviceFamily'), item.get('productName'),
-            item.get('skuName'), item.get('armRegionName'), item.get('location'),
-            item.get('currencyCode'), item.get('retailPrice'), item.get('unitPrice'),
-            item.get('effectiveStartDate'), item.get('type'), item.get('reservationTerm'),
-            json.dumps(item)
-        ))
-
-    query = """
-    INSERT INTO azure_prices (
-        meter_id, sku_id, service_name, service_id, service_family,
-        product_name, sku_name, arm_region_name, location,
-        currency_code, retail_price, unit_price, effective_start_date,
-        type, reservation_term, raw_data
-    ) VALUES %s
-    ON CONFLICT (meter_id, sku_id, currency_code, effective_start_date, arm_region_name)
+        return Counter()
+
+    with TELEMETRY.stage('dedupe'):
+        items = sorted(items, key=partition_order)
+    with TELEMETRY.stage('encode'):
+        values = [build_row(item) for item in items]
+
+    query = f"""
+    INSERT INTO azure_prices ({COLUMN_SQL}) VALUES %s
+    ON CONFLICT ({CONFLICT_TARGET})
     DO NOTHING
+    RETURNING service_name
     """
 
     for attempt in range(1, retries + 1):
         cur = conn.cursor()
         try:
-            extras.execute_values(
-                cur, query, values,
-                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-            )
-            conn.commit()
+            with TELEMETRY.stage('db_write'):
+                inserted = extras.execute_values(
+                    cur, query, values,
+                    template=values_template(),
+                    fetch=True
+                )
+            with TELEMETRY.stage('commit'):
+                conn.commit()
             cur.close()
-            return
+            TELEMETRY.count('rows_written', len(values))
+            TELEMETRY.count('rows_changed', len(inserted))
+            return Counter(row[0] for row in inserted)
         except Exception as e:
             conn.rollback()
             cur.close()
@@ -171,12 +126,15 @@ def insert_batch(conn, items, retries=3):
             if attempt < retries:
                 time.sleep(2 ** attempt)
             else:
-                print(f"\n❌ CRITICAL: Batch permanently failed after {retries} attempts. {len(items)} rows lost.")
+                print(f"\n❌ CRITICAL: Batch permanently failed after {retries} attempts.")
+                spool_records('initial_pricing_load', None, items, e)
+    return Counter()
 
 # ── Main Fetch & Load ─────────────────────────────────────────────────────────
 
-def fetch_and_load(fresh=False):
+def fetch_and_load(fresh=False, bulk=False):
     conn = get_db_connection()
+    require_schema(conn)
 
     if fresh:
         cur = conn.cursor()
@@ -186,8 +144,11 @@ def fetch_and_load(fresh=False):
         cur.close()
         clear_checkpoint()
 
-    init_schema(conn)
     checkpoint = load_checkpoint()
+    service_changes = Counter()
+    run_id = create_sync_log(conn, 'initial_pricing_load')
+    metrics.start('initial_pricing_load')
+    error = None
 
     start_currency_idx = 0
     if checkpoint:
@@ -197,87 +158,105 @@ def fetch_and_load(fresh=False):
         except ValueError:
             start_currency_idx = 0
 
-    for i in range(start_currency_idx, len(CURRENCIES)):
-        currency = CURRENCIES[i]
-
-        url = API_URL + f"?currencyCode={currency}"
-        total_fetched = 0
-
-        if checkpoint and checkpoint['currency'] == currency:
-            url = checkpoint['url']
-            total_fetched = checkpoint['total_fetched']
-            checkpoint = None
-
-        if not url:
-            print(f"Finished {currency} or no URL.")
-            continue
-
-        print(f"\n--- Processing {currency} ---")
-        batch_items = []
-        page_count = 0
-
-        try:
-            while url:
-                try:
-                    response = session.get(url, timeout=30)
-                    response.raise_for_status()
-                except Exception as e:
-                    print(f"\nRequest failed: {e}. Retrying in 5s...")
-                    time.sleep(5)
-                    continue
-
-                data = response.json()
-                items = data.get('Items', [])
-
-                # Filter out unwanted Managed Disk variants (Burst, Snapshot, Disk Mount)
-                def is_valid_disk_item(item):
-                    service_name = item.get('serviceName', '')
-                    sku_name = (item.get('skuName') or '').lower()
-                    meter_name = (item.get('meterName') or '').lower()
-                    if service_name == 'Storage' and 'Managed Disks' in item.get('productName', ''):
-                        if any(kw in sku_name or kw in meter_name for kw in ['burst', 'snapshot', 'mount']):
-                            return False
-                    return True
-
-                items = [i for i in items if is_valid_disk_item(i)]
-
-                if not items and not data.get('NextPageLink'):
-                    break
-
-                batch_items.extend(items)
-                total_fetched += len(items)
-                next_url = data.get('NextPageLink')
-
-                if len(batch_items) >= BATCH_SIZE:
-                    insert_batch(conn, batch_items)
-                    batch_items = []
-                    save_checkpoint(currency, next_url, total_fetched)
-
-                url = next_url
-                page_count += 1
-                sys.stdout.write(f"\rPage: {page_count} | Total {currency} Fetched: {total_fetched}")
-                sys.stdout.flush()
-
-            if batch_items:
-                insert_batch(conn, batch_items)
-
-            print(f"\n✅ Finished {currency}. Total fetched: {total_fetched}")
-            clear_checkpoint()
-
-        except KeyboardInterrupt:
-            print("\nPaused by user. Checkpoint saved.")
-            save_checkpoint(currency, url, total_fetched)
-            break
-        except Exception as e:
-            print(f"\nCritical error during {currency}: {e}")
-            import traceback
-            traceback.print_exc()
-            save_checkpoint(currency, url, total_fetched)
-            break
-
+    completed = False
+    # --bulk: secondary indexes are rebuilt (and ANALYZE run) when this block exits
+    with (bulk_load_mode(conn) if bulk else nullcontext()):
+        for i in range(start_currency_idx, len(CURRENCIES)):
+            currency = CURRENCIES[i]
+
+            url = API_URL + f"?currencyCode={currency}"
+            total_fetched = 0
+
+            if checkpoint and checkpoint['currency'] == currency:
+                url = checkpoint['url']
+                total_fetched = checkpoint['total_fetched']
+                checkpoint = None
+
+            if not url:
+                print(f"Finished {currency} or no URL.")
+                continue
+
+            print(f"\n--- Processing {currency} ---")
+            batch_items = []
+            page_count = 0
+
+            try:
+                while url:
+                    try:
+                        with TELEMETRY.stage('http'):
+                            response = session.get(url, timeout=30)
+                        TELEMETRY.count_response(response)
+                        response.raise_for_status()
+                    except Exception as e:
+                        print(f"\nRequest failed: {e}. Retrying in 5s...")
+                        TELEMETRY.count('http_errors')
+                        time.sleep(5)
+                        continue
+
+                    TELEMETRY.count('bytes', len(response.content))
+                    TELEMETRY.count('pages')
+                    with TELEMETRY.stage('decode'):
+                        pairs, next_url = json_codec.page_items(response.content, keep_raw=RAW_DATA_MODE == 'full')
+
+                    # Drop / tag / rewrite per the shared ingest rules
+                    with TELEMETRY.stage('filter'):
+                        pairs = RULES.filter_pairs(pairs)
+
+                    if not pairs and not next_url:
+                        break
+
+                    with TELEMETRY.stage('decode'):
+                        batch_items.extend(PriceRecord.from_item(item, item_raw) for item, item_raw in pairs)
+                    total_fetched += len(pairs)
+                    TELEMETRY.count('items_fetched', len(pairs))
+
+                    if len(batch_items) >= BATCH_SIZE:
+                        service_changes += insert_batch(conn, batch_items)
+                        batch_items = []
+                        save_checkpoint(currency, next_url, total_fetched)
+
+                    url = next_url
+                    page_count += 1
+                    sys.stdout.write(f"\rPage: {page_count} | Total {currency} Fetched: {total_fetched}")
+                    sys.stdout.flush()
+
+                if batch_items:
+                    service_changes += insert_batch(conn, batch_items)
+
+                print(f"\n✅ Finished {currency}. Total fetched: {total_fetched}")
+                RULES.report()
+                clear_checkpoint()
+
+            except KeyboardInterrupt:
+                print("\nPaused by user. Checkpoint saved.")
+                save_checkpoint(currency, url, total_fetched)
+                error = "Paused by user"
+                break
+            except Exception as e:
+                error = str(e)
+                print(f"\nCritical error during {currency}: {e}")
+                import traceback
+                traceback.print_exc()
+                save_checkpoint(currency, url, total_fetched)
+                break
+        else:
+            completed = True
+
+    if completed:
+        print("Refreshing effective reservation rates...")
+        refresh_effective_rates(conn)
+        epoch = publish_epoch(conn, 'initial_pricing_load', service_changes, run_id)
+        print(f"Catalog epoch published: {epoch}")
+
+    TELEMETRY.report()
+    complete_sync_log(conn, run_id, sum(service_changes.values()), error, TELEMETRY.summary())
+    metrics.finish(conn, error)
     conn.close()
 
 
 if __name__ == "__main__":
     fresh_start = "--fresh" in sys.argv
-    fetch_and_load(fresh=fresh_start)
\ No newline at end of file
+    bulk_mode = "--bulk" in sys.argv
+    # --profile / INGEST_PROFILE=1: CPU and memory profile bundle (see profiling.py)
+    with profile_run('initial_pricing_load'):
+        fetch_and_load(fresh=fresh_start, bulk=bulk_mode)
\ No newline at end of file
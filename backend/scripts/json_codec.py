@@ -0,0 +1,96 @@
+"""
+json_codec.py
+─────────────
+The JSON codec used by every ingest script.
+
+Uses orjson when it is installed (several times faster on both decode and
+encode) and falls back to the stdlib json module otherwise. Set
+JSON_CODEC=stdlib to force the fallback, e.g. to compare the two
+(see bench_json_codec.py).
+
+Besides plain loads()/dumps(), page_items_with_raw() decodes an API page and
+returns each item together with its original JSON text, so raw_data and the
+dump file can store the bytes the API sent instead of re-serializing the dict.
+
+Pass-through only pays off on the stdlib backend: the item boundaries come
+from the stdlib scanner, and orjson decodes a page and re-encodes every item
+about twice as fast as that scanner alone. page_items() is what the loaders
+call; it keeps the raw text only when asked to and when it is the cheaper
+path (RAW_PASS_THROUGH). Residual raw_data (price_rows.RAW_DATA_MODE, the
+default) is a subset of the item and is always encoded.
+"""
+
+import os
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+BACKEND = 'stdlib'
+if os.environ.get('JSON_CODEC', '').lower() != 'stdlib':
+    try:
+        import orjson
+        BACKEND = 'orjson'
+    except ImportError:
+        pass
+
+RAW_PASS_THROUGH = BACKEND == 'stdlib'
+
+
+if BACKEND == 'orjson':
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        """Compact JSON text."""
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        """Compact JSON text."""
+        return json.dumps(obj, separators=(',', ':'))
+
+
+def page_items(raw, keep_raw=False):
+    """
+    Decode an API page → ([(item, item_json_text or None), ...], next_page_link).
+    Item texts are kept only with keep_raw and when RAW_PASS_THROUGH is on.
+    """
+    if keep_raw and RAW_PASS_THROUGH:
+        return page_items_with_raw(raw)
+    page = loads(raw)
+    return [(item, None) for item in page.get('Items', [])], page.get('NextPageLink')
+
+
+def page_items_with_raw(raw):
+    """
+    Decode an API page → ([(item, item_json_text), ...], next_page_link).
+
+    The item texts are exact slices of the page body. The stdlib scanner is
+    used here because it reports where each value ends; the rest of the page
+    is small and decoded with it as well.
+    """
+    text = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else raw
+    start = text.find('"Items"')
+    if start < 0:
+        page = loads(text)
+        return [(item, dumps(item)) for item in page.get('Items', [])], page.get('NextPageLink')
+
+    pos = text.index('[', start) + 1
+    pairs = []
+    n = len(text)
+    while pos < n:
+        while text[pos] in _WHITESPACE or text[pos] == ',':
+            pos += 1
+        if text[pos] == ']':
+            pos += 1
+            break
+        item, end = _decoder.raw_decode(text, pos)
+        pairs.append((item, text[pos:end]))
+        pos = end
+
+    # Everything except Items is a handful of scalars: splice a stub in their place
+    envelope = loads(text[:start] + '"Items":[]' + text[pos:])
+    return pairs, envelope.get('NextPageLink')
@@ -1,10 +1,30 @@
+import gc
 import os
 import sys
-import json
 import time
+import zlib
+import queue
+import argparse
+import multiprocessing as mp
 import psycopg2
 from psycopg2 import sql, extras
+from collections import Counter
+from contextlib import nullcontext
 from datetime import datetime
+from effective_rates import refresh_effective_rates
+from catalog_epoch import publish_epoch
+from price_rows import COLUMN_SQL, build_row, values_template
+from price_record import PriceRecord
+from ingest_rules import RULES
+from dead_letter import spool_records
+from sync_log import create_sync_log, complete_sync_log
+from telemetry import TELEMETRY
+import metrics
+from profiling import profile_run, profiling_requested
+from price_schema import CONFLICT_TARGET, partition_order, require_schema
+from bulk_load import bulk_load_mode, bulk_session
+import json_codec
+from dump_index import load_index, read_ranges, select_ranges
 
 # Configuration
 INPUT_FILE = "azure_pricing_dump.json"
@@ -35,191 +55,293 @@ def get_db_connection():
         print(f"Error connecting to database: {e}")
         sys.exit(1)
 
-def ensure_schema(conn):
-    """
-    Ensures the table exists with the correct schema, but DOES NOT drop it.
-    This allows for resuming or offline loading without data loss.
-    """
-    print("Verifying Database Schema...")
-    cur = conn.cursor()
-    
-    schema_sql = """
-    CREATE TABLE IF NOT EXISTS azure_prices (
-        meter_id TEXT,
-        sku_id TEXT,
-        
-        -- Core fields for filtering
-        service_name TEXT,
-        service_id TEXT,
-        service_family TEXT,
-        product_name TEXT,
-        sku_name TEXT,
-        
-        arm_region_name TEXT,
-        location TEXT,
-        
-        currency_code TEXT,
-        retail_price DOUBLE PRECISION,
-        unit_price DOUBLE PRECISION,
-        effective_start_date TIMESTAMP,
-        
-        type TEXT,
-        reservation_term TEXT,
-        
-        -- Full raw data
-        raw_data JSONB,
-        
-        -- Metadata
-        is_active BOOLEAN DEFAULT TRUE,
-        last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-        last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-        
-        PRIMARY KEY (meter_id, effective_start_date)
-    );
-
-    CREATE INDEX IF NOT EXISTS idx_prices_service_region ON azure_prices(service_name, arm_region_name);
-    CREATE INDEX IF NOT EXISTS idx_prices_sku_name ON azure_prices(sku_name);
-    CREATE INDEX IF NOT EXISTS idx_prices_product_name ON azure_prices(product_name);
-    CREATE INDEX IF NOT EXISTS idx_prices_active ON azure_prices(is_active);
-    """
-    cur.execute(schema_sql)
-    conn.commit()
-    cur.close()
-    print("Schema verified.")
-
 def insert_batch(conn, items, stats):
     if not items:
         return
 
-    # Deduplicate items by (meterId, effectiveStartDate)
-    unique_map = {}
-    for item in items:
-        key = (item.get('meterId'), item.get('effectiveStartDate'))
-        if key[0] and key[1]:
-            unique_map[key] = item
-    
-    # Sort for deadlock prevention
-    deduped_items = sorted(list(unique_map.values()), key=lambda x: (x.get('meterId', ''), x.get('effectiveStartDate', '')))
+    with TELEMETRY.stage('dedupe'):
+        # Deduplicate items by (meterId, effectiveStartDate)
+        unique_map = {}
+        for record in items:
+            key = record.key
+            if key[0] and key[1]:
+                unique_map[key] = record
+        
+        # Sort for deadlock prevention (and so rows are routed partition by partition)
+        deduped_items = sorted(unique_map.values(), key=partition_order)
     
     if not deduped_items:
         return
 
     cur = conn.cursor()
     
-    values = []
-    for item in deduped_items:
-        values.append((
-            item.get('meterId'),
-            item.get('skuId'),
-            item.get('serviceName'),
-            item.get('serviceId'),
-            item.get('serviceFamily'),
-            item.get('productName'),
-            item.get('skuName'),
-            item.get('armRegionName'),
-            item.get('location'),
-            item.get('currencyCode'),
-            item.get('retailPrice'),
-            item.get('unitPrice'),
-            item.get('effectiveStartDate'),
-            item.get('type'),
-            item.get('reservationTerm'),
-            json.dumps(item)
-        ))
-
-    query = """
-    INSERT INTO azure_prices (
-        meter_id, sku_id, service_name, service_id, service_family,
-        product_name, sku_name, arm_region_name, location,
-        currency_code, retail_price, unit_price, effective_start_date,
-        type, reservation_term, raw_data, 
-        is_active, last_seen_at
-    ) VALUES %s
-    ON CONFLICT (meter_id, effective_start_date) DO UPDATE SET
+    with TELEMETRY.stage('encode'):
+        values = [build_row(record) for record in deduped_items]
+
+    query = f"""
+    INSERT INTO azure_prices ({COLUMN_SQL}, is_active, last_seen_at) VALUES %s
+    ON CONFLICT ({CONFLICT_TARGET}) DO UPDATE SET
         retail_price = EXCLUDED.retail_price,
         unit_price = EXCLUDED.unit_price,
         raw_data = EXCLUDED.raw_data,
         is_active = TRUE,
         last_seen_at = NOW()
+    RETURNING service_name
     """
     
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            extras.execute_values(
-                cur, 
-                query, 
-                values, 
-                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())",
-                page_size=BATCH_SIZE
-            )
-            conn.commit()
+            with TELEMETRY.stage('db_write'):
+                changed_rows = extras.execute_values(
+                    cur, 
+                    query, 
+                    values, 
+                    template=values_template("TRUE", "NOW()"),
+                    page_size=BATCH_SIZE,
+                    fetch=True
+                )
+            with TELEMETRY.stage('commit'):
+                conn.commit()
+            TELEMETRY.count('rows_written', len(deduped_items))
+            TELEMETRY.count('rows_changed', len(changed_rows))
             stats['processed_items'] += len(deduped_items)
+            stats['service_changes'].update(row[0] for row in changed_rows)
             break
-        except psycopg2.errors.DeadlockDetected:
+        except psycopg2.errors.DeadlockDetected as e:
             conn.rollback()
             if attempt < max_retries - 1:
                 print(f"\n⚠️ Deadlock detected. Retrying batch (Attempt {attempt+1}/{max_retries})...")
                 time.sleep(1)
             else:
                 print(f"\n❌ Batch Failed after retries.")
+                spool_records('json_to_postgres', None, deduped_items, e)
         except Exception as e:
             print(f"\n❌ Batch Failed: {e}")
             conn.rollback()
+            spool_records('json_to_postgres', None, deduped_items, e)
             break
             
     cur.close()
 
-def load_from_json():
-    # Check for CLI arg or default
-    file_path = INPUT_FILE
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
+def worker_for(meter_id, workers):
+    """
+    Key-range owner of a meter: Azure meter ids are UUIDs, so their leading
+    hex digits split the key space into contiguous, evenly sized ranges and
+    each worker's rows land in its own part of the meter_id-leading indexes.
+    """
+    try:
+        return int(meter_id[:4], 16) * workers >> 16
+    except (TypeError, ValueError):
+        return zlib.crc32((meter_id or '').encode('utf-8')) % workers
+
+
+def load_worker(worker_id, batches, results, bulk=False):
+    """Worker process: own connection, loads every batch it is handed."""
+    # Forked with the parent's read/decode counters: drop them so they are not merged back
+    TELEMETRY.take_stats()
+    RULES.take_stats()
+    conn = get_db_connection()
+    if bulk:
+        bulk_session(conn)
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            stats = {'processed_items': 0, 'service_changes': Counter()}
+            insert_batch(conn, batch, stats)
+            results.put((worker_id, stats['processed_items'], stats['service_changes'], TELEMETRY.take_stats()))
+    finally:
+        conn.close()
+        results.put((worker_id, None, None, None))
+
+
+def load_serial(conn, items, stats):
+    total_items = len(items)
+    batch = []
+    for i, item in enumerate(items):
+        batch.append(item)
 
+        if len(batch) >= BATCH_SIZE:
+            insert_batch(conn, batch, stats)
+            batch = []
+            # Progress
+            sys.stdout.write(f"\r🚀 Processed: {stats['processed_items']}/{total_items} ({(stats['processed_items']/total_items)*100:.1f}%)")
+            sys.stdout.flush()
+
+    if batch:
+        insert_batch(conn, batch, stats)
+
+
+def load_parallel(items, stats, workers, bulk=False):
+    """
+    Fan items out to `workers` processes by meter_id key range. Workers never
+    touch the same rows, so they neither block nor deadlock on each other.
+    With `bulk`, each worker's session gets the bulk_session() settings.
+    """
+    total_items = len(items)
+    batches = [mp.Queue(maxsize=4) for _ in range(workers)]
+    results = mp.Queue()
+    procs = [
+        mp.Process(target=load_worker, args=(w, batches[w], results, bulk), daemon=True)
+        for w in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+
+    def collect(block):
+        while True:
+            try:
+                worker_id, processed, service_changes, stage_stats = results.get(block, timeout=1 if block else None)
+            except queue.Empty:
+                return None
+            if processed is None:
+                return worker_id
+            stats['processed_items'] += processed
+            stats['service_changes'].update(service_changes)
+            TELEMETRY.merge_stats(stage_stats)
+            sys.stdout.write(f"\r🚀 Processed: {stats['processed_items']}/{total_items} ({(stats['processed_items']/total_items)*100:.1f}%) | {workers} workers")
+            sys.stdout.flush()
+
+    def abort(w):
+        for proc in procs:
+            proc.terminate()
+        raise RuntimeError(f"load worker {w} exited unexpectedly (exit code {procs[w].exitcode})")
+
+    def send(w, batch):
+        # A dead worker never drains its queue: poll instead of blocking on put()
+        while True:
+            try:
+                batches[w].put(batch, timeout=1)
+                return
+            except queue.Full:
+                collect(block=False)
+                if not procs[w].is_alive():
+                    abort(w)
+
+    pending = [[] for _ in range(workers)]
+    for item in items:
+        w = worker_for(item.meter_id, workers)
+        pending[w].append(item)
+        if len(pending[w]) >= BATCH_SIZE:
+            send(w, pending[w])
+            pending[w] = []
+            collect(block=False)
+
+    for w in range(workers):
+        if pending[w]:
+            send(w, pending[w])
+        send(w, None)
+
+    finished = set()
+    while len(finished) < workers:
+        worker_id = collect(block=True)
+        if worker_id is not None:
+            finished.add(worker_id)
+            continue
+        for w, proc in enumerate(procs):
+            if w not in finished and not proc.is_alive():
+                abort(w)
+    for proc in procs:
+        proc.join()
+    failed = [w for w, proc in enumerate(procs) if proc.exitcode]
+    if failed:
+        raise RuntimeError(f"load workers {failed} failed; see their errors above")
+
+
+def read_items(file_path, services=None, regions=None):
+    """Every item of the dump, or only the selected services/regions via its offset index."""
+    if not (services or regions):
+        with open(file_path, 'rb') as f:
+            # Note: Loading entire JSON into memory. 
+            # If file is >1GB, verify system RAM or switch to streaming (ijson).
+            with TELEMETRY.stage('read'):
+                raw = f.read()
+        TELEMETRY.count('bytes', len(raw))
+        with TELEMETRY.stage('decode'):
+            data = json_codec.loads(raw)
+        return data if isinstance(data, list) else data.get('Items', [])
+
+    index = load_index(file_path)
+    if index is None:
+        print(f"❌ {file_path} has no offset index; build it first: python dump_index.py {file_path}")
+        sys.exit(1)
+    ranges = select_ranges(index, services, regions)
+    size = sum(end - start for start, end in ranges)
+    print(f"🗂️ Index: {len(ranges)} byte ranges, {size / 1e6:.1f} MB to read")
+    TELEMETRY.count('bytes', size)
+    # mmap reads fault pages in as they are decoded: one stage covers both
+    with TELEMETRY.stage('decode'):
+        return read_ranges(file_path, ranges)
+
+
+def load_from_json(file_path=INPUT_FILE, bulk=False, workers=1, services=None, regions=None):
     if not os.path.exists(file_path):
         print(f"❌ Input file not found: {file_path}")
-        print("Usage: python insert_from_json.py [file_path]")
+        print("Usage: python json_to_postgres.py [file_path] [--bulk] [--workers N] [--service S] [--region R]")
         return
 
     conn = get_db_connection()
-    ensure_schema(conn)
+    require_schema(conn)
+    run_id = create_sync_log(conn, 'json_to_postgres')
+    metrics.start('json_to_postgres')
+    error = None
 
     print(f"📂 Reading {file_path}...")
     start_time = datetime.now()
+    stats = {'processed_items': 0, 'service_changes': Counter()}
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Note: Loading entire JSON into memory. 
-            # If file is >1GB, verify system RAM or switch to streaming (ijson).
-            data = json.load(f)
-            
-        items = data if isinstance(data, list) else data.get('Items', [])
+        items = read_items(file_path, services, regions)
+        # Swap each dict for its compact record in place, so the dicts are
+        # freed as we go instead of all living until the load finishes;
+        # items dropped by the ingest rules are compacted out
+        TELEMETRY.count('items_fetched', len(items))
+        kept = 0
+        # Rule cost is reported separately, in the rules summary
+        with TELEMETRY.stage('decode'):
+            for item in items:
+                if RULES.apply(item) is not None:
+                    items[kept] = PriceRecord.from_item(item)
+                    kept += 1
+            del items[kept:]
+        RULES.report()
+        # The records live for the whole load: keep full collections from rescanning them
+        gc.collect()
+        gc.freeze()
         total_items = len(items)
         print(f"📦 Found {total_items} items. Starting ingestion...")
 
-        stats = {'processed_items': 0}
-        batch = []
-        
-        for i, item in enumerate(items):
-            batch.append(item)
-            
-            if len(batch) >= BATCH_SIZE:
-                insert_batch(conn, batch, stats)
-                batch = []
-                # Progress
-                sys.stdout.write(f"\r🚀 Processed: {stats['processed_items']}/{total_items} ({(stats['processed_items']/total_items)*100:.1f}%)")
-                sys.stdout.flush()
-        
-        if batch:
-            insert_batch(conn, batch, stats)
+        # --bulk: secondary indexes are rebuilt (and ANALYZE run) when this block exits
+        with (bulk_load_mode(conn) if bulk else nullcontext()):
+            if workers > 1:
+                load_parallel(items, stats, workers, bulk)
+            else:
+                load_serial(conn, items, stats)
 
         print(f"\n\n✅ Load complete! Processed {stats['processed_items']} items.")
+        refresh_effective_rates(conn)
+        publish_epoch(conn, 'json_to_postgres', stats['service_changes'], run_id)
         print(f"⏱️ Time taken: {datetime.now() - start_time}")
+        TELEMETRY.report()
 
     except Exception as e:
+        error = str(e)
         print(f"\n❌ Error: {e}")
     finally:
+        complete_sync_log(conn, run_id, stats['processed_items'], error, TELEMETRY.summary())
+        metrics.finish(conn, error)
         conn.close()
 
 if __name__ == "__main__":
-    load_from_json()
+    parser = argparse.ArgumentParser(description="Load an Azure pricing JSON dump into azure_prices.")
+    parser.add_argument('file_path', nargs='?', default=INPUT_FILE)
+    parser.add_argument('--bulk', action='store_true', help="drop secondary indexes during the load")
+    parser.add_argument('--workers', type=int, default=1, help="parallel loader processes")
+    parser.add_argument('--service', action='append', help="reload only this serviceName (repeatable; needs the dump's .idx)")
+    parser.add_argument('--region', action='append', help="reload only this armRegionName (repeatable; needs the dump's .idx)")
+    parser.add_argument('--profile', action='store_true', help="write a CPU/memory profile bundle (see profiling.py)")
+    args = parser.parse_args()
+    with profile_run('json_to_postgres', profiling_requested(args.profile)):
+        load_from_json(args.file_path, args.bulk, args.workers, args.service, args.region)
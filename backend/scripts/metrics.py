@@ -0,0 +1,219 @@
+"""
+metrics.py
+──────────
+OpenMetrics export for the ingestion jobs – one registry shared by every job.
+
+A job calls metrics.start(job) when it begins and metrics.finish(conn, error)
+after completing its sync_log row:
+
+  - while it runs, METRICS_PORT (if set) serves the live registry at
+    http://0.0.0.0:<port>/metrics
+  - finish() writes <METRICS_TEXTFILE_DIR>/<job>.prom (default
+    scripts/metrics/), atomically, for a textfile collector to pick up
+
+Metrics (all labelled with job):
+
+    azure_ingest_items_total                     items fetched
+    azure_ingest_rows_changed_total              rows inserted or updated
+    azure_ingest_bytes_total                     API / dump bytes read
+    azure_ingest_items_per_second                items over the run's wall time
+    azure_ingest_api_request_duration_seconds    histogram of API calls
+    azure_ingest_api_responses_total{code}       responses by status (429s included)
+    azure_ingest_db_batch_duration_seconds       histogram of batch writes
+    azure_ingest_stage_seconds_total{stage}      telemetry stage time
+    azure_ingest_run_duration_seconds            wall time of the run
+    azure_ingest_run_success                     1 if the run completed
+    azure_ingest_last_success_timestamp_seconds  from sync_log, so a failed run
+                                                 still reports the last good one
+    azure_ingest_dead_letter_batches             the job's batches waiting in the spool
+
+Alert on staleness with time() - azure_ingest_last_success_timestamp_seconds.
+Histograms only see the main process; worker stage time still reaches
+stage_seconds through telemetry.
+"""
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telemetry import TELEMETRY
+from dead_letter import spool_files
+
+METRICS_TEXTFILE_DIR = os.environ.get('METRICS_TEXTFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+PREFIX = 'azure_ingest'
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+API_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LAST_SUCCESS_SQL = """
+SELECT EXTRACT(EPOCH FROM MAX(completed_at))
+FROM sync_log
+WHERE status = 'completed' AND job = %s
+"""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def lines(self, name, labels):
+        with self._lock:
+            for bound, count in zip(self.buckets, self.counts):
+                yield f"{name}_bucket{_labels({**labels, 'le': _number(float(bound))})} {count}"
+            yield f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {self.count}"
+            yield f"{name}_count{_labels(labels)} {self.count}"
+            yield f"{name}_sum{_labels(labels)} {_number(self.sum)}"
+
+
+class Registry:
+    """Metric state of the current job; render() produces the OpenMetrics exposition."""
+
+    def __init__(self):
+        self.job = None
+        self.started = None
+        self.api_latency = Histogram(API_BUCKETS)
+        self.db_latency = Histogram(DB_BUCKETS)
+        self.success = None
+        self.duration = None
+        self.last_success = None
+        self.dead_letter_batches = None
+
+    def observe_stage(self, stage, seconds):
+        if stage == 'http':
+            self.api_latency.observe(seconds)
+        elif stage == 'db_write':
+            self.db_latency.observe(seconds)
+
+    def _families(self):
+        job = {'job': self.job}
+        counters = TELEMETRY.counters
+        wall = self.duration if self.duration is not None else time.time() - self.started
+
+        def family(name, kind, help_text, samples):
+            out = [f"# TYPE {PREFIX}_{name} {kind}", f"# HELP {PREFIX}_{name} {help_text}"]
+            suffix = '_total' if kind == 'counter' else ''
+            out += [f"{PREFIX}_{name}{suffix}{_labels(labels)} {_number(value)}" for labels, value in samples]
+            return out
+
+        lines = []
+        lines += family('items', 'counter', "Items fetched.", [(job, counters['items_fetched'])])
+        lines += family('rows_changed', 'counter', "Rows inserted or updated.", [(job, counters['rows_changed'])])
+        lines += family('bytes', 'counter', "Bytes read from the API or dump.", [(job, counters['bytes'])])
+        lines += family('items_per_second', 'gauge', "Items fetched per second of run time.",
+                        [(job, round(counters['items_fetched'] / wall, 3) if wall else 0.0)])
+        lines += family('api_responses', 'counter', "API responses by HTTP status.", [
+            ({**job, 'code': name[5:]}, value)
+            for name, value in sorted(counters.items()) if name.startswith('http_') and name[5:].isdigit()
+        ])
+        lines += family('stage_seconds', 'counter', "Time spent per pipeline stage.", [
+            ({**job, 'stage': stage}, round(seconds, 6)) for stage, seconds in sorted(TELEMETRY.seconds.items())
+        ])
+
+        lines += [f"# TYPE {PREFIX}_api_request_duration_seconds histogram",
+                  f"# HELP {PREFIX}_api_request_duration_seconds Retail Prices API request latency."]
+        lines += self.api_latency.lines(f"{PREFIX}_api_request_duration_seconds", job)
+        lines += [f"# TYPE {PREFIX}_db_batch_duration_seconds histogram",
+                  f"# HELP {PREFIX}_db_batch_duration_seconds Database batch write latency."]
+        lines += self.db_latency.lines(f"{PREFIX}_db_batch_duration_seconds", job)
+
+        lines += family('run_duration_seconds', 'gauge', "Wall time of the run so far.", [(job, round(wall, 3))])
+        if self.success is not None:
+            lines += family('run_success', 'gauge', "1 if the last run completed without error.",
+                            [(job, 1 if self.success else 0)])
+        if self.last_success is not None:
+            lines += family('last_success_timestamp_seconds', 'gauge', "Completion time of the last successful run.",
+                            [(job, round(self.last_success, 3))])
+        if self.dead_letter_batches is not None:
+            lines += family('dead_letter_batches', 'gauge', "Failed batches of this job waiting in the dead-letter spool.",
+                            [(job, self.dead_letter_batches)])
+        return lines
+
+    def render(self):
+        return "\n".join(self._families() + ["# EOF"]) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(job):
+    """Begin collecting metrics for `job`; serve them on METRICS_PORT if set."""
+    REGISTRY.job = job
+    REGISTRY.started = time.time()
+    TELEMETRY.stage_observer = REGISTRY.observe_stage
+    if METRICS_PORT:
+        server = ThreadingHTTPServer(('0.0.0.0', METRICS_PORT), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics: http://0.0.0.0:{METRICS_PORT}/metrics")
+
+
+def finish(conn=None, error=None):
+    """Close the run and write <job>.prom. `conn` supplies the last success time from sync_log."""
+    if REGISTRY.job is None:
+        return None
+    REGISTRY.duration = time.time() - REGISTRY.started
+    REGISTRY.success = error is None
+    REGISTRY.dead_letter_batches = len(spool_files(REGISTRY.job))
+    if conn is not None:
+        try:
+            conn.rollback()
+            cur = conn.cursor()
+            cur.execute(LAST_SUCCESS_SQL, (REGISTRY.job,))
+            ts = cur.fetchone()[0]
+            REGISTRY.last_success = float(ts) if ts is not None else None
+            cur.close()
+        except Exception as e:
+            print(f"Warning: could not read last successful runs: {e}")
+
+    os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+    path = os.path.join(METRICS_TEXTFILE_DIR, f"{REGISTRY.job}.prom")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,400 @@
+"""
+migrate_schema.py
+─────────────────
+Versioned schema migrations for `azure_prices`.
+
+Depending on which script created it first, azure_prices had either a
+BIGSERIAL id plus a 5-column unique index (initial_pricing_load.py) or a
+PRIMARY KEY (meter_id, effective_start_date) (json_to_postgres.py), with
+different secondary indexes. This runner converges any of those onto one
+canonical key and index set (see price_schema.py) and records each applied
+step in `schema_migrations`. Loaders refuse to run until the database is on
+price_schema.SCHEMA_VERSION.
+
+Indexes are built CONCURRENTLY. On a partitioned table (partition_prices.py)
+the parent index is created ON ONLY the parent and each partition's index is
+built concurrently and attached. Every step is safe to re-run: an
+interrupted concurrent build leaves an invalid index, which is dropped and
+rebuilt on the next run.
+
+Usage:
+    python migrate_schema.py            apply pending migrations
+    python migrate_schema.py --status   show applied migrations
+"""
+
+import os
+import sys
+import time
+import zlib
+import argparse
+import psycopg2
+from datetime import datetime
+from dotenv import load_dotenv
+from price_schema import SCHEMA_VERSION, CANONICAL_KEY, CANONICAL_KEY_INDEX, is_partitioned, schema_version
+from price_history import add_key_columns
+from effective_rates import refresh_effective_rates
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+# Arbitrary constant; keeps two runners from migrating at the same time
+MIGRATION_LOCK_ID = 0x617a5f6d  # 'az_m'
+BATCH_SIZE = 10000
+
+# Canonical secondary indexes: name → (column list, partial-index predicate)
+INDEXES = {
+    'idx_prices_service_region': ("(service_name, arm_region_name)", None),
+    'idx_prices_search': ("(product_name, sku_name)", None),
+    'idx_prices_sku_name': ("(sku_name)", None),
+    'idx_prices_dashboard': ("(arm_region_name, service_name, currency_code, is_active, retail_price)", None),
+    'idx_prices_active_usd': ("(arm_region_name, service_name, sku_name, retail_price)",
+                              "is_active = TRUE AND currency_code = 'USD'"),
+    'idx_prices_vm_query': ("(service_name, type, currency_code, is_active, retail_price, "
+                            "product_name, sku_name, arm_region_name)", None),
+    'idx_prices_product_name_lower': ("(LOWER(product_name))", None),
+    'idx_prices_sku_name_lower': ("(LOWER(sku_name))", None),
+    'idx_prices_vmlist_hot': ("(arm_region_name, sku_name, retail_price, product_name)",
+                              "service_name = 'Virtual Machines' AND type = 'Consumption' "
+                              "AND currency_code = 'USD' AND is_active = TRUE"),
+}
+
+# Created by older loader versions; low-selectivity or covered by INDEXES
+REDUNDANT_INDEXES = ['idx_prices_currency', 'idx_prices_active', 'idx_prices_product_name']
+
+BASE_COLUMNS = [
+    ('meter_id', 'TEXT'),
+    ('sku_id', 'TEXT'),
+    ('service_name', 'TEXT'),
+    ('service_id', 'TEXT'),
+    ('service_family', 'TEXT'),
+    ('product_name', 'TEXT'),
+    ('sku_name', 'TEXT'),
+    ('arm_region_name', 'TEXT'),
+    ('location', 'TEXT'),
+    ('currency_code', 'TEXT'),
+    ('retail_price', 'DOUBLE PRECISION'),
+    ('unit_price', 'DOUBLE PRECISION'),
+    ('effective_start_date', 'TIMESTAMP'),
+    ('type', 'TEXT'),
+    ('reservation_term', 'TEXT'),
+    ('raw_data', 'JSONB'),
+    ('is_active', 'BOOLEAN DEFAULT TRUE'),
+    ('last_seen_at', 'TIMESTAMP WITH TIME ZONE DEFAULT NOW()'),
+]
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+# ── Index helpers ──────────────────────────────────────────────────────────────
+def _index_state(cur, name):
+    """None if the index does not exist, else (is_valid, is_partitioned_index)."""
+    cur.execute("""
+        SELECT i.indisvalid, c.relkind = 'I'
+        FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.oid = to_regclass(%s)
+    """, (name,))
+    return cur.fetchone()
+
+
+def _child_tables(cur, table):
+    cur.execute("""
+        SELECT c.relname, c.relkind = 'p'
+        FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, (table,))
+    return cur.fetchall()
+
+
+def _build_partitioned_index(cur, table, name, columns, where, unique):
+    """ON ONLY index on `table`, then build and attach one per child, recursively."""
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    predicate = f" WHERE {where}" if where else ""
+    cur.execute(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY {table} {columns}{predicate}")
+
+    for child, child_partitioned in _child_tables(cur, table):
+        child_index = f"{name[:40]}_{zlib.crc32(child.encode('utf-8')):08x}"
+        cur.execute("""
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = to_regclass(%s) AND inhrelid = to_regclass(%s)
+        """, (name, child_index))
+        if cur.fetchone():
+            continue
+        if child_partitioned:
+            _build_partitioned_index(cur, child, child_index, columns, where, unique)
+        else:
+            state = _index_state(cur, child_index)
+            if state is not None and not state[0]:
+                cur.execute(f"DROP INDEX CONCURRENTLY {child_index}")
+            cur.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {child_index} ON {child} {columns}{predicate}")
+        cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child_index}")
+
+
+def ensure_index(conn, name, columns, where=None, unique=False):
+    """Build an index CONCURRENTLY unless a valid one already exists. Needs autocommit."""
+    cur = conn.cursor()
+    state = _index_state(cur, name)
+    if state is not None and state[0]:
+        cur.close()
+        return False
+
+    start = time.time()
+    if is_partitioned(conn):
+        _build_partitioned_index(cur, 'azure_prices', name, columns, where, unique)
+    else:
+        if state is not None:
+            # Left invalid by an interrupted CONCURRENTLY build
+            cur.execute(f"DROP INDEX CONCURRENTLY {name}")
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        predicate = f" WHERE {where}" if where else ""
+        cur.execute(f"CREATE {kind} CONCURRENTLY {name} ON azure_prices {columns}{predicate}")
+    cur.close()
+    print(f"  {name} ({time.time() - start:.1f}s)")
+    return True
+
+
+def drop_index(conn, name):
+    cur = conn.cursor()
+    state = _index_state(cur, name)
+    if state is not None:
+        # DROP INDEX CONCURRENTLY is not supported on partitioned indexes
+        concurrently = "" if state[1] else "CONCURRENTLY "
+        cur.execute(f"DROP INDEX {concurrently}{name}")
+        print(f"  dropped {name}")
+    cur.close()
+
+
+# ── Migrations ─────────────────────────────────────────────────────────────────
+def m001_base_table(conn):
+    """Create azure_prices if missing and add any core column an older script left out."""
+    columns = ",\n".join(f"{name} {definition}" for name, definition in BASE_COLUMNS)
+    cur = conn.cursor()
+    cur.execute(f"CREATE TABLE IF NOT EXISTS azure_prices (\n{columns}\n)")
+    for name, definition in BASE_COLUMNS:
+        cur.execute(f"ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS {name} {definition}")
+    cur.close()
+
+
+def m002_surrogate_id(conn):
+    """
+    Give every schema the `id` column the API selects. Added as a plain column
+    with a sequence default (no table rewrite) and backfilled in batches.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'azure_prices'::regclass AND attname = 'id' AND NOT attisdropped
+    """)
+    if cur.fetchone():
+        cur.close()
+        return
+
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS azure_prices_id_seq")
+    cur.execute("ALTER TABLE azure_prices ADD COLUMN id BIGINT")
+    cur.execute("ALTER TABLE azure_prices ALTER COLUMN id SET DEFAULT nextval('azure_prices_id_seq')")
+    cur.execute("ALTER SEQUENCE azure_prices_id_seq OWNED BY azure_prices.id")
+    conn.commit()
+
+    total = 0
+    while True:
+        cur.execute("""
+            UPDATE azure_prices SET id = nextval('azure_prices_id_seq')
+            WHERE id IS NULL
+              AND ctid = ANY(ARRAY(SELECT ctid FROM azure_prices WHERE id IS NULL LIMIT %s))
+        """, (BATCH_SIZE,))
+        updated = cur.rowcount
+        conn.commit()
+        if updated == 0:
+            break
+        total += updated
+        sys.stdout.write(f"\r  Backfilled id: {total}")
+        sys.stdout.flush()
+    cur.close()
+    if total:
+        print()
+
+
+def _leaf_tables(cur):
+    cur.execute("""
+        SELECT relid::regclass::text FROM pg_partition_tree('azure_prices') WHERE isleaf
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+def m003_canonical_key(conn):
+    """Dedupe on the canonical key, build its unique index, drop the legacy keys."""
+    key = ", ".join(CANONICAL_KEY)
+    cur = conn.cursor()
+
+    state = _index_state(cur, CANONICAL_KEY_INDEX)
+    if state is None or not state[0]:
+        # Older unique keys were narrower or differently shaped; keep the most
+        # recently seen row of each canonical key
+        for table in _leaf_tables(cur):
+            cur.execute(f"""
+                DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+                    SELECT ctid FROM (
+                        SELECT ctid, row_number() OVER (
+                            PARTITION BY {key} ORDER BY last_seen_at DESC NULLS LAST
+                        ) AS rn
+                        FROM {table}
+                    ) d WHERE rn > 1
+                ))
+            """)
+            conn.commit()
+            if cur.rowcount:
+                print(f"  {table}: removed {cur.rowcount} duplicate rows")
+
+    conn.commit()
+    conn.autocommit = True
+    ensure_index(conn, CANONICAL_KEY_INDEX, f"({key})", unique=True)
+
+    # Every other unique key except a plain surrogate `id`
+    cur.execute("""
+        SELECT c.relname, con.conname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid
+        WHERE i.indrelid = 'azure_prices'::regclass
+          AND i.indisunique
+          AND c.relname <> %s
+          AND NOT (i.indnatts = 1 AND i.indkey[0] = (
+              SELECT attnum FROM pg_attribute WHERE attrelid = i.indrelid AND attname = 'id'))
+    """, (CANONICAL_KEY_INDEX,))
+    for index_name, constraint in cur.fetchall():
+        if constraint:
+            cur.execute(f"ALTER TABLE azure_prices DROP CONSTRAINT {constraint}")
+            print(f"  dropped constraint {constraint}")
+        else:
+            drop_index(conn, index_name)
+    cur.close()
+    conn.autocommit = False
+
+
+def m004_index_set(conn):
+    """Converge secondary indexes onto INDEXES."""
+    conn.commit()
+    conn.autocommit = True
+    for name in REDUNDANT_INDEXES:
+        drop_index(conn, name)
+    for name, (columns, where) in INDEXES.items():
+        ensure_index(conn, name, columns, where)
+    conn.autocommit = False
+
+
+def m005_history_key(conn):
+    """Record currency and region in price_history, so deltas follow the canonical key."""
+    add_key_columns(conn)
+
+
+def m006_effective_rates(conn):
+    """
+    Backfill term_months and the effective prices. The API's reserved-instance
+    filter reads term_months only; rows loaded before effective_rates.py
+    existed would otherwise match nothing until the next sync.
+    """
+    print(f"  {refresh_effective_rates(conn)} rows updated")
+
+
+MIGRATIONS = [
+    (1, 'base_table', m001_base_table),
+    (2, 'surrogate_id', m002_surrogate_id),
+    (3, 'canonical_key', m003_canonical_key),
+    (4, 'index_set', m004_index_set),
+    (5, 'history_key', m005_history_key),
+    (6, 'effective_rates', m006_effective_rates),
+]
+assert MIGRATIONS[-1][0] == SCHEMA_VERSION
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────────
+def ensure_migrations_table(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version      INTEGER PRIMARY KEY,
+            name         TEXT NOT NULL,
+            applied_at   TIMESTAMPTZ DEFAULT NOW(),
+            duration_ms  INTEGER
+        )
+    """)
+    conn.commit()
+    cur.close()
+
+
+def migrate(conn):
+    ensure_migrations_table(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    conn.commit()
+    try:
+        current = schema_version(conn) or 0
+        if current > SCHEMA_VERSION:
+            print(f"Error: database is at schema version {current}, newer than this code ({SCHEMA_VERSION}).")
+            sys.exit(1)
+
+        pending = [m for m in MIGRATIONS if m[0] > current]
+        if not pending:
+            print(f"Schema is up to date (version {current}).")
+            return
+
+        for version, name, step in pending:
+            print(f"▶  {version:03d}_{name}")
+            start = time.time()
+            step(conn)
+            conn.commit()
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s)",
+                (version, name, int((time.time() - start) * 1000))
+            )
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+
+
+def show_status(conn):
+    ensure_migrations_table(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT version, name, applied_at, duration_ms FROM schema_migrations ORDER BY version")
+    applied = {row[0]: row for row in cur.fetchall()}
+    cur.close()
+    for version, name, _ in MIGRATIONS:
+        row = applied.get(version)
+        status = f"applied {row[2]:%Y-%m-%d %H:%M} ({row[3]} ms)" if row else "pending"
+        print(f"  {version:03d}_{name:<16} {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply azure_prices schema migrations.")
+    parser.add_argument('--status', action='store_true', help="show applied migrations and exit")
+    args = parser.parse_args()
+
+    start = datetime.now()
+    conn = get_db_connection()
+    try:
+        if args.status:
+            show_status(conn)
+            return
+        migrate(conn)
+    finally:
+        conn.close()
+    print(f"✅ Schema version {SCHEMA_VERSION} in {(datetime.now() - start).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+orchestrate.py
+──────────────
+Runs the sync jobs as a dependency DAG – the single entry point of the
+nightly schedule (src/scheduler.js).
+
+    migrate_schema ─┬─ update_currency_rates
+                    ├─ update_prices ──────┬─ build_price_matrix
+                    │                      └─ archive_catalog
+                    └─ update_vm_types
+
+A job starts as soon as everything it depends on has completed, so
+independent jobs run concurrently; if a dependency fails, its dependents are
+skipped. Each job runs as a subprocess of its script and:
+
+  - holds a Postgres advisory lock on its name for the whole run, so a job
+    never runs twice at once (a second orchestrator, or async_sync.py for
+    update_prices, finds it 'locked' and leaves it alone)
+  - is killed (with its worker processes) after its timeout
+  - gets a row in `job_runs`: status, duration, exit code and the tail of
+    its output on failure
+
+Usage:
+    python orchestrate.py                      # the whole DAG
+    python orchestrate.py build_price_matrix   # a job and everything upstream of it
+    python orchestrate.py update_prices --no-deps --timeout update_prices=7200
+    python orchestrate.py --list
+    python orchestrate.py --history [N]
+"""
+
+import os
+import sys
+import uuid
+import signal
+import socket
+import argparse
+import threading
+import subprocess
+import psycopg2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TAIL_LINES = 40
+KILL_GRACE_SECONDS = 30
+
+
+class Job:
+    def __init__(self, name, script, deps=(), timeout=3600, args=(), requires_env=()):
+        self.name = name
+        self.script = script
+        self.deps = deps
+        self.timeout = timeout
+        self.args = args
+        # Skipped (not failed) when one of these is unset
+        self.requires_env = requires_env
+
+
+JOBS = {job.name: job for job in (
+    Job('migrate_schema', 'migrate_schema.py', timeout=15 * 60),
+    Job('update_currency_rates', 'update_currency_rates.py', deps=('migrate_schema',), timeout=15 * 60),
+    Job('update_prices', 'update_prices.py', deps=('migrate_schema',), timeout=4 * 3600),
+    Job('update_vm_types', 'update_vm_types.py', deps=('migrate_schema',), timeout=30 * 60,
+        requires_env=('CLOUDPRICE_API_KEY',)),
+    Job('build_price_matrix', 'build_price_matrix.py', deps=('update_prices',), timeout=30 * 60),
+    Job('archive_catalog', 'catalog_archive.py', deps=('update_prices',), timeout=60 * 60, args=('write',)),
+)}
+
+# Also taken by async_sync.py, under update_prices
+LOCK_SQL = "SELECT pg_try_advisory_lock(hashtext('azure_ingest:' || %s))"
+UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext('azure_ingest:' || %s))"
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    id SERIAL PRIMARY KEY,
+    orchestration TEXT NOT NULL,
+    job TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    duration_seconds DOUBLE PRECISION,
+    exit_code INTEGER,
+    host TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS job_runs_job_idx ON job_runs (job, started_at DESC);
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        # Keepalives: a lock connection sits idle for as long as its job runs
+        return psycopg2.connect(os.environ['DATABASE_URL'], keepalives=1, keepalives_idle=60, keepalives_interval=15)
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+# ── Locking ────────────────────────────────────────────────────────────────────
+@contextmanager
+def job_lock(conn, job):
+    """Hold the job's advisory lock on `conn` (autocommit); yields False if another run has it."""
+    cur = conn.cursor()
+    cur.execute(LOCK_SQL, (job,))
+    acquired = cur.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cur.execute(UNLOCK_SQL, (job,))
+        cur.close()
+
+
+# ── Run history ────────────────────────────────────────────────────────────────
+def ensure_job_runs_table(conn):
+    cur = conn.cursor()
+    cur.execute(CREATE_TABLE_SQL)
+    conn.commit()
+    cur.close()
+
+
+def record_run(conn, orchestration, job, status='running', error=None):
+    cur = conn.cursor()
+    if status == 'running':
+        # Holding the lock proves earlier 'running' rows of this job are leftovers of a crash
+        cur.execute(
+            "UPDATE job_runs SET status = 'abandoned', completed_at = NOW() WHERE job = %s AND status = 'running'",
+            (job,)
+        )
+    cur.execute(
+        "INSERT INTO job_runs (orchestration, job, status, host, error, completed_at) "
+        "VALUES (%s, %s, %s, %s, %s, CASE WHEN %s = 'running' THEN NULL ELSE NOW() END) RETURNING id",
+        (orchestration, job, status, socket.gethostname(), error, status)
+    )
+    run_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return run_id
+
+
+def complete_run(conn, run_id, status, exit_code, error=None):
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE job_runs SET status = %s, exit_code = %s, error = %s, completed_at = NOW(), "
+        "duration_seconds = EXTRACT(EPOCH FROM NOW() - started_at) WHERE id = %s",
+        (status, exit_code, error, run_id)
+    )
+    conn.commit()
+    cur.close()
+
+
+# ── Running one job ────────────────────────────────────────────────────────────
+def _kill(proc):
+    """Stop the job and every process it started (update_prices workers)."""
+    for sig, grace in ((signal.SIGTERM, KILL_GRACE_SECONDS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_subprocess(job, timeout):
+    """Run the job's script, streaming its output. Returns (status, exit code, output tail)."""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPTS_DIR, job.script), *job.args],
+        cwd=SCRIPTS_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+        env={**os.environ, 'PYTHONUNBUFFERED': '1'},
+        start_new_session=True,
+    )
+    tail = deque(maxlen=TAIL_LINES)
+
+    def pump():
+        for line in proc.stdout:
+            tail.append(line.rstrip())
+            print(f"[{job.name}] {line}", end='', flush=True)
+
+    reader = threading.Thread(target=pump, daemon=True)
+    reader.start()
+    try:
+        exit_code = proc.wait(timeout=timeout)
+        status = 'completed' if exit_code == 0 else 'failed'
+    except subprocess.TimeoutExpired:
+        _kill(proc)
+        exit_code = proc.returncode
+        status = 'timeout'
+        tail.append(f"Killed after {timeout}s timeout")
+    reader.join(timeout=5)
+    return status, exit_code, "\n".join(tail)
+
+
+def run_job(job, orchestration, timeout):
+    """Run one job under its advisory lock. Returns its final status."""
+    conn = get_db_connection()
+    conn.autocommit = True
+    try:
+        with job_lock(conn, job.name) as acquired:
+            if not acquired:
+                print(f"🔒 {job.name}: already running elsewhere, skipped")
+                record_run(conn, orchestration, job.name, 'locked', "advisory lock held by another run")
+                return 'locked'
+
+            run_id = record_run(conn, orchestration, job.name)
+            print(f"▶️  {job.name} (timeout {timeout}s)")
+            status, exit_code, tail = run_subprocess(job, timeout)
+            complete_run(conn, run_id, status, exit_code, tail if status != 'completed' else None)
+            icon = '✅' if status == 'completed' else '❌'
+            print(f"{icon} {job.name}: {status} (exit {exit_code})")
+            return status
+    finally:
+        conn.close()
+
+
+# ── DAG ────────────────────────────────────────────────────────────────────────
+def select_jobs(targets, with_deps=True):
+    """The targets plus, unless with_deps is False, everything upstream of them."""
+    selected = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name in selected:
+            continue
+        selected.add(name)
+        if with_deps:
+            stack.extend(JOBS[name].deps)
+    return selected
+
+
+def run_dag(names, timeouts):
+    """Run the selected jobs, each as soon as its selected dependencies completed."""
+    orchestration = uuid.uuid4().hex[:12]
+    # Short-lived connections only: the DAG can run for hours
+    conn = get_db_connection()
+    ensure_job_runs_table(conn)
+    conn.close()
+    print(f"🧭 Orchestration {orchestration}: {', '.join(sorted(names))}")
+
+    results = {}
+    pending = set(names)
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                job = JOBS[name]
+                deps = [d for d in job.deps if d in names]
+                blocked = [d for d in deps if d in results and results[d] != 'completed']
+                missing_env = [v for v in job.requires_env if not os.environ.get(v)]
+                if blocked or missing_env:
+                    reason = (f"upstream {', '.join(blocked)} did not complete" if blocked
+                              else f"{', '.join(missing_env)} not set")
+                    print(f"⏭️  {name}: skipped ({reason})")
+                    conn = get_db_connection()
+                    record_run(conn, orchestration, name, 'skipped', reason)
+                    conn.close()
+                    results[name] = 'skipped'
+                    pending.discard(name)
+                elif all(results.get(d) == 'completed' for d in deps):
+                    future = pool.submit(run_job, job, orchestration, timeouts.get(name, job.timeout))
+                    running[future] = name
+                    pending.discard(name)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"❌ {name}: {e}")
+                    results[name] = 'failed'
+    return results
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+def print_dag():
+    for job in JOBS.values():
+        deps = ', '.join(job.deps) or '-'
+        print(f"  {job.name:<24} after {deps:<24} timeout {job.timeout}s")
+
+
+def print_history(limit):
+    conn = get_db_connection()
+    ensure_job_runs_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT orchestration, job, status, started_at, duration_seconds, exit_code "
+        "FROM job_runs ORDER BY id DESC LIMIT %s",
+        (limit,)
+    )
+    for orchestration, job, status, started_at, duration, exit_code in cur.fetchall():
+        duration = f"{duration:.0f}s" if duration is not None else '-'
+        print(f"  {started_at:%Y-%m-%d %H:%M}  {orchestration}  {job:<24} {status:<10} {duration:>7}  exit {exit_code}")
+    cur.close()
+    conn.close()
+
+
+def parse_timeouts(values):
+    timeouts = {}
+    for value in values or ():
+        name, _, seconds = value.partition('=')
+        if name not in JOBS or not seconds.isdigit():
+            raise SystemExit(f"Invalid --timeout {value!r}: expected JOB=SECONDS")
+        timeouts[name] = int(seconds)
+    return timeouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the sync jobs as a dependency DAG.")
+    parser.add_argument('jobs', nargs='*', metavar='JOB',
+                        help=f"jobs to run (default: all). One of: {', '.join(JOBS)}")
+    parser.add_argument('--no-deps', action='store_true', help="don't pull in upstream jobs")
+    parser.add_argument('--timeout', action='append', metavar='JOB=SECONDS', help="override a job's timeout")
+    parser.add_argument('--list', action='store_true', help="show the DAG and exit")
+    parser.add_argument('--history', type=int, nargs='?', const=20, metavar='N', help="show the last N job runs")
+    args = parser.parse_args()
+
+    if args.list:
+        print_dag()
+        return
+    if args.history:
+        print_history(args.history)
+        return
+
+    unknown = [name for name in args.jobs if name not in JOBS]
+    if unknown:
+        parser.error(f"unknown job(s): {', '.join(unknown)}")
+    names = select_jobs(args.jobs or JOBS, with_deps=not args.no_deps)
+    results = run_dag(names, parse_timeouts(args.timeout))
+
+    print("\nJob results:")
+    for name in JOBS:
+        if name in results:
+            print(f"  {name:<24} {results[name]}")
+    if any(status in ('failed', 'timeout') for status in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""
+partition_prices.py
+───────────────────
+Converts `azure_prices` into a declaratively partitioned table, online:
+
+    azure_prices                          PARTITION BY LIST (service_name)
+    ├── azure_prices_p_<service>          PARTITION BY LIST (arm_region_name)
+    │   ├── azure_prices_p_<service>_americas / _europe / _apac / _mea
+    │   ├── azure_prices_p_<service>_sovereign / _global
+    │   └── azure_prices_p_<service>_default   regions not seen at migration time
+    └── azure_prices_p_default            services below --min-service-rows
+
+Every API query filters on service_name (and usually arm_region_name), so
+reads prune to one or a few leaf partitions, and VACUUM / REINDEX can run
+per partition (`maintain`).
+
+migrate:
+  1. builds azure_prices_partitioned with the same columns and indexes (the
+     canonical unique key already includes both partition columns)
+  2. installs a trigger on azure_prices that mirrors every write into the
+     new table while the copy runs
+  3. copies rows in ctid page ranges, one short transaction per batch
+     (re-running resumes from the last committed batch)
+  4. swaps the tables in one short transaction, which blocks writers but
+     not readers; dependent views and functions are recreated
+
+The old heap is kept as azure_prices_unpartitioned until `drop-old`.
+Batched copies use TID range scans (PostgreSQL 14+).
+
+Usage:
+    python partition_prices.py migrate [--batch-pages 1000] [--min-service-rows 20000]
+    python partition_prices.py status
+    python partition_prices.py maintain [--service "Virtual Machines"] [--reindex]
+    python partition_prices.py drop-old
+"""
+
+import os
+import re
+import sys
+import time
+import zlib
+import argparse
+import psycopg2
+from datetime import datetime
+from dotenv import load_dotenv
+from price_schema import CANONICAL_KEY, CANONICAL_KEY_INDEX, is_partitioned, require_schema
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+# ── Configuration ──────────────────────────────────────────────────────────────
+NEW_TABLE = 'azure_prices_partitioned'
+OLD_TABLE = 'azure_prices_unpartitioned'
+DELETES_TABLE = 'azure_prices_partition_deletes'
+PROGRESS_TABLE = 'azure_prices_partition_progress'
+MIRROR_FUNCTION = 'azure_prices_partition_mirror'
+
+# Region groups by name prefix; checked in order, first match wins.
+REGION_GROUPS = [
+    ('sovereign', ('usgov', 'usdod', 'ussec', 'usnat', 'china', 'germanycentral', 'germanynortheast')),
+    ('americas', ('eastus', 'westus', 'centralus', 'northcentralus', 'southcentralus',
+                  'westcentralus', 'canada', 'brazil', 'mexico', 'chile', 'us')),
+    ('europe', ('northeurope', 'westeurope', 'europe', 'uk', 'france', 'germany', 'switzerland',
+                'norway', 'sweden', 'poland', 'italy', 'spain', 'austria', 'belgium',
+                'denmark', 'finland', 'greece')),
+    ('apac', ('eastasia', 'southeastasia', 'asia', 'japan', 'korea', 'australia', 'centralindia',
+              'southindia', 'westindia', 'jioindia', 'india', 'newzealand', 'indonesia',
+              'malaysia', 'taiwan')),
+    ('mea', ('uae', 'qatar', 'southafrica', 'israel', 'saudiarabia', 'kuwait')),
+]
+GLOBAL_REGIONS = ('', 'global', 'Global')
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def region_group(region):
+    if region is None or region in GLOBAL_REGIONS:
+        return 'global'
+    name = region.lower()
+    for group, prefixes in REGION_GROUPS:
+        if name.startswith(prefixes):
+            return group
+    return None
+
+
+def partition_name(service):
+    """Stable, identifier-safe partition name for a service (≤ 63 chars with suffixes)."""
+    slug = re.sub(r'[^a-z0-9]+', '_', service.lower()).strip('_')
+    if len(slug) > 32 or not slug:
+        slug = f"{slug[:24]}_{zlib.crc32(service.encode('utf-8')):08x}"
+    return f"azure_prices_p_{slug}"
+
+
+def _literal_list(cur, values):
+    return ", ".join(cur.mogrify("%s", (v,)).decode('utf-8') for v in values)
+
+
+# ── Plan & build ───────────────────────────────────────────────────────────────
+def plan_partitions(conn, min_service_rows):
+    """Services that get their own partition, and region group → regions."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT service_name FROM azure_prices
+        WHERE service_name IS NOT NULL
+        GROUP BY service_name HAVING COUNT(*) >= %s
+        ORDER BY service_name
+    """, (min_service_rows,))
+    services = [row[0] for row in cur.fetchall()]
+
+    cur.execute("SELECT DISTINCT arm_region_name FROM azure_prices")
+    groups = {}
+    for (region,) in cur.fetchall():
+        group = region_group(region)
+        if group is not None:
+            groups.setdefault(group, []).append(region)
+    cur.close()
+    return services, groups
+
+
+def secondary_index_definitions(conn):
+    """Non-unique azure_prices indexes, rewritten to target the new table."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'azure_prices'::regclass AND NOT i.indisunique
+    """)
+    definitions = []
+    for name, definition in cur.fetchall():
+        new_name = f"{name[:60]}_p"
+        definition = definition.replace(f"INDEX {name} ON", f"INDEX {new_name} ON", 1)
+        definition = re.sub(r" ON (ONLY )?(public\.)?azure_prices ", f" ON {NEW_TABLE} ", definition, count=1)
+        definitions.append((name, new_name, definition))
+    cur.close()
+    return definitions
+
+
+def create_partitioned_table(conn, services, groups, key):
+    cur = conn.cursor()
+    cur.execute(f"""
+        CREATE TABLE {NEW_TABLE} (LIKE azure_prices INCLUDING DEFAULTS INCLUDING STORAGE)
+        PARTITION BY LIST (service_name)
+    """)
+
+    for service in services:
+        parent = partition_name(service)
+        cur.execute(f"""
+            CREATE TABLE {parent} PARTITION OF {NEW_TABLE}
+            FOR VALUES IN ({_literal_list(cur, [service])})
+            PARTITION BY LIST (arm_region_name)
+        """)
+        for group, regions in sorted(groups.items()):
+            values = list(regions)
+            if group == 'global' and None not in values:
+                values.append(None)
+            cur.execute(f"""
+                CREATE TABLE {parent}_{group} PARTITION OF {parent}
+                FOR VALUES IN ({_literal_list(cur, values)})
+            """)
+        cur.execute(f"CREATE TABLE {parent}_default PARTITION OF {parent} DEFAULT")
+    cur.execute(f"CREATE TABLE azure_prices_p_default PARTITION OF {NEW_TABLE} DEFAULT")
+
+    # The table is still empty, so plain (non-concurrent) index builds are instant
+    cur.execute(f"CREATE UNIQUE INDEX {CANONICAL_KEY_INDEX}_p ON {NEW_TABLE} ({', '.join(key)})")
+    for _, _, definition in secondary_index_definitions(conn):
+        cur.execute(definition)
+    conn.commit()
+    cur.close()
+
+
+def install_mirror_trigger(conn, key):
+    """Mirror writes on the old table into the new one until the swap."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+        FROM pg_attribute
+        WHERE attrelid = 'azure_prices'::regclass AND attnum > 0 AND NOT attisdropped
+    """)
+    columns = cur.fetchone()[0].split(', ')
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in key)
+    old_key = ", ".join(f"OLD.{c}" for c in key)
+    new_key = ", ".join(f"NEW.{c}" for c in key)
+    # meter_id / effective_start_date are never NULL and lead every index;
+    # the other key columns may be
+    match_old = " AND ".join(
+        f"{c} = OLD.{c}" if c in ('meter_id', 'effective_start_date') else f"{c} IS NOT DISTINCT FROM OLD.{c}"
+        for c in key
+    )
+
+    cur.execute(f"""
+        CREATE UNLOGGED TABLE IF NOT EXISTS {DELETES_TABLE} AS
+        SELECT {', '.join(key)} FROM azure_prices WITH NO DATA;
+
+        CREATE OR REPLACE FUNCTION {MIRROR_FUNCTION}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND ROW({old_key}) IS DISTINCT FROM ROW({new_key})) THEN
+                INSERT INTO {DELETES_TABLE} VALUES ({old_key});
+                DELETE FROM {NEW_TABLE} WHERE {match_old};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {NEW_TABLE} SELECT NEW.*
+                ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END
+        $$;
+
+        DROP TRIGGER IF EXISTS {MIRROR_FUNCTION} ON azure_prices;
+        CREATE TRIGGER {MIRROR_FUNCTION}
+            AFTER INSERT OR UPDATE OR DELETE ON azure_prices
+            FOR EACH ROW EXECUTE FUNCTION {MIRROR_FUNCTION}();
+
+        CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (next_page BIGINT NOT NULL);
+    """)
+    conn.commit()
+    cur.close()
+
+
+def copy_rows(conn, key, batch_pages):
+    """Copy azure_prices into the new table in ctid page ranges."""
+    cur = conn.cursor()
+    cur.execute(f"SELECT next_page FROM {PROGRESS_TABLE}")
+    row = cur.fetchone()
+    page = row[0] if row else 0
+    if row is None:
+        cur.execute(f"INSERT INTO {PROGRESS_TABLE} VALUES (0)")
+        conn.commit()
+
+    sql = f"""
+        INSERT INTO {NEW_TABLE}
+        SELECT * FROM azure_prices
+        WHERE ctid >= format('(%%s,0)', %(start)s::bigint)::tid
+          AND ctid <  format('(%%s,0)', %(end)s::bigint)::tid
+        ON CONFLICT ({', '.join(key)}) DO NOTHING
+    """
+    copied = 0
+    while True:
+        cur.execute("SELECT pg_relation_size('azure_prices') / current_setting('block_size')::bigint")
+        total_pages = cur.fetchone()[0]
+        if page >= total_pages:
+            break
+        end = page + batch_pages
+        cur.execute(sql, {'start': page, 'end': end})
+        copied += cur.rowcount
+        cur.execute(f"UPDATE {PROGRESS_TABLE} SET next_page = %s", (end,))
+        conn.commit()
+        page = end
+        sys.stdout.write(f"\r  Pages: {min(page, total_pages)}/{total_pages} | Rows copied: {copied}")
+        sys.stdout.flush()
+        # Leave room for concurrent writers and autovacuum between batches
+        time.sleep(0.05)
+    cur.close()
+    print(f"\r  Rows copied: {copied}{' ' * 30}")
+
+
+# ── Swap ───────────────────────────────────────────────────────────────────────
+def _dependents(cur):
+    """Views and functions bound to azure_prices (recreated after the swap)."""
+    cur.execute("""
+        SELECT DISTINCT v.oid::regclass::text, pg_get_viewdef(v.oid)
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = 'azure_prices'::regclass AND v.oid <> 'azure_prices'::regclass
+    """)
+    views = cur.fetchall()
+    cur.execute("""
+        SELECT p.oid::regprocedure::text, pg_get_functiondef(p.oid)
+        FROM pg_proc p
+        WHERE 'azure_prices'::regtype = ANY(p.proargtypes::oid[])
+    """)
+    functions = cur.fetchall()
+    return views, functions
+
+
+def swap_tables(conn, key, lock_timeout='5s', attempts=20):
+    cur = conn.cursor()
+    match = " AND ".join(f"n.{c} IS NOT DISTINCT FROM d.{c}" for c in key)
+    still_there = " AND ".join(f"o.{c} IS NOT DISTINCT FROM d.{c}" for c in key)
+
+    for attempt in range(1, attempts + 1):
+        try:
+            cur.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+            # EXCLUSIVE blocks writers only; API reads keep flowing until the rename
+            cur.execute("LOCK TABLE azure_prices IN EXCLUSIVE MODE")
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"  Lock busy, retrying ({attempt}/{attempts})...")
+            time.sleep(2)
+    else:
+        raise RuntimeError("Could not lock azure_prices for the swap")
+
+    # A batch may have copied a row whose delete committed after its snapshot
+    cur.execute(f"""
+        DELETE FROM {NEW_TABLE} n USING {DELETES_TABLE} d
+        WHERE {match}
+          AND NOT EXISTS (SELECT 1 FROM azure_prices o WHERE {still_there})
+    """)
+
+    views, functions = _dependents(cur)
+    indexes = [(name, new_name) for name, new_name, _ in secondary_index_definitions(conn)]
+    cur.execute("""
+        SELECT pg_get_serial_sequence('azure_prices', attname) FROM pg_attribute
+        WHERE attrelid = 'azure_prices'::regclass AND attname = 'id' AND NOT attisdropped
+    """)
+    row = cur.fetchone()
+    sequence = row[0] if row else None
+
+    if views:
+        cur.execute(f"DROP VIEW {', '.join(name for name, _ in views)}")
+    for signature, _ in functions:
+        cur.execute(f"DROP FUNCTION {signature}")
+
+    cur.execute(f"DROP TRIGGER {MIRROR_FUNCTION} ON azure_prices")
+    cur.execute(f"ALTER TABLE azure_prices RENAME TO {OLD_TABLE}")
+    cur.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO azure_prices")
+    for old_name, new_name in indexes:
+        cur.execute(f"ALTER INDEX {old_name} RENAME TO {old_name[:56]}_unpart")
+        cur.execute(f"ALTER INDEX IF EXISTS {new_name} RENAME TO {old_name}")
+    cur.execute(f"ALTER INDEX {CANONICAL_KEY_INDEX} RENAME TO {CANONICAL_KEY_INDEX}_unpart")
+    cur.execute(f"ALTER INDEX {CANONICAL_KEY_INDEX}_p RENAME TO {CANONICAL_KEY_INDEX}")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY azure_prices.id")
+
+    for _, definition in functions:
+        cur.execute(definition)
+    for name, definition in views:
+        cur.execute(f"CREATE VIEW {name} AS {definition}")
+
+    cur.execute(f"DROP TABLE {DELETES_TABLE}, {PROGRESS_TABLE}")
+    cur.execute(f"DROP FUNCTION {MIRROR_FUNCTION}()")
+    conn.commit()
+    cur.close()
+
+
+def migrate(conn, batch_pages, min_service_rows):
+    require_schema(conn)
+    if is_partitioned(conn):
+        print("azure_prices is already partitioned.")
+        return
+
+    key = list(CANONICAL_KEY)
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass(%s)", (NEW_TABLE,))
+    resuming = cur.fetchone()[0] is not None
+    cur.close()
+
+    if resuming:
+        print(f"▶  Resuming: {NEW_TABLE} already exists")
+    else:
+        services, groups = plan_partitions(conn, min_service_rows)
+        print(f"▶  Creating {NEW_TABLE}: {len(services)} service partitions × "
+              f"{len(groups)} region groups, key ({', '.join(key)})")
+        create_partitioned_table(conn, services, groups, key)
+
+    print("▶  Installing mirror trigger...")
+    install_mirror_trigger(conn, key)
+    print("▶  Copying rows...")
+    copy_rows(conn, key, batch_pages)
+    print("▶  Swapping tables...")
+    swap_tables(conn, key)
+    print("▶  ANALYZE azure_prices...")
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("ANALYZE azure_prices")
+    cur.close()
+    conn.autocommit = False
+
+
+# ── Operations on the partitioned table ────────────────────────────────────────
+def leaf_partitions(conn, service=None):
+    """(name, estimated rows, size) of every leaf, or only those of one service."""
+    root = 'azure_prices'
+    cur = conn.cursor()
+    if service is not None:
+        cur.execute("SELECT to_regclass(%s)", (partition_name(service),))
+        root = 'azure_prices_p_default' if cur.fetchone()[0] is None else partition_name(service)
+    cur.execute("""
+        SELECT t.relid::regclass::text,
+               c.reltuples::bigint,
+               pg_size_pretty(pg_total_relation_size(t.relid))
+        FROM pg_partition_tree(%s) t
+        JOIN pg_class c ON c.oid = t.relid
+        WHERE t.isleaf
+        ORDER BY 1
+    """, (root,))
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def status(conn):
+    if not is_partitioned(conn):
+        print("azure_prices is not partitioned (run: python partition_prices.py migrate)")
+        return
+    print(f"{'partition':<60} {'rows':>12} {'size':>10}")
+    for name, rows, size in leaf_partitions(conn):
+        print(f"{name:<60} {rows:>12} {size:>10}")
+
+
+def maintain(conn, service=None, reindex=False):
+    """VACUUM (ANALYZE) and optionally REINDEX CONCURRENTLY one partition at a time."""
+    conn.autocommit = True
+    cur = conn.cursor()
+    for name, _, _ in leaf_partitions(conn, service):
+        start = time.time()
+        cur.execute(f"VACUUM (ANALYZE) {name}")
+        if reindex:
+            cur.execute(f"REINDEX TABLE CONCURRENTLY {name}")
+        print(f"  {name} ({time.time() - start:.1f}s)")
+    cur.close()
+    conn.autocommit = False
+
+
+def drop_old(conn):
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {OLD_TABLE}")
+    conn.commit()
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition azure_prices by service and region group.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_migrate = sub.add_parser('migrate')
+    p_migrate.add_argument('--batch-pages', type=int, default=1000)
+    p_migrate.add_argument('--min-service-rows', type=int, default=20000)
+    sub.add_parser('status')
+    p_maintain = sub.add_parser('maintain')
+    p_maintain.add_argument('--service')
+    p_maintain.add_argument('--reindex', action='store_true')
+    sub.add_parser('drop-old')
+    args = parser.parse_args()
+
+    start = datetime.now()
+    conn = get_db_connection()
+    try:
+        if args.command == 'migrate':
+            migrate(conn, args.batch_pages, args.min_service_rows)
+        elif args.command == 'status':
+            status(conn)
+        elif args.command == 'maintain':
+            maintain(conn, args.service, args.reindex)
+        elif args.command == 'drop-old':
+            drop_old(conn)
+    finally:
+        conn.close()
+    print(f"✅ Done in {(datetime.now() - start).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+price_history.py
+────────────────
+Append-only log of retail price changes, written by the incremental sync.
+
+A row is appended only when a meter's price actually changes (or the meter is
+new), in the same transaction as the upsert that overwrites `azure_prices`.
+The table is range-partitioned by month on `changed_at`, so old months can be
+detached or dropped without touching the live catalog.
+
+The change feed (changes_since / GET /api/prices/changes) returns the deltas
+recorded after a (run id, meter id) keyset cursor, letting caches invalidate
+just what changed and page through runs of any size.
+
+Usage:
+    python price_history.py --since RUN_ID [--after METER_ID] [--service "Virtual Machines"]
+"""
+
+import os
+import sys
+import json
+import argparse
+import psycopg2
+from psycopg2 import extras
+from datetime import date
+from dotenv import load_dotenv
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS price_history (
+    meter_id              TEXT NOT NULL,
+    effective_start_date  TIMESTAMP,
+    currency_code         TEXT,
+    service_name          TEXT,
+    arm_region_name       TEXT,
+    old_price             DOUBLE PRECISION,
+    new_price             DOUBLE PRECISION,
+    run_id                INTEGER NOT NULL,
+    changed_at            TIMESTAMPTZ NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (changed_at);
+CREATE INDEX IF NOT EXISTS idx_price_history_run ON price_history(run_id);
+"""
+
+# Rows whose price differs from what is stored (LEFT JOIN: new meters count too),
+# matched on the full canonical key so each currency / region is compared with itself.
+# {source} is either "(VALUES %s)" for execute_values or a staging table name;
+# its columns are CANONICAL_KEY followed by retail_price.
+CHANGES_SQL = """
+INSERT INTO price_history (meter_id, effective_start_date, currency_code, service_name, arm_region_name,
+                           old_price, new_price, run_id)
+SELECT v.meter_id, v.effective_start_date, v.currency_code, v.service_name, v.arm_region_name,
+       p.retail_price, v.retail_price, {run_id}
+FROM {source} AS v (meter_id, effective_start_date, currency_code, service_name, arm_region_name, retail_price)
+LEFT JOIN azure_prices p
+       ON p.meter_id = v.meter_id
+      AND p.effective_start_date = v.effective_start_date
+      AND p.currency_code = v.currency_code
+      AND p.service_name = v.service_name
+      AND p.arm_region_name = v.arm_region_name
+WHERE p.retail_price IS DISTINCT FROM v.retail_price
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def _month_start(d, offset=0):
+    month = d.month - 1 + offset
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_history_table(conn, today=None):
+    """Create price_history plus partitions for this month and next month."""
+    today = today or date.today()
+    cur = conn.cursor()
+    cur.execute(CREATE_TABLE_SQL)
+    for offset in (0, 1):
+        start, end = _month_start(today, offset), _month_start(today, offset + 1)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS price_history_{start:%Y_%m} "
+            f"PARTITION OF price_history FOR VALUES FROM (%s) TO (%s)",
+            (start, end)
+        )
+    conn.commit()
+    cur.close()
+
+
+def add_key_columns(conn):
+    """Add currency_code / arm_region_name to a price_history created before they existed."""
+    ensure_history_table(conn)
+    cur = conn.cursor()
+    cur.execute("""
+        ALTER TABLE price_history
+            ADD COLUMN IF NOT EXISTS currency_code TEXT,
+            ADD COLUMN IF NOT EXISTS arm_region_name TEXT
+    """)
+    conn.commit()
+    cur.close()
+
+
+def record_price_changes(cur, run_id, values):
+    """
+    Append history rows for a batch about to be upserted.
+    values: [(meter_id, effective_start_date, currency_code, service_name, arm_region_name, retail_price), ...]
+    Must run before the upsert, inside the same transaction.
+    """
+    if not values:
+        return 0
+    extras.execute_values(
+        cur,
+        CHANGES_SQL.format(run_id=int(run_id), source="(VALUES %s)"),
+        values,
+        template="(%s, %s::timestamp, %s, %s, %s, %s::double precision)",
+        page_size=len(values)
+    )
+    return cur.rowcount
+
+
+def changes_since(conn, since_run_id, since_meter_id=None, service_name=None, limit=None):
+    """
+    Return price deltas after the keyset cursor (since_run_id, since_meter_id),
+    oldest first; without a meter id, after the whole run. With a limit the page
+    is extended to the end of its last meter, so (run_id, meter_id) of the last
+    row is always a safe next cursor.
+    """
+    # A NULL meter id makes the row comparison false within since_run_id itself.
+    # The lower bound on changed_at lets Postgres prune older monthly partitions.
+    where = """
+        (h.run_id, h.meter_id) > (%(run_id)s, %(meter_id)s::text)
+        AND h.changed_at >= COALESCE(
+              (SELECT started_at FROM sync_log WHERE id = %(run_id)s), '-infinity')
+    """
+    args = {'run_id': since_run_id, 'meter_id': since_meter_id, 'service': service_name, 'limit': limit}
+    if service_name:
+        where += " AND h.service_name = %(service)s"
+    columns = """
+        h.run_id, h.meter_id, h.effective_start_date, h.currency_code, h.service_name,
+        h.arm_region_name, h.old_price, h.new_price, h.changed_at
+    """
+    order = "ORDER BY h.run_id, h.meter_id, h.effective_start_date, h.currency_code"
+    if limit:
+        sql = f"""
+            WITH page_end AS (
+                SELECT run_id, meter_id FROM (
+                    SELECT h.run_id, h.meter_id FROM price_history h
+                    WHERE {where}
+                    ORDER BY h.run_id, h.meter_id LIMIT %(limit)s
+                ) page
+                ORDER BY run_id DESC, meter_id DESC LIMIT 1
+            )
+            SELECT {columns} FROM price_history h, page_end e
+            WHERE {where} AND (h.run_id, h.meter_id) <= (e.run_id, e.meter_id)
+            {order}
+        """
+    else:
+        sql = f"SELECT {columns} FROM price_history h WHERE {where} {order}"
+
+    cur = conn.cursor(cursor_factory=extras.RealDictCursor)
+    cur.execute(sql, args)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the price change feed since a sync run.")
+    parser.add_argument('--since', type=int, required=True, help="Last run id already seen")
+    parser.add_argument('--after', help="Last meter id already seen in that run")
+    parser.add_argument('--service', help="Only changes for this serviceName")
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        for row in changes_since(conn, args.since, args.after, args.service, args.limit):
+            print(json.dumps(row, default=str))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
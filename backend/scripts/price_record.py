@@ -0,0 +1,77 @@
+"""
+price_record.py
+───────────────
+Compact in-memory form of one API price item.
+
+A decoded item is a dict of ~25 keys (≈1–2 KB with its hash table); batches,
+dedupe maps and sorts used to hold thousands of them. A PriceRecord keeps
+only what a row needs – the typed column values and the item's raw_data text
+(rendered once, per RAW_DATA_MODE) – in __slots__, with repeated names
+interned, so the page dict can be freed as soon as its records are built.
+
+Loaders filter the decoded dicts, build records with PriceRecord.from_item()
+and pass records on to price_rows.build_row() / copy_line(). record.get()
+answers the API field names it holds, so key functions written against items
+(price_schema.partition_order) accept records.
+"""
+
+from sys import intern
+from operator import attrgetter
+from price_rows import COLUMN_FIELDS, VALUE_COLUMNS, raw_data_for
+
+# Low-cardinality text columns: the decoder allocates a fresh string per item,
+# interning collapses them to one shared copy per distinct value
+INTERNED_COLUMNS = frozenset({
+    'service_name', 'service_id', 'service_family', 'product_name', 'sku_name',
+    'arm_region_name', 'location', 'currency_code', 'effective_start_date',
+    'type', 'reservation_term',
+})
+
+_SLOT_FOR_FIELD = {field: column for column, field in COLUMN_FIELDS}
+_FIELDS = [(column, field, column in INTERNED_COLUMNS) for column, field in COLUMN_FIELDS]
+_values = attrgetter(*VALUE_COLUMNS)
+
+
+class PriceRecord:
+    __slots__ = tuple(VALUE_COLUMNS)
+
+    @classmethod
+    def from_item(cls, item, raw=None):
+        """
+        Record for a decoded API item. `raw` is the item's original JSON text,
+        when the caller has it (see json_codec.page_items_with_raw).
+        """
+        record = cls.__new__(cls)
+        for column, field, shared in _FIELDS:
+            value = item.get(field)
+            if shared and type(value) is str:
+                value = intern(value)
+            setattr(record, column, value)
+        record.raw_data = raw_data_for(item, raw)
+        return record
+
+    def get(self, field, default=None):
+        """Value of an API item field held by the record (item.get() stand-in)."""
+        column = _SLOT_FOR_FIELD.get(field)
+        if column is None:
+            return default
+        return getattr(self, column)
+
+    @property
+    def key(self):
+        """(meterId, effectiveStartDate) – the loaders' per-batch dedupe key."""
+        return (self.meter_id, self.effective_start_date)
+
+    def values(self):
+        """Column values in VALUE_COLUMNS order."""
+        return _values(self)
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        for column, value in zip(VALUE_COLUMNS, state):
+            setattr(self, column, value)
+
+    def __repr__(self):
+        return f"PriceRecord({self.meter_id!r}, {self.service_name!r}, {self.arm_region_name!r}, {self.retail_price!r})"
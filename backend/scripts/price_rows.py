@@ -0,0 +1,89 @@
+"""
+price_rows.py
+─────────────
+Shared mapping from Azure Retail Prices API items to `azure_prices` rows.
+Every loader builds its INSERT from COLUMN_SQL / values_template() and its
+rows from build_row(), so the column list and value order live in one place.
+Rows are rendered from price_record.PriceRecord, not from the API dicts.
+
+raw_data storage mode (RAW_DATA_MODE env var):
+    residual (default) – raw_data keeps only the item fields that have no
+                         dedicated column; azure_price_item(p) rebuilds the
+                         full item on demand (see slim_raw_data.py)
+    full               – raw_data stores the complete API item; loaders pass
+                         the API's own item text through when json_codec
+                         can (see json_codec.page_items)
+"""
+
+import os
+import json_codec
+
+RAW_DATA_MODE = os.environ.get('RAW_DATA_MODE', 'residual').lower()
+
+# azure_prices column → API item field (typed columns, in insert order)
+COLUMN_FIELDS = [
+    ('meter_id', 'meterId'),
+    ('sku_id', 'skuId'),
+    ('service_name', 'serviceName'),
+    ('service_id', 'serviceId'),
+    ('service_family', 'serviceFamily'),
+    ('product_name', 'productName'),
+    ('sku_name', 'skuName'),
+    ('arm_region_name', 'armRegionName'),
+    ('location', 'location'),
+    ('currency_code', 'currencyCode'),
+    ('retail_price', 'retailPrice'),
+    ('unit_price', 'unitPrice'),
+    ('effective_start_date', 'effectiveStartDate'),
+    ('type', 'type'),
+    ('reservation_term', 'reservationTerm'),
+]
+
+COLUMNS = [column for column, _ in COLUMN_FIELDS] + ['raw_data']
+COLUMN_SQL = ", ".join(COLUMNS)
+
+# Column order of COPY text and the staging table (the same row shape)
+VALUE_COLUMNS = COLUMNS
+
+# Item fields already held in typed columns, i.e. dropped from residual raw_data
+COLUMN_ITEM_FIELDS = [field for _, field in COLUMN_FIELDS]
+_COLUMN_ITEM_FIELD_SET = frozenset(COLUMN_ITEM_FIELDS)
+
+
+def residual_item(item):
+    """The part of an API item that has no dedicated column."""
+    return {k: v for k, v in item.items() if k not in _COLUMN_ITEM_FIELD_SET}
+
+
+def raw_data_for(item, raw=None):
+    """
+    raw_data text for an item. `raw` is the item's original JSON text, when
+    the caller has it; in full mode it is stored as-is instead of re-encoded.
+    """
+    if RAW_DATA_MODE == 'full':
+        return raw if raw is not None else json_codec.dumps(item)
+    return json_codec.dumps(residual_item(item))
+
+
+def values_template(*extra):
+    """execute_values template for COLUMNS, plus literal SQL for extra columns."""
+    return "(" + ", ".join(["%s"] * len(COLUMNS) + list(extra)) + ")"
+
+
+def _copy_field(value):
+    if value is None:
+        return '\\N'
+    if not isinstance(value, str):
+        return str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_line(record):
+    """One line of COPY text format for a PriceRecord, in VALUE_COLUMNS order."""
+    return "\t".join(_copy_field(v) for v in record.values()) + "\n"
+
+
+def build_row(record):
+    """One azure_prices row for a PriceRecord, in COLUMNS order."""
+    return record.values()
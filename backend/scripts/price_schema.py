@@ -0,0 +1,74 @@
+"""
+price_schema.py
+───────────────
+The canonical `azure_prices` schema contract shared by the loaders.
+
+migrate_schema.py converges any existing database onto one key and index
+set and records the applied version in `schema_migrations`. Loaders call
+require_schema() before writing, so their upserts always have the canonical
+unique index behind them, whichever script created the table first.
+
+The table may be a plain heap or list-partitioned by service_name / region
+group (see partition_prices.py); the canonical key includes both partition
+columns, so it is valid for either layout.
+"""
+
+import sys
+
+# Bump together with a new entry in migrate_schema.MIGRATIONS
+SCHEMA_VERSION = 6
+
+PARTITION_COLUMNS = ('service_name', 'arm_region_name')
+
+# Unique upsert key: a meter price is identified per currency; the partition
+# columns are part of it so the same index works on a partitioned table.
+CANONICAL_KEY = ('meter_id', 'effective_start_date', 'currency_code', 'service_name', 'arm_region_name')
+CANONICAL_KEY_INDEX = 'idx_prices_canonical_key'
+
+# Column list for `ON CONFLICT (...)`
+CONFLICT_TARGET = ", ".join(CANONICAL_KEY)
+
+
+def schema_version(conn):
+    """Highest applied migration, or None when the runner has never been run."""
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('schema_migrations')")
+    if cur.fetchone()[0] is None:
+        cur.close()
+        return None
+    cur.execute("SELECT MAX(version) FROM schema_migrations")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+
+def require_schema(conn):
+    """Exit unless the database is exactly on SCHEMA_VERSION."""
+    version = schema_version(conn)
+    conn.commit()
+    if version != SCHEMA_VERSION:
+        print(f"Error: azure_prices schema version is {version}, this loader requires {SCHEMA_VERSION}.")
+        print("Run: python migrate_schema.py")
+        sys.exit(1)
+
+
+def is_partitioned(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('azure_prices')")
+    row = cur.fetchone()
+    cur.close()
+    return bool(row and row[0])
+
+
+def partition_order(item):
+    """
+    Sort key for API items: rows for the same partition stay adjacent, so a
+    batch is routed partition by partition, and the order stays deterministic
+    (consistent lock order between concurrent loaders).
+    """
+    return (
+        item.get('serviceName') or '',
+        item.get('armRegionName') or '',
+        item.get('meterId') or '',
+        item.get('effectiveStartDate') or '',
+    )
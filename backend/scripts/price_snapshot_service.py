@@ -0,0 +1,359 @@
+"""
+price_snapshot_service.py
+─────────────────────────
+In-memory read cache for the calculator's price lookups (queryPrices in
+src/db.js). The active USD catalog only changes when an ingest job publishes a
+new catalog epoch, so this service holds it in memory and answers
+queryPrices-style requests without touching Postgres.
+
+The snapshot is columnar:
+
+  - one array('d') per price column and one list per text column (values are
+    interned, so each distinct string is stored once)
+  - rows are loaded in retail_price order, so a row id order is a price order
+  - sorted row-id indexes per (service, region), per service and per region
+
+A request picks the narrowest index for its service/region, scans it in price
+order applying the remaining filters (type, product, SKU, search) and stops at
+the limit.
+
+A watcher thread polls catalog_epoch every SNAPSHOT_POLL_SECONDS (default 30).
+When the epoch changes it builds a new snapshot next to the old one and swaps
+it in with one assignment. A request always reads a single consistent
+snapshot.
+
+API (PRICE_SNAPSHOT_PORT, default 8765, bound to 127.0.0.1):
+
+    GET /prices?serviceName=&armRegionName=&currencyCode=&type=&productName=&skuName=&search=&limit=
+        → {"epoch": N, "items": [...]}   items in the shape of rowToItemLean()
+    GET /health
+        → {"epoch": N, "rows": N, "loadedAt": "...", "loadSeconds": N}
+
+The API returns 503 until the first snapshot is loaded. Node uses the service
+when PRICE_SNAPSHOT_URL is set. It falls back to SQL if the service is down,
+or if the service is behind the epoch Node already knows about.
+
+Usage:
+    python price_snapshot_service.py
+"""
+
+import os
+import gc
+import sys
+import time
+import threading
+import psycopg2
+from array import array
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+import json_codec
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+PORT = int(os.environ.get('PRICE_SNAPSHOT_PORT', 8765))
+HOST = os.environ.get('PRICE_SNAPSHOT_HOST', '127.0.0.1')
+POLL_SECONDS = float(os.environ.get('SNAPSHOT_POLL_SECONDS', 30))
+DEFAULT_LIMIT = 200
+FETCH_ROWS = 20000
+
+# Same rows and derived fields as queryPrices(), in price order
+SNAPSHOT_SQL = """
+SELECT
+    p.meter_id,
+    p.sku_id,
+    p.service_name,
+    p.service_id,
+    p.service_family,
+    p.product_name,
+    p.sku_name,
+    p.arm_region_name,
+    p.location,
+    p.retail_price,
+    p.unit_price,
+    p.effective_start_date,
+    p.type,
+    p.reservation_term,
+    p.raw_data->>'meterName' AS meter_name,
+    p.raw_data->>'unitOfMeasure' AS unit_of_measure,
+    p.raw_data->>'armSkuName' AS arm_sku_name,
+    (p.raw_data->>'cores')::int AS cores,
+    (p.raw_data->>'ram')::numeric::text AS ram
+FROM azure_prices p
+WHERE p.currency_code = 'USD' AND p.is_active = TRUE
+ORDER BY p.retail_price ASC, p.id
+"""
+
+EPOCH_SQL = "SELECT COALESCE(MAX(epoch), 0) FROM catalog_epoch"
+
+TEXT_COLUMNS = (
+    'meter_id', 'sku_id', 'service_name', 'service_id', 'service_family', 'product_name',
+    'sku_name', 'arm_region_name', 'location', 'effective_start_date', 'type',
+    'reservation_term', 'meter_name', 'unit_of_measure', 'arm_sku_name', 'ram',
+)
+
+# Query parameter → column filtered by equality
+EQUALITY_FILTERS = (('type', 'type'), ('productName', 'product_name'), ('skuName', 'sku_name'))
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def current_epoch(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute(EPOCH_SQL)
+        return cur.fetchone()[0]
+    except psycopg2.errors.UndefinedTable:
+        # No ingest job has published yet
+        return 0
+    finally:
+        conn.rollback()
+        cur.close()
+
+
+def _iso(value):
+    # node-pg renders TIMESTAMP columns as UTC ISO strings
+    return value.isoformat(timespec='milliseconds') + 'Z' if value is not None else None
+
+
+# ── Snapshot ───────────────────────────────────────────────────────────────────
+class Snapshot:
+    """One immutable, columnar copy of the active USD catalog."""
+
+    def __init__(self, conn, epoch):
+        start = time.perf_counter()
+        self.epoch = epoch
+        self.columns = {name: [] for name in TEXT_COLUMNS}
+        self.retail_price = array('d')
+        self.unit_price = array('d')
+        self.cores = []
+        self.by_service_region = {}
+        self.by_service = {}
+        self.by_region = {}
+        self._lower = {}
+
+        interned = {}
+        texts = [self.columns[name] for name in TEXT_COLUMNS]
+        cur = conn.cursor(name='price_snapshot')
+        cur.itersize = FETCH_ROWS
+        cur.execute(SNAPSHOT_SQL)
+        # Nothing here is cyclic: keep the collector out of the bulk load
+        gc.disable()
+        try:
+            for row_id, row in enumerate(cur):
+                (meter_id, sku_id, service_name, service_id, service_family, product_name,
+                 sku_name, region, location, retail_price, unit_price, effective_start_date,
+                 price_type, reservation_term, meter_name, unit_of_measure, arm_sku_name,
+                 cores, ram) = row
+                values = (meter_id, sku_id, service_name, service_id, service_family, product_name,
+                          sku_name, region, location, _iso(effective_start_date), price_type,
+                          reservation_term, meter_name, unit_of_measure, arm_sku_name, ram)
+                for column, value in zip(texts, values):
+                    column.append(interned.setdefault(value, value) if value is not None else None)
+                # node-pg: NULL * rate is 0
+                self.retail_price.append(retail_price or 0.0)
+                self.unit_price.append(unit_price or 0.0)
+                self.cores.append(cores)
+
+                self.by_service_region.setdefault((service_name, region), array('i')).append(row_id)
+                self.by_service.setdefault(service_name, array('i')).append(row_id)
+                self.by_region.setdefault(region, array('i')).append(row_id)
+        finally:
+            gc.enable()
+            cur.close()
+            conn.rollback()
+
+        self.rows = len(self.retail_price)
+        self.rates = self._load_rates(conn)
+        self.loaded_at = datetime.now(timezone.utc)
+        self.load_seconds = round(time.perf_counter() - start, 2)
+        gc.collect()
+        gc.freeze()
+
+    @staticmethod
+    def _load_rates(conn):
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT currency_code, rate_from_usd FROM currency_rates")
+            return {code: rate for code, rate in cur.fetchall()}
+        except psycopg2.errors.UndefinedTable:
+            return {}
+        finally:
+            conn.rollback()
+            cur.close()
+
+    def _lowered(self, value):
+        lowered = self._lower.get(value)
+        if lowered is None:
+            lowered = self._lower[value] = value.lower()
+        return lowered
+
+    def candidates(self, service, region):
+        """Row ids in price order of the narrowest index for the request."""
+        if service and region:
+            return self.by_service_region.get((service, region), ())
+        if service:
+            return self.by_service.get(service, ())
+        if region:
+            return self.by_region.get(region, ())
+        return range(self.rows)
+
+    def query(self, serviceName=None, armRegionName=None, currencyCode='USD', search=None,
+              limit=DEFAULT_LIMIT, **filters):
+        """queryPrices() over the snapshot → item dicts, cheapest first."""
+        equality = [
+            (self.columns[column], filters[param])
+            for param, column in EQUALITY_FILTERS if filters.get(param)
+        ]
+        needle = search.lower() if search else None
+        searched = (self.columns['product_name'], self.columns['sku_name'], self.columns['meter_name'])
+
+        rows = []
+        for row_id in self.candidates(serviceName, armRegionName):
+            if limit is not None and len(rows) >= limit:
+                break
+            if any(column[row_id] != value for column, value in equality):
+                continue
+            if needle and not any(
+                column[row_id] is not None and needle in self._lowered(column[row_id]) for column in searched
+            ):
+                continue
+            rows.append(row_id)
+
+        rate = self.rates.get(currencyCode, 1.0)
+        return [self.item(row_id, rate, currencyCode) for row_id in rows]
+
+    def item(self, row_id, rate, currency):
+        c = self.columns
+        return {
+            'meterId': c['meter_id'][row_id],
+            'skuId': c['sku_id'][row_id],
+            'serviceName': c['service_name'][row_id],
+            'serviceId': c['service_id'][row_id],
+            'serviceFamily': c['service_family'][row_id],
+            'productName': c['product_name'][row_id],
+            'skuName': c['sku_name'][row_id],
+            'armRegionName': c['arm_region_name'][row_id],
+            'location': c['location'][row_id],
+            'retailPrice': self.retail_price[row_id] * rate,
+            'unitPrice': self.unit_price[row_id] * rate,
+            'currencyCode': currency,
+            'effectiveStartDate': c['effective_start_date'][row_id],
+            'type': c['type'][row_id],
+            'reservationTerm': c['reservation_term'][row_id],
+            'meterName': c['meter_name'][row_id] or None,
+            'unitOfMeasure': c['unit_of_measure'][row_id] or None,
+            'armSkuName': c['arm_sku_name'][row_id] or None,
+            'cores': self.cores[row_id] or None,
+            'ram': c['ram'][row_id] or None,
+        }
+
+
+SNAPSHOT = None
+
+
+def load_snapshot(conn, epoch):
+    global SNAPSHOT
+    print(f"📥 Loading catalog epoch {epoch}...")
+    snapshot = Snapshot(conn, epoch)
+    # Requests hold a reference to whichever snapshot they started with
+    SNAPSHOT = snapshot
+    print(f"✅ Snapshot epoch {epoch}: {snapshot.rows} rows, {len(snapshot.by_service_region)} "
+          f"(service, region) indexes in {snapshot.load_seconds}s")
+
+
+def watch_epoch():
+    """Reload whenever an ingest job publishes a new catalog epoch."""
+    conn = None
+    while True:
+        try:
+            if conn is None or conn.closed:
+                conn = get_db_connection()
+            epoch = current_epoch(conn)
+            if SNAPSHOT is None or epoch != SNAPSHOT.epoch:
+                load_snapshot(conn, epoch)
+        except Exception as e:
+            print(f"Warning: snapshot reload failed: {e}")
+            if conn is not None:
+                conn.close()
+            conn = None
+        time.sleep(POLL_SECONDS)
+
+
+# ── HTTP API ───────────────────────────────────────────────────────────────────
+def parse_limit(value):
+    if value == 'all':
+        return None
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, status, payload):
+        body = json_codec.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        snapshot = SNAPSHOT
+        if snapshot is None:
+            self._send(503, {'error': 'snapshot not loaded yet'})
+            return
+
+        if url.path == '/health':
+            self._send(200, {
+                'epoch': snapshot.epoch,
+                'rows': snapshot.rows,
+                'loadedAt': snapshot.loaded_at.isoformat(),
+                'loadSeconds': snapshot.load_seconds,
+            })
+        elif url.path == '/prices':
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            items = snapshot.query(
+                serviceName=params.get('serviceName'),
+                armRegionName=params.get('armRegionName'),
+                currencyCode=params.get('currencyCode') or 'USD',
+                type=params.get('type'),
+                productName=params.get('productName'),
+                skuName=params.get('skuName'),
+                search=params.get('search'),
+                limit=parse_limit(params.get('limit', DEFAULT_LIMIT)),
+            )
+            self._send(200, {'epoch': snapshot.epoch, 'items': items})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    threading.Thread(target=watch_epoch, daemon=True).start()
+    server = ThreadingHTTPServer((HOST, PORT), _Handler)
+    print(f"🗂️  Price snapshot service on http://{HOST}:{PORT} (polling catalog epoch every {POLL_SECONDS:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+profiling.py
+────────────
+Opt-in CPU and memory profiling for the sync scripts.
+
+Run a job with `--profile` (or INGEST_PROFILE=1) and profile_run() wraps it in:
+
+  - cProfile for the whole run (main process / main thread)
+  - tracemalloc, with a sampler thread recording the top allocators, traced
+    memory and RSS every INGEST_PROFILE_INTERVAL seconds (default 30)
+  - per-stage memory: every TELEMETRY.stage() also records the traced memory
+    it allocated and its peak
+
+When the job ends a bundle is written to INGEST_PROFILE_DIR (default
+scripts/profiles/<job>-<timestamp>/):
+
+    summary.json      job, argv, duration, peak RSS, traced peak, stage timings
+    stages.json       per-stage seconds, calls, allocated and peak bytes
+    memory.json       the periodic samples (RSS, traced, top allocators)
+    cpu.pstats        raw cProfile data (snakeviz / pstats)
+    cpu.txt           top functions by cumulative and own time
+
+Worker processes of the parallel paths are not profiled; their stage times
+still show up through telemetry.
+
+Usage:
+    python profiling.py list
+    python profiling.py compare BUNDLE_A BUNDLE_B
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import argparse
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from telemetry import TELEMETRY
+
+PROFILE_DIR = os.environ.get('INGEST_PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+SAMPLE_SECONDS = float(os.environ.get('INGEST_PROFILE_INTERVAL', 30))
+TRACE_FRAMES = 10
+TOP_ALLOCATORS = 15
+
+
+def profiling_requested(flag=False):
+    return flag or '--profile' in sys.argv or os.environ.get('INGEST_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+
+def _rss_bytes():
+    """Current resident set size (Linux); None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _top_allocators(limit=TOP_ALLOCATORS):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [
+        {'where': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+class RunProfiler:
+    def __init__(self, job):
+        self.job = job
+        self.started_at = datetime.now()
+        self.samples = []
+        self.stage_memory = {}
+        self._stage_start = {}
+        self._traced_peak = 0
+        self._cpu = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._t0 = None
+
+    # ── Lifecycle ──────────────────────────────────────────────────────────────
+    def start(self):
+        self._t0 = time.perf_counter()
+        tracemalloc.start(TRACE_FRAMES)
+        self._sampler.start()
+        self._cpu.enable()
+
+    def stop(self):
+        self._cpu.disable()
+        self._stop.set()
+        self._sampler.join()
+        self._sample()
+        self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+        self.final_allocators = _top_allocators()
+        tracemalloc.stop()
+        self.duration = time.perf_counter() - self._t0
+
+    def _sample_loop(self):
+        while not self._stop.wait(SAMPLE_SECONDS):
+            self._sample()
+
+    def _sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.samples.append({
+            'elapsed': round(time.perf_counter() - self._t0, 1),
+            'rss': _rss_bytes(),
+            'traced': current,
+            'traced_peak': peak,
+            'top': _top_allocators(),
+        })
+
+    # ── Stage hooks (called by telemetry.JobTelemetry.stage) ───────────────────
+    def stage_enter(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        self._traced_peak = max(self._traced_peak, peak)
+        tracemalloc.reset_peak()
+        self._stage_start[name] = current
+
+    def stage_exit(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        self._traced_peak = max(self._traced_peak, peak)
+        start = self._stage_start.pop(name, current)
+        memory = self.stage_memory.setdefault(name, {'allocated': 0, 'peak': 0})
+        memory['allocated'] += current - start
+        memory['peak'] = max(memory['peak'], peak - start)
+
+    # ── Bundle ─────────────────────────────────────────────────────────────────
+    def write_bundle(self):
+        path = os.path.join(PROFILE_DIR, f"{self.job}-{self.started_at:%Y%m%dT%H%M%S}-{os.getpid()}")
+        os.makedirs(path, exist_ok=True)
+
+        telemetry = TELEMETRY.summary()
+        stages = {
+            name: {**timing, **self.stage_memory.get(name, {})}
+            for name, timing in telemetry['stages'].items()
+        }
+        summary = {
+            'job': self.job,
+            'argv': sys.argv,
+            'started_at': self.started_at.isoformat(),
+            'duration_seconds': round(self.duration, 3),
+            'peak_rss': _peak_rss_bytes(),
+            'traced_peak': self._traced_peak,
+            'stages': stages,
+            'counters': telemetry['counters'],
+            'top_allocators': self.final_allocators,
+        }
+        with open(os.path.join(path, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(path, 'stages.json'), 'w') as f:
+            json.dump(stages, f, indent=2)
+        with open(os.path.join(path, 'memory.json'), 'w') as f:
+            json.dump(self.samples, f)
+
+        self._cpu.dump_stats(os.path.join(path, 'cpu.pstats'))
+        text = io.StringIO()
+        stats = pstats.Stats(self._cpu, stream=text).strip_dirs()
+        text.write("── by cumulative time ──\n")
+        stats.sort_stats('cumulative').print_stats(40)
+        text.write("\n── by own time ──\n")
+        stats.sort_stats('tottime').print_stats(40)
+        with open(os.path.join(path, 'cpu.txt'), 'w') as f:
+            f.write(text.getvalue())
+        return path
+
+
+@contextmanager
+def profile_run(job, enabled=None):
+    """Profile the enclosed run when enabled (default: --profile / INGEST_PROFILE)."""
+    if enabled is None:
+        enabled = profiling_requested()
+    if not enabled:
+        yield None
+        return
+
+    profiler = RunProfiler(job)
+    print(f"🔬 Profiling {job} (samples every {SAMPLE_SECONDS:g}s)")
+    TELEMETRY.profiler = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        TELEMETRY.profiler = None
+        path = profiler.write_bundle()
+        print(f"🔬 Profile: {path} (peak RSS {_peak_rss_bytes() / 2**20:.0f} MB)")
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+def _load_summary(bundle):
+    if not os.path.isabs(bundle) and not os.path.exists(bundle):
+        bundle = os.path.join(PROFILE_DIR, bundle)
+    with open(os.path.join(bundle, 'summary.json')) as f:
+        return json.load(f)
+
+
+def list_bundles():
+    if not os.path.isdir(PROFILE_DIR):
+        print(f"No profiles in {PROFILE_DIR}")
+        return
+    for name in sorted(os.listdir(PROFILE_DIR)):
+        try:
+            summary = _load_summary(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            continue
+        print(f"{name:<48} {summary['duration_seconds']:>9.1f}s  peak RSS {summary['peak_rss'] / 2**20:>7.0f} MB")
+
+
+def compare(a, b):
+    sa, sb = _load_summary(a), _load_summary(b)
+
+    def row(label, va, vb, unit=''):
+        delta = f"{(vb - va) / va * 100:+.1f}%" if va else ''
+        print(f"  {label:<22} {va:>12.2f}{unit} {vb:>12.2f}{unit} {delta:>9}")
+
+    print(f"  {'':<22} {'A':>12} {'B':>12}")
+    row('duration (s)', sa['duration_seconds'], sb['duration_seconds'])
+    row('peak RSS (MB)', sa['peak_rss'] / 2**20, sb['peak_rss'] / 2**20)
+    row('traced peak (MB)', sa['traced_peak'] / 2**20, sb['traced_peak'] / 2**20)
+    for name in sorted(set(sa['stages']) | set(sb['stages'])):
+        row(f"{name} (s)",
+            sa['stages'].get(name, {}).get('seconds', 0.0),
+            sb['stages'].get(name, {}).get('seconds', 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect profile bundles written by --profile runs.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="list bundles")
+    compare_cmd = sub.add_parser('compare', help="compare two bundles")
+    compare_cmd.add_argument('a')
+    compare_cmd.add_argument('b')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_bundles()
+    else:
+        compare(args.a, args.b)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+reconcile.py
+────────────
+Finds the (service, region) partitions of azure_prices that disagree with the
+Retail Prices API and re-syncs only those.
+
+Both sides are reduced to one row count and one order-independent checksum
+per (service, region, currency) partition:
+
+    row fingerprint   md5(meterId | effectiveStartDate | retailPrice rounded to 6 dp)
+    checksum          sum of the fingerprints' first 64 bits, mod 2^64
+
+Summing makes the checksum independent of row order, so the database side is
+a single grouped query over the active rows. The source side is either a
+fresh fetch of the sweep's cells (the same requests async_sync.py makes) or a
+pricing dump (azure_pricing_dump.json). Both run the ingest rules and the
+loaders' (meterId, effectiveStartDate) dedupe first, so they count exactly
+what a sync would store.
+
+Partitions with missing rows or a differing checksum are re-synced from the
+API in one targeted async_sync sweep (under the update_prices lock) and then
+checked again. A sync only upserts, so it cannot remove rows the source no
+longer has; partitions with extra rows are reported as stale instead. Cells
+the fetch could not read are reported and left alone, never treated as empty.
+
+Usage:
+    python reconcile.py                                   # full sweep cells, re-sync what differs
+    python reconcile.py --sweep quick --dry-run           # report only
+    python reconcile.py --service "Virtual Machines" --region eastus --currency USD
+    python reconcile.py --dump azure_pricing_dump.json
+"""
+
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+import psycopg2
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import datetime
+from dotenv import load_dotenv
+import json_codec
+from ingest_rules import RULES
+from async_sync import SWEEPS, CONCURRENCY, cell_url, fetch_page, run_sweep
+from staged_ingest import next_page_link
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+SWEEP = 'reconcile'
+MODULUS = 2 ** 64
+PRICE_QUANTUM = Decimal('0.000001')
+
+CHECKSUM_SQL = """
+SELECT service_name, arm_region_name, currency_code, COUNT(*),
+       SUM(('x' || substr(md5(
+           COALESCE(meter_id, '') || '|' ||
+           COALESCE(to_char(effective_start_date, 'YYYY-MM-DD"T"HH24:MI:SS'), '') || '|' ||
+           COALESCE(round(retail_price::numeric, 6)::text, '')
+       ), 1, 16))::bit(64)::bigint)
+FROM azure_prices
+WHERE is_active = TRUE AND currency_code = ANY(%(currencies)s)
+  AND (%(services)s::text[] IS NULL OR service_name = ANY(%(services)s))
+  AND (%(regions)s::text[] IS NULL OR arm_region_name = ANY(%(regions)s))
+GROUP BY service_name, arm_region_name, currency_code
+"""
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+# ── Checksums ──────────────────────────────────────────────────────────────────
+def _price_text(price):
+    # Matches round(retail_price::numeric, 6)::text
+    if price is None:
+        return ''
+    return str(Decimal(repr(float(price))).quantize(PRICE_QUANTUM, ROUND_HALF_UP))
+
+
+def fingerprint(meter_id, effective_start_date, retail_price):
+    text = f"{meter_id or ''}|{(effective_start_date or '')[:19]}|{_price_text(retail_price)}"
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def fold_items(items, totals=None):
+    """
+    Add API items to {partition: [count, checksum]}, after the ingest rules
+    and the loaders' (meterId, effectiveStartDate) dedupe.
+    """
+    totals = {} if totals is None else totals
+    seen = {}
+    for item, _ in RULES.filter_pairs([(item, None) for item in items]):
+        meter_id, start = item.get('meterId'), item.get('effectiveStartDate')
+        if not (meter_id and start):
+            continue
+        partition = (item.get('serviceName'), item.get('armRegionName'), item.get('currencyCode'))
+        # A later duplicate replaces the earlier one, as in the loaders
+        seen[partition + (meter_id, start)] = fingerprint(meter_id, start, item.get('retailPrice'))
+    for (service, region, currency, _, _), value in seen.items():
+        count_sum = totals.setdefault((service, region, currency), [0, 0])
+        count_sum[0] += 1
+        count_sum[1] = (count_sum[1] + value) % MODULUS
+    return totals
+
+
+def db_checksums(conn, currencies, services=None, regions=None):
+    """{(service, region, currency): (count, checksum)} of the active rows."""
+    cur = conn.cursor()
+    try:
+        cur.execute(CHECKSUM_SQL, {
+            'currencies': list(currencies),
+            'services': list(services) if services else None,
+            'regions': list(regions) if regions else None,
+        })
+        return {
+            (service, region, currency): (count, int(total or 0) % MODULUS)
+            for service, region, currency, count, total in cur.fetchall()
+        }
+    finally:
+        conn.rollback()
+        cur.close()
+
+
+# ── Source side ────────────────────────────────────────────────────────────────
+async def _fetch_cell(cell, semaphore, totals, failed):
+    async with semaphore:
+        url = cell_url(*cell)
+        items = []
+        try:
+            while url:
+                raw = await fetch_page(url)
+                url = next_page_link(raw)
+                items.extend((await asyncio.to_thread(json_codec.loads, raw)).get('Items', []))
+        except Exception as e:
+            failed[cell] = str(e)
+            return
+        fold_items(items, totals)
+        sys.stdout.write(f"\r  Fetched: {len(totals)} partitions, {len(failed)} failed cells")
+        sys.stdout.flush()
+
+
+async def _fetch_cells(cells, concurrency):
+    totals, failed = {}, {}
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(_fetch_cell(cell, semaphore, totals, failed) for cell in cells))
+    print()
+    return totals, failed
+
+
+def fetch_checksums(cells, concurrency=CONCURRENCY):
+    """Checksums of a fresh fetch of `cells`, and {cell: error} for cells that could not be read."""
+    return asyncio.run(_fetch_cells(cells, concurrency))
+
+
+def dump_checksums(path, services=None, regions=None):
+    # Imported here: json_to_postgres pulls in the whole loader
+    from json_to_postgres import read_items
+    return fold_items(read_items(path, services, regions))
+
+
+# ── Compare ────────────────────────────────────────────────────────────────────
+def compare(source, database, skip=()):
+    """[(partition, source (count, checksum), db (count, checksum), status)] for differing partitions."""
+    differences = []
+    for partition in sorted(set(source) | set(database), key=lambda p: tuple(v or '' for v in p)):
+        if partition in skip:
+            continue
+        src = tuple(source.get(partition, (0, 0)))
+        db = tuple(database.get(partition, (0, 0)))
+        if src == db:
+            continue
+        if db[0] > src[0]:
+            # Includes partitions the source no longer has at all
+            status = 'stale'
+        elif db[0] < src[0]:
+            status = 'missing rows'
+        else:
+            status = 'checksum'
+        differences.append((partition, src, db, status))
+    return differences
+
+
+def print_differences(differences):
+    print(f"  {'service':<32} {'region':<20} {'cur':<4} {'source':>8} {'db':>8}  status")
+    for (service, region, currency), src, db, status in differences:
+        print(f"  {service or '-':<32} {region or '-':<20} {currency or '-':<4} {src[0]:>8} {db[0]:>8}  {status}")
+
+
+def reconcile(args):
+    started_at = datetime.now()
+    services = args.service
+    regions = args.region
+    if args.dump:
+        print(f"📂 Checksumming {args.dump}...")
+        source, failed = dump_checksums(args.dump, services, regions), {}
+        currencies = args.currency or sorted({currency for _, _, currency in source if currency})
+    else:
+        sweep_services, sweep_regions, sweep_currencies = SWEEPS[args.sweep]
+        services = services or sweep_services
+        regions = regions or sweep_regions
+        currencies = args.currency or sweep_currencies
+        cells = [(s, r, c) for c in currencies for s in services for r in regions]
+        print(f"🌐 Fetching {len(cells)} cells (concurrency {args.concurrency})...")
+        source, failed = fetch_checksums(cells, args.concurrency)
+
+    conn = get_db_connection()
+    try:
+        print("🗄️  Checksumming azure_prices...")
+        database = db_checksums(conn, currencies, services, regions)
+
+        differences = compare(source, database, skip=set(failed))
+        print(f"\n{len(source)} source partitions, {len(database)} database partitions, "
+              f"{len(differences)} differ, {len(failed)} cells unreadable "
+              f"({(datetime.now() - started_at).total_seconds():.0f}s)")
+        if failed:
+            for cell, error in sorted(failed.items()):
+                print(f"  ⚠ {' / '.join(cell)}: {error}")
+        if differences:
+            print_differences(differences)
+
+        resync = [partition for partition, _, _, status in differences
+                  if status != 'stale' and None not in partition]
+        remaining = differences
+        if resync and not args.dry_run:
+            print(f"\n🔁 Re-syncing {len(resync)} partitions...")
+            counts, error = run_sweep(SWEEP, resync, args.concurrency, resume=False)
+            if error:
+                print(f"❌ {error}")
+            database = db_checksums(conn, currencies, services, regions)
+            remaining = compare(source, database, skip=set(failed))
+            print(f"\n{len(differences) - len(remaining)} partitions repaired, {len(remaining)} still differ")
+            if remaining:
+                print_differences(remaining)
+    finally:
+        conn.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'started_at': started_at.isoformat(),
+                'source': args.dump or f"fetch:{args.sweep}",
+                'differences': [
+                    {'partition': list(partition), 'source': list(src), 'db': list(db), 'status': status}
+                    for partition, src, db, status in remaining
+                ],
+                'failed_cells': [{'cell': list(cell), 'error': error} for cell, error in failed.items()],
+            }, f, indent=2)
+    return remaining, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-partition checksums with the API and re-sync what differs.")
+    parser.add_argument('--sweep', choices=sorted(SWEEPS), default='full', help="cells to fetch (default: full)")
+    parser.add_argument('--dump', help="checksum this pricing dump instead of fetching")
+    parser.add_argument('--service', action='append', help="only this serviceName (repeatable)")
+    parser.add_argument('--region', action='append', help="only this armRegionName (repeatable)")
+    parser.add_argument('--currency', action='append', help="only this currency (repeatable)")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="cells fetched at once")
+    parser.add_argument('--dry-run', action='store_true', help="report differences without re-syncing")
+    parser.add_argument('--json', help="also write the remaining differences to this file")
+    args = parser.parse_args()
+
+    remaining, failed = reconcile(args)
+    if remaining or failed:
+        sys.exit(1)
+    print("✅ Database matches the source.")
+
+
+if __name__ == "__main__":
+    main()
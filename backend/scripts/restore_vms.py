@@ -1,11 +1,19 @@
 
 import os
 import sys
-import json
 import requests
 import psycopg2
 from psycopg2.extras import execute_values
-from datetime import datetime
+from catalog_epoch import publish_epoch
+from price_rows import COLUMN_SQL, RAW_DATA_MODE, build_row, values_template
+from price_record import PriceRecord
+from ingest_rules import RULES
+from sync_log import create_sync_log, complete_sync_log
+from telemetry import TELEMETRY
+import metrics
+from profiling import profile_run
+from price_schema import partition_order, require_schema
+import json_codec
 
 # DB Connection
 def get_db_connection():
@@ -28,12 +36,13 @@ def get_db_connection():
     if not db_url:
         print("Error: DATABASE_URL not found.")
         sys.exit(1)
-        
+
     return psycopg2.connect(db_url)
 
 def fetch_and_load(service_name):
     print(f"--- Fetching {service_name} ---")
     conn = get_db_connection()
+    require_schema(conn)
     cur = conn.cursor()
     
     # Delete existing data for this service to avoid duplicates during this targeted refresh
@@ -47,23 +56,31 @@ def fetch_and_load(service_name):
 
     try:
         while url:
-            response = requests.get(url)
+            with TELEMETRY.stage('http'):
+                response = requests.get(url)
+            TELEMETRY.count_response(response)
             if response.status_code != 200:
                 print(f"API Error: {response.status_code}")
                 break
             
-            data = response.json()
-            items = data.get('Items', [])
-            if not items: break
-                
-            batch_items.extend(items)
-            total_fetched += len(items)
+            TELEMETRY.count('bytes', len(response.content))
+            TELEMETRY.count('pages')
+            with TELEMETRY.stage('decode'):
+                pairs, next_link = json_codec.page_items(response.content, keep_raw=RAW_DATA_MODE == 'full')
+            if not pairs: break
+
+            with TELEMETRY.stage('filter'):
+                pairs = RULES.filter_pairs(pairs)
+            with TELEMETRY.stage('decode'):
+                batch_items.extend(PriceRecord.from_item(item, item_raw) for item, item_raw in pairs)
+            TELEMETRY.count('items_fetched', len(pairs))
+            total_fetched += len(pairs)
             
             if len(batch_items) >= 1000:
                 insert_batch(conn, batch_items)
                 batch_items = []
                 
-            url = data.get('NextPageLink')
+            url = next_link
             page_count += 1
             print(f"Service: {service_name} | Page: {page_count} | Total: {total_fetched}")
 
@@ -75,34 +92,40 @@ def fetch_and_load(service_name):
     finally:
         conn.close()
     print(f"Done with {service_name}. Total: {total_fetched}")
+    return total_fetched
 
 def insert_batch(conn, items):
     cur = conn.cursor()
-    values = []
-    for item in items:
-        values.append((
-            item.get('meterId'), item.get('skuId'), item.get('serviceName'),
-            item.get('serviceId'), item.get('serviceFamily'), item.get('productName'),
-            item.get('skuName'), item.get('armRegionName'), item.get('location'),
-            item.get('currencyCode'), item.get('retailPrice'), item.get('unitPrice'),
-            item.get('effectiveStartDate'), item.get('type'), item.get('reservationTerm'),
-            json.dumps(item)
-        ))
+    with TELEMETRY.stage('dedupe'):
+        items = sorted(items, key=partition_order)
+    with TELEMETRY.stage('encode'):
+        values = [build_row(item) for item in items]
 
-    query = """
-    INSERT INTO azure_prices (
-        meter_id, sku_id, service_name, service_id, service_family,
-        product_name, sku_name, arm_region_name, location,
-        currency_code, retail_price, unit_price, effective_start_date,
-        type, reservation_term, raw_data, is_active, last_seen_at
-    ) VALUES %s
+    query = f"""
+    INSERT INTO azure_prices ({COLUMN_SQL}, is_active, last_seen_at) VALUES %s
     """
-    execute_values(cur, query, values, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())")
-    conn.commit()
+    with TELEMETRY.stage('db_write'):
+        execute_values(cur, query, values, template=values_template("TRUE", "NOW()"))
+    with TELEMETRY.stage('commit'):
+        conn.commit()
+    TELEMETRY.count('rows_written', len(values))
     cur.close()
 
 if __name__ == "__main__":
+    conn = get_db_connection()
+    run_id = create_sync_log(conn, 'restore_vms')
+    metrics.start('restore_vms')
+
     # Priority services for the calculator
-    fetch_and_load("Virtual Machines")
-    fetch_and_load("Storage")
-    fetch_and_load("Bandwidth")
+    service_changes = {}
+    # --profile / INGEST_PROFILE=1: CPU and memory profile bundle (see profiling.py)
+    with profile_run('restore_vms'):
+        for service in ("Virtual Machines", "Storage", "Bandwidth"):
+            service_changes[service] = fetch_and_load(service)
+
+    publish_epoch(conn, 'restore_vms', service_changes, run_id)
+    RULES.report()
+    TELEMETRY.report()
+    complete_sync_log(conn, run_id, sum(service_changes.values()), None, TELEMETRY.summary())
+    metrics.finish(conn, None)
+    conn.close()
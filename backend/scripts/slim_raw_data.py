@@ -0,0 +1,150 @@
+"""
+slim_raw_data.py
+────────────────
+Shrinks `azure_prices.raw_data` to the residual fields that have no dedicated
+column (the storage mode loaders use by default, see price_rows.py), and
+installs the reconstruction helpers:
+
+    azure_price_item(p azure_prices) → jsonb   full API item for one row
+    azure_prices_full                          view: every column + `item`
+
+Existing rows are rewritten one leaf table at a time (every partition of a
+partitioned azure_prices) in ctid page ranges, each batch in its own
+transaction, so the table stays available. Every page is visited once per
+run; re-running skips rows that are already slim.
+
+Usage:
+    python slim_raw_data.py [--batch-pages 1000] [--no-vacuum]
+"""
+
+import os
+import sys
+import time
+import argparse
+import psycopg2
+from datetime import datetime
+from dotenv import load_dotenv
+from price_rows import COLUMN_FIELDS, COLUMN_ITEM_FIELDS
+
+# Load .env from the backend root (one level up from /scripts)
+load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+
+# How each typed column is rendered back into the API item
+_ITEM_EXPRESSIONS = {
+    'effective_start_date': "to_char(p.effective_start_date, 'YYYY-MM-DD\"T\"HH24:MI:SS\"Z\"')",
+}
+
+RECONSTRUCT_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION azure_price_item(p azure_prices) RETURNS jsonb
+LANGUAGE sql STABLE AS $$
+    SELECT {item}
+$$;
+CREATE OR REPLACE VIEW azure_prices_full AS
+    SELECT p.*, azure_price_item(p) AS item FROM azure_prices p;
+"""
+
+
+def item_sql():
+    """SQL expression (jsonb) rebuilding the full API item of the azure_prices row `p`."""
+    pairs = ",\n        ".join(
+        f"'{field}', {_ITEM_EXPRESSIONS.get(column, 'p.' + column)}"
+        for column, field in COLUMN_FIELDS
+    )
+    return f"COALESCE(p.raw_data, '{{}}'::jsonb) || jsonb_strip_nulls(jsonb_build_object(\n        {pairs}\n    ))"
+
+
+def get_db_connection():
+    try:
+        if not os.environ.get('DATABASE_URL'):
+            print("Error: DATABASE_URL not found in environment or .env file.")
+            sys.exit(1)
+
+        return psycopg2.connect(os.environ['DATABASE_URL'])
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+
+def install_reconstruction(conn):
+    cur = conn.cursor()
+    cur.execute(RECONSTRUCT_FUNCTION_SQL.format(item=item_sql()))
+    conn.commit()
+    cur.close()
+
+
+def _leaf_tables(cur):
+    # An unpartitioned azure_prices is its own single leaf
+    cur.execute("""
+        SELECT relid::regclass::text FROM pg_partition_tree('azure_prices') WHERE isleaf
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+def slim_existing_rows(conn, batch_pages):
+    """
+    Strip column-backed keys from raw_data, one small transaction per ctid
+    page range. A ctid is only unique within one table, so each range is
+    addressed on a leaf table, never through the partitioned parent.
+    """
+    cur = conn.cursor()
+    total = 0
+    for table in _leaf_tables(cur):
+        sql = f"""
+            UPDATE {table} SET raw_data = raw_data - %(fields)s::text[]
+            WHERE ctid >= format('(%%s,0)', %(start)s::bigint)::tid
+              AND ctid <  format('(%%s,0)', %(end)s::bigint)::tid
+              AND raw_data ?| %(fields)s::text[]
+        """
+        page = 0
+        while True:
+            cur.execute("SELECT pg_relation_size(%s) / current_setting('block_size')::bigint", (table,))
+            total_pages = cur.fetchone()[0]
+            if page >= total_pages:
+                break
+            end = page + batch_pages
+            cur.execute(sql, {'fields': COLUMN_ITEM_FIELDS, 'start': page, 'end': end})
+            total += cur.rowcount
+            conn.commit()
+            page = end
+            sys.stdout.write(f"\r  {table}: pages {min(page, total_pages)}/{total_pages} | Slimmed: {total}")
+            sys.stdout.flush()
+            # Let autovacuum and concurrent readers keep up between batches
+            time.sleep(0.05)
+    conn.commit()
+    cur.close()
+    print(f"\r  Slimmed: {total} rows{' ' * 40}")
+
+
+def vacuum(conn):
+    # Plain VACUUM makes the freed space reusable without an exclusive lock;
+    # use VACUUM FULL / pg_repack in a maintenance window to return it to the OS.
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("VACUUM (ANALYZE) azure_prices")
+    cur.close()
+    conn.autocommit = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store only residual JSON fields in azure_prices.raw_data.")
+    parser.add_argument('--batch-pages', type=int, default=1000, help="heap pages per batch")
+    parser.add_argument('--no-vacuum', action='store_true')
+    args = parser.parse_args()
+
+    start = datetime.now()
+    conn = get_db_connection()
+    try:
+        print("▶  Installing azure_price_item() and azure_prices_full...")
+        install_reconstruction(conn)
+        print("▶  Slimming existing rows...")
+        slim_existing_rows(conn, args.batch_pages)
+        if not args.no_vacuum:
+            print("▶  VACUUM (ANALYZE) azure_prices...")
+            vacuum(conn)
+    finally:
+        conn.close()
+    print(f"✅ Done in {(datetime.now() - start).total_seconds():.1f}s")
+
+
+if __name__ == "__main__":
+    main()
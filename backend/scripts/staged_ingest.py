@@ -0,0 +1,256 @@
+"""
+staged_ingest.py
+────────────────
+Multi-core ingest path for the nightly sync (`update_prices.py --workers N`).
+
+The main process only does network I/O: it downloads each API page as raw
+bytes, pulls the NextPageLink out of the tail of the body and hands the bytes
+to a process pool. Workers decode the JSON, apply the ingest rules
+(ingest_rules.py), dedupe and render the rows as COPY text
+(price_rows.copy_line), returning one compact bytes buffer per page.
+
+StagingWriter COPYs those buffers into a temp table and, per batch and in one
+transaction, appends price_history deltas and upserts azure_prices with
+set-based SQL – no per-row Python on the write side.
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import requests
+import psycopg2
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json_codec
+from price_rows import COLUMN_SQL, RAW_DATA_MODE, VALUE_COLUMNS, copy_line
+from price_record import PriceRecord
+from ingest_rules import RULES
+from price_schema import CANONICAL_KEY, CONFLICT_TARGET
+from price_history import CHANGES_SQL
+from dead_letter import spool_copy
+from telemetry import TELEMETRY
+
+BATCH_ROWS = 5000
+STAGE_TABLE = 'price_stage'
+
+_NEXT_LINK_RE = re.compile(rb'"NextPageLink"\s*:\s*(null|"((?:[^"\\]|\\.)*)")')
+
+
+# ── Worker side ────────────────────────────────────────────────────────────────
+def init_worker():
+    """
+    Pool initializer: a forked worker inherits the parent's rule and stage
+    counters; drop them so take_stats() only ships what the worker recorded.
+    """
+    RULES.take_stats()
+    TELEMETRY.take_stats()
+
+
+def next_page_link(raw):
+    """NextPageLink of a raw page body; the field sits at the end, so scan the tail first."""
+    match = _NEXT_LINK_RE.search(raw, max(0, len(raw) - 4096)) or _NEXT_LINK_RE.search(raw)
+    if match is None or match.group(2) is None:
+        return None
+    return json.loads(b'"' + match.group(2) + b'"')
+
+
+def decode_page(raw, currency=None):
+    """
+    Worker: raw page bytes → (COPY buffer, rows, items kept by the ingest
+    rules, rule counters, stage timings). Rows are deduped by
+    (meterId, effectiveStartDate) within the page.
+    """
+    with TELEMETRY.stage('decode'):
+        # In full mode raw_data can keep the API's own bytes for each item
+        pairs, _ = json_codec.page_items(raw, keep_raw=RAW_DATA_MODE == 'full')
+    with TELEMETRY.stage('filter'):
+        pairs = RULES.filter_pairs(pairs)
+
+    with TELEMETRY.stage('dedupe'):
+        unique = {}
+        for item, item_raw in pairs:
+            if currency and item.get('currencyCode') != currency:
+                # The item text no longer matches the item: re-encode it
+                item['currencyCode'] = currency
+                item_raw = None
+            key = (item.get('meterId'), item.get('effectiveStartDate'))
+            if key[0] and key[1]:
+                unique[key] = (item, item_raw)
+    with TELEMETRY.stage('encode'):
+        buffer = "".join(
+            copy_line(PriceRecord.from_item(item, item_raw)) for item, item_raw in unique.values()
+        ).encode('utf-8')
+    return buffer, len(unique), len(pairs), RULES.take_stats(), TELEMETRY.take_stats()
+
+
+# ── Writer side ────────────────────────────────────────────────────────────────
+class StagingWriter:
+    """
+    Buffers COPY data and applies it to azure_prices in BATCH_ROWS-sized
+    transactions. Batches that still fail are spooled under `job` (see
+    dead_letter.py); job=None disables spooling.
+    """
+
+    def __init__(self, conn, run_id, stats, batch_rows=BATCH_ROWS, job='update_prices'):
+        self.conn = conn
+        self.run_id = run_id
+        self.stats = stats
+        self.batch_rows = batch_rows
+        self.job = job
+        self._buffers = []
+        self._rows = 0
+
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(VALUE_COLUMNS)} FROM azure_prices WITH NO DATA
+        """)
+        conn.commit()
+        cur.close()
+
+        values = ", ".join(f"s.{c}" for c in VALUE_COLUMNS)
+        key = ", ".join(f"s.{c}" for c in CANONICAL_KEY)
+        canonical = ", ".join(CANONICAL_KEY)
+        # Same change-only upsert as update_prices.process_batch
+        self._upsert_sql = f"""
+            INSERT INTO azure_prices ({COLUMN_SQL}, is_active, last_seen_at)
+            SELECT DISTINCT ON ({key}) {values}, TRUE, NOW()
+            FROM {STAGE_TABLE} s
+            ORDER BY {key}
+            ON CONFLICT ({CONFLICT_TARGET}) DO UPDATE SET
+                retail_price = EXCLUDED.retail_price,
+                unit_price = EXCLUDED.unit_price,
+                effective_start_date = EXCLUDED.effective_start_date,
+                raw_data = EXCLUDED.raw_data,
+                is_active = TRUE,
+                last_seen_at = NOW()
+            WHERE
+                azure_prices.retail_price IS DISTINCT FROM EXCLUDED.retail_price OR
+                azure_prices.unit_price IS DISTINCT FROM EXCLUDED.unit_price OR
+                azure_prices.is_active = FALSE
+            RETURNING service_name
+        """
+        self._history_sql = CHANGES_SQL.format(
+            run_id=int(run_id),
+            source=f"(SELECT DISTINCT ON ({canonical}) {canonical}, retail_price FROM {STAGE_TABLE})"
+        )
+
+    @property
+    def pending_rows(self):
+        """Rows buffered but not yet applied; 0 right after a flush."""
+        return self._rows
+
+    def add(self, buffer, rows):
+        if rows:
+            self._buffers.append(buffer)
+            self._rows += rows
+        if self._rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        data = b"".join(self._buffers)
+        rows = self._rows
+        self._buffers, self._rows = [], 0
+
+        error = self.apply(data, rows)
+        if error and self.job:
+            spool_copy(self.job, self.run_id, data, rows, error)
+
+    def apply(self, data, rows):
+        """Apply one batch of COPY data in a single transaction. Returns None, or the error."""
+        max_retries = 3
+        for attempt in range(max_retries):
+            cur = self.conn.cursor()
+            try:
+                with TELEMETRY.stage('db_write'):
+                    cur.copy_expert(
+                        f"COPY {STAGE_TABLE} ({', '.join(VALUE_COLUMNS)}) FROM STDIN",
+                        io.BytesIO(data)
+                    )
+                    # Log price deltas before the upsert overwrites the old values
+                    cur.execute(self._history_sql)
+                    history_rows = cur.rowcount
+                    cur.execute(self._upsert_sql)
+                    changed_rows = cur.fetchall()
+                with TELEMETRY.stage('commit'):
+                    self.conn.commit()
+                TELEMETRY.count('rows_written', rows)
+
+                affected = len(changed_rows)
+                self.stats["total_affected"] += affected
+                self.stats["total_skipped"] += rows - affected
+                self.stats["processed_batches"] += 1
+                self.stats["history_rows"] += history_rows
+                self.stats["service_changes"].update(row[0] for row in changed_rows)
+                return None
+            except psycopg2.errors.DeadlockDetected as e:
+                self.conn.rollback()
+                if attempt < max_retries - 1:
+                    time.sleep(1)
+                else:
+                    print(f"\n❌ Batch Update Failed (Deadlock).")
+                    return e
+            except Exception as e:
+                print(f"\n❌ Batch Update Failed: {e}")
+                self.conn.rollback()
+                return e
+            finally:
+                cur.close()
+
+
+# ── Pipeline ───────────────────────────────────────────────────────────────────
+def ingest_pages(conn, url, run_id, stats, workers, currency=None):
+    """Fetch pages sequentially, decode them on `workers` processes, write in page order.
+
+    Returns (page_count, error); error is set when the API refused a page and the
+    walk stopped short, after the pages already fetched have been written.
+    """
+    writer = StagingWriter(conn, run_id, stats)
+    session = requests.Session()
+    in_flight = deque()
+    page_count = 0
+    error = None
+
+    def drain(limit):
+        while len(in_flight) > limit:
+            buffer, rows, fetched, rule_stats, stage_stats = in_flight.popleft().result()
+            stats["fetched"] += fetched
+            RULES.merge_stats(rule_stats)
+            TELEMETRY.merge_stats(stage_stats)
+            writer.add(buffer, rows)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        while url:
+            try:
+                with TELEMETRY.stage('http'):
+                    response = session.get(url, timeout=30)
+                TELEMETRY.count_response(response)
+                if response.status_code != 200:
+                    print(f"API Error: {response.status_code} - {response.text}")
+                    error = f"API error {response.status_code} after {page_count} pages"
+                    break
+                raw = response.content
+            except Exception as e:
+                print(f"Request failed: {e}")
+                TELEMETRY.count('http_errors')
+                time.sleep(5)  # Retry delay
+                continue
+
+            TELEMETRY.count('bytes', len(raw))
+            TELEMETRY.count('pages')
+            in_flight.append(pool.submit(decode_page, raw, currency))
+            # Bounded look-ahead keeps memory flat if the database is the bottleneck
+            drain(2 * workers)
+
+            url = next_page_link(raw)
+            page_count += 1
+            sys.stdout.write(f"\rPage: {page_count} | Fetched: {stats['fetched']} | Changed: {stats['total_affected']} | Skipped: {stats['total_skipped']}")
+            sys.stdout.flush()
+
+        drain(0)
+    writer.flush()
+    return page_count, error
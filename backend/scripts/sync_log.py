@@ -0,0 +1,64 @@
+"""
+sync_log.py
+───────────
+Python side of the `sync_log` table (see createSyncLog / completeSyncLog in
+src/db.js). Every ingestion job opens a row when it starts; the row id is the
+run id used by price_history and the other per-run tables.
+
+`stats` holds the run's per-stage telemetry (telemetry.py); sync_log_stages
+flattens it for trend queries, e.g.
+
+    SELECT started_at::date, stage, seconds FROM sync_log_stages
+    WHERE job = 'update_prices' ORDER BY run_id DESC;
+"""
+
+from psycopg2.extras import Json
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS sync_log (
+    id SERIAL PRIMARY KEY,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    items_synced INTEGER DEFAULT 0,
+    status TEXT DEFAULT 'running',
+    error TEXT
+);
+ALTER TABLE sync_log ADD COLUMN IF NOT EXISTS job TEXT;
+ALTER TABLE sync_log ADD COLUMN IF NOT EXISTS stats JSONB;
+
+CREATE OR REPLACE VIEW sync_log_stages AS
+SELECT s.id AS run_id, s.job, s.started_at, s.status,
+       st.key AS stage,
+       (st.value->>'seconds')::float8 AS seconds,
+       (st.value->>'calls')::bigint AS calls
+FROM sync_log s
+CROSS JOIN LATERAL jsonb_each(s.stats->'stages') AS st;
+"""
+
+
+def create_sync_log(conn, job):
+    """Insert a 'running' row for this job and return its id (the run id)."""
+    cur = conn.cursor()
+    cur.execute(CREATE_TABLE_SQL)
+    cur.execute(
+        "INSERT INTO sync_log (started_at, status, job) VALUES (NOW(), 'running', %s) RETURNING id",
+        (job,)
+    )
+    run_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return run_id
+
+
+def complete_sync_log(conn, run_id, items_synced, error=None, stats=None):
+    # A failed batch may have left the transaction aborted
+    conn.rollback()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE sync_log SET completed_at = NOW(), items_synced = %s, status = %s, error = %s, "
+        "stats = %s WHERE id = %s",
+        (items_synced, 'failed' if error else 'completed', error,
+         Json(stats) if stats is not None else None, run_id)
+    )
+    conn.commit()
+    cur.close()
@@ -0,0 +1,114 @@
+"""
+telemetry.py
+────────────
+Per-stage timings and counters for the ingestion jobs.
+
+Loaders wrap each stage of their pipeline in TELEMETRY.stage(name) and bump
+counters with TELEMETRY.count(name, n). Stage names used across the jobs:
+
+    http      waiting on the Retail Prices API
+    read      reading a dump file
+    decode    JSON decode and PriceRecord construction
+    filter    ingest rules (ingest_rules.py)
+    dedupe    per-batch dedupe and partition sort
+    encode    row tuples / COPY text
+    db_write  statements that write a batch (COPY, upserts, history)
+    commit    the batch's COMMIT
+
+Worker processes keep their own TELEMETRY and ship take_stats() back to the
+parent, which merge_stats() them; stage time is then summed over workers and
+can exceed the wall time.
+
+At the end of a run the job passes TELEMETRY.summary() to
+sync_log.complete_sync_log(), which stores it in sync_log.stats (JSONB); the
+sync_log_stages view flattens it to one row per run and stage. Under
+--profile, stages also report their memory to profiling.py.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from ingest_rules import RULES
+
+
+class JobTelemetry:
+    """Accumulated seconds and call counts per stage, plus named counters."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        # Set by profiling.profile_run() while a --profile run is active
+        self.profiler = None
+        # Set by metrics.start(): called with (stage, seconds) after every stage
+        self.stage_observer = None
+
+    @contextmanager
+    def stage(self, name):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.stage_enter(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[name] += elapsed
+            self.calls[name] += 1
+            if profiler is not None:
+                profiler.stage_exit(name)
+            if self.stage_observer is not None:
+                self.stage_observer(name, elapsed)
+
+    def add_time(self, name, seconds, calls=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def count_response(self, response):
+        """Count an API response by status, including statuses urllib3 retried away."""
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        for attempt in getattr(retries, 'history', None) or ():
+            if attempt.status is not None:
+                self.counters[f'http_{attempt.status}'] += 1
+        self.counters[f'http_{response.status_code}'] += 1
+
+    # ── Worker hand-off ─────────────────────────────────────────────────────────
+    def take_stats(self):
+        """Everything recorded since the last call, as plain dicts; resets the counters."""
+        stats = (dict(self.seconds), dict(self.calls), dict(self.counters))
+        self.seconds, self.calls, self.counters = Counter(), Counter(), Counter()
+        return stats
+
+    def merge_stats(self, stats):
+        seconds, calls, counters = stats
+        self.seconds.update(seconds)
+        self.calls.update(calls)
+        self.counters.update(counters)
+
+    # ── Output ──────────────────────────────────────────────────────────────────
+    def summary(self):
+        """JSON-ready snapshot for sync_log.stats."""
+        return {
+            'wall_seconds': round(time.perf_counter() - self.started, 3),
+            'stages': {
+                name: {'seconds': round(self.seconds[name], 3), 'calls': self.calls[name]}
+                for name in self.seconds
+            },
+            'counters': dict(self.counters),
+            'rules': RULES.summary(),
+        }
+
+    def report(self):
+        wall = time.perf_counter() - self.started
+        print(f"\nStage timings (wall {wall:.1f}s):")
+        for name, seconds in self.seconds.most_common():
+            print(f"  {name:<10} {seconds:>9.2f}s  {self.calls[name]:>8} calls")
+        if self.counters:
+            print("  " + ", ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+
+
+TELEMETRY = JobTelemetry()
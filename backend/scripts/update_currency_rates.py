@@ -5,6 +5,7 @@ import sys
 import time
 from datetime import datetime
 from dotenv import load_dotenv
+from catalog_epoch import publish_epoch, CURRENCY_RATES
 
 # Load .env from the backend root (one level up from /scripts)
 load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
@@ -74,10 +75,11 @@ def fetch_price(currency):
         return None
 
 def update_rates():
+    """Refresh currency_rates; returns an error string when the run did not update them."""
     conn = get_db_connection()
     if not conn:
         print("Failed to connect to DB")
-        return
+        return "database connection failed"
 
     init_currency_table(conn)
     cur = conn.cursor()
@@ -88,7 +90,9 @@ def update_rates():
     usd_price = fetch_price('USD')
     if not usd_price or usd_price == 0:
         print("CRITICAL: Could not fetch base USD price. Aborting.")
-        return
+        cur.close()
+        conn.close()
+        return "base USD price unavailable"
 
     print(f"Base USD Price: ${usd_price}")
 
@@ -118,8 +122,15 @@ def update_rates():
 
     conn.commit()
     cur.close()
+    if not results:
+        conn.close()
+        print("\n❌ No currency rates could be calculated.")
+        return "no currency rates updated"
+
+    publish_epoch(conn, 'update_currency_rates', {CURRENCY_RATES: len(results)})
     conn.close()
     print("\n✅ Currency rates updated successfully.")
 
 if __name__ == "__main__":
-    update_rates()
+    if update_rates():
+        sys.exit(1)
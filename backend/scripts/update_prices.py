@@ -1,12 +1,27 @@
 import os
 import sys
-import json
 import time
+import argparse
 import requests
 import psycopg2
 from psycopg2 import sql, extras
+from collections import Counter
 from datetime import datetime
 from dotenv import load_dotenv
+from catalog_epoch import publish_epoch
+from price_rows import COLUMN_SQL, RAW_DATA_MODE, build_row, values_template
+from price_record import PriceRecord
+from price_schema import CONFLICT_TARGET, partition_order, require_schema
+from effective_rates import refresh_effective_rates
+from price_history import ensure_history_table, record_price_changes
+from sync_log import create_sync_log, complete_sync_log
+from staged_ingest import ingest_pages
+from ingest_rules import RULES
+from dead_letter import spool_records
+from telemetry import TELEMETRY
+import metrics
+from profiling import profile_run, profiling_requested
+import json_codec
 
 # Load .env from the backend root (one level up from /scripts)
 load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
@@ -33,11 +48,16 @@ def get_db_connection():
         print(f"Error connecting to database: {e}")
         sys.exit(1)
 
-def update_prices():
+def update_prices(workers=0):
     conn = get_db_connection()
-    
+    require_schema(conn)
+    ensure_history_table(conn)
+    run_id = create_sync_log(conn, 'update_prices')
+    metrics.start('update_prices')
+    error = None
+
     start_time = datetime.now()
-    print(f"[{start_time}] Starting Incremental Prices Update...")
+    print(f"[{start_time}] Starting Incremental Prices Update (run {run_id})...")
     print("Fetching base USD prices from Azure API.")
 
     url = f"{API_URL}?$filter={API_FILTER}"
@@ -46,121 +66,128 @@ def update_prices():
         "fetched": 0,
         "processed_batches": 0,
         "total_affected": 0, # Inserts + Updates
-        "total_skipped": 0   # Unchanged
+        "total_skipped": 0,  # Unchanged
+        "history_rows": 0,   # Price changes appended to price_history
+        "service_changes": Counter()  # Changed rows per serviceName (catalog epoch)
     }
     
     batch_items = []
     page_count = 0
 
     try:
+        if workers:
+            # Multi-core path: process-pool decode + COPY into a staging table
+            page_count, error = ingest_pages(conn, url, run_id, stats, workers, currency='USD')
+            url = None
+
         while url:
             try:
-                response = requests.get(url, timeout=30)
+                with TELEMETRY.stage('http'):
+                    response = requests.get(url, timeout=30)
+                TELEMETRY.count_response(response)
                 if response.status_code != 200:
                     print(f"API Error: {response.status_code} - {response.text}")
+                    error = f"API error {response.status_code} after {page_count} pages"
                     break
                 
-                data = response.json()
-                items = data.get('Items', [])
+                TELEMETRY.count('bytes', len(response.content))
+                with TELEMETRY.stage('decode'):
+                    pairs, next_link = json_codec.page_items(response.content, keep_raw=RAW_DATA_MODE == 'full')
             except Exception as e:
                 print(f"Request failed: {e}")
+                TELEMETRY.count('http_errors')
                 time.sleep(5) # Retry delay
                 continue
             
-            if not items:
+            if not pairs:
                 break
 
-            # Filter out unwanted Managed Disk variants (Burst, Snapshot, Disk Mount)
-            items = [
-                i for i in items
-                if not (
-                    i.get('serviceName') == 'Storage'
-                    and 'Managed Disks' in (i.get('productName') or '')
-                    and any(
-                        kw in (i.get('skuName') or '').lower() or kw in (i.get('meterName') or '').lower()
-                        for kw in ['burst', 'snapshot', 'mount']
-                    )
-                )
-            ]
-
-            batch_items.extend(items)
-            stats["fetched"] += len(items)
+            # Drop / tag / rewrite per the shared ingest rules
+            with TELEMETRY.stage('filter'):
+                pairs = RULES.filter_pairs(pairs)
+            with TELEMETRY.stage('decode'):
+                for item, item_raw in pairs:
+                    # Force currency to USD just to be safe; a rewritten item is re-encoded
+                    if item.get('currencyCode') != 'USD':
+                        item['currencyCode'] = 'USD'
+                        item_raw = None
+                    batch_items.append(PriceRecord.from_item(item, item_raw))
+            stats["fetched"] += len(pairs)
             
             if len(batch_items) >= BATCH_SIZE:
-                process_batch(conn, batch_items, stats)
+                process_batch(conn, batch_items, stats, run_id)
                 batch_items = []
                 
-            url = data.get('NextPageLink')
+            url = next_link
             page_count += 1
+            TELEMETRY.count('pages')
             sys.stdout.write(f"\rPage: {page_count} | Fetched: {stats['fetched']} | Changed: {stats['total_affected']} | Skipped: {stats['total_skipped']}")
             sys.stdout.flush()
 
         if batch_items:
-            process_batch(conn, batch_items, stats)
+            process_batch(conn, batch_items, stats, run_id)
             
         print(f"\n\nBase Prices Update Summary:")
         print(f"  Total Fetched: {stats['fetched']}")
         print(f"  Total Changed (Inserted/Updated): {stats['total_affected']}")
         print(f"  Total Skipped (Unchanged): {stats['total_skipped']}")
+        print(f"  Price Changes Recorded: {stats['history_rows']}")
+        RULES.report()
+        TELEMETRY.report()
+
+        changed = refresh_effective_rates(conn)
+        print(f"  Effective Rates Refreshed: {changed}")
+
+        epoch = publish_epoch(conn, 'update_prices', stats["service_changes"], run_id)
+        print(f"  Catalog Epoch Published: {epoch}")
         
     except KeyboardInterrupt:
+        error = "Stopped by user"
         print("\nStopped by user.")
     except Exception as e:
+        error = str(e)
         print(f"\nUnexpected error: {e}")
     finally:
+        TELEMETRY.count('items_fetched', stats["fetched"])
+        TELEMETRY.count('rows_changed', stats["total_affected"])
+        TELEMETRY.count('rows_unchanged', stats["total_skipped"])
+        TELEMETRY.count('history_rows', stats["history_rows"])
+        complete_sync_log(conn, run_id, stats["total_affected"], error, TELEMETRY.summary())
+        metrics.finish(conn, error)
         conn.close()
+    return error
 
-def process_batch(conn, items, stats):
+def process_batch(conn, items, stats, run_id):
     if not items:
         return
 
     # Deduplicate by (meterId, effectiveStartDate)
-    unique_map = {}
-    for item in items:
-        # Force currency to USD just to be safe
-        item['currencyCode'] = 'USD'
-        key = (item.get('meterId'), item.get('effectiveStartDate'))
-        if key[0] and key[1]:
-            unique_map[key] = item
-    
-    deduped_items = sorted(list(unique_map.values()), key=lambda x: (x.get('meterId', ''), x.get('effectiveStartDate', '')))
+    with TELEMETRY.stage('dedupe'):
+        unique_map = {}
+        for record in items:
+            key = record.key
+            if key[0] and key[1]:
+                unique_map[key] = record
+        
+        deduped_items = sorted(unique_map.values(), key=partition_order)
     
     if not deduped_items:
         return
 
     cur = conn.cursor()
     
-    values = []
-    for item in deduped_items:
-        values.append((
-            item.get('meterId'),
-            item.get('skuId'),
-            item.get('serviceName'),
-            item.get('serviceId'),
-            item.get('serviceFamily'),
-            item.get('productName'),
-            item.get('skuName'),
-            item.get('armRegionName'),
-            item.get('location'),
-            item.get('currencyCode'),
-            item.get('retailPrice'),
-            item.get('unitPrice'),
-            item.get('effectiveStartDate'),
-            item.get('type'),
-            item.get('reservationTerm'),
-            json.dumps(item)
-        ))
+    with TELEMETRY.stage('encode'):
+        values = [build_row(record) for record in deduped_items]
+        history_values = [
+            (record.meter_id, record.effective_start_date, record.currency_code,
+             record.service_name, record.arm_region_name, record.retail_price)
+            for record in deduped_items
+        ]
 
     # UPSERT with conditional update
-    query = """
-    INSERT INTO azure_prices (
-        meter_id, sku_id, service_name, service_id, service_family,
-        product_name, sku_name, arm_region_name, location,
-        currency_code, retail_price, unit_price, effective_start_date,
-        type, reservation_term, raw_data, 
-        is_active, last_seen_at
-    ) VALUES %s
-    ON CONFLICT (meter_id, effective_start_date) DO UPDATE SET
+    query = f"""
+    INSERT INTO azure_prices ({COLUMN_SQL}, is_active, last_seen_at) VALUES %s
+    ON CONFLICT ({CONFLICT_TARGET}) DO UPDATE SET
         retail_price = EXCLUDED.retail_price,
         unit_price = EXCLUDED.unit_price,
         effective_start_date = EXCLUDED.effective_start_date,
@@ -171,38 +198,60 @@ def process_batch(conn, items, stats):
         azure_prices.retail_price IS DISTINCT FROM EXCLUDED.retail_price OR
         azure_prices.unit_price IS DISTINCT FROM EXCLUDED.unit_price OR
         azure_prices.is_active = FALSE
+    RETURNING service_name
     """
     
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            extras.execute_values(
-                cur, 
-                query, 
-                values, 
-                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())",
-                page_size=BATCH_SIZE
-            )
-            affected = cur.rowcount
-            conn.commit()
+            with TELEMETRY.stage('db_write'):
+                # Log price deltas before the upsert overwrites the old values
+                history_rows = record_price_changes(cur, run_id, history_values)
+                changed_rows = extras.execute_values(
+                    cur, 
+                    query, 
+                    values, 
+                    template=values_template("TRUE", "NOW()"),
+                    page_size=BATCH_SIZE,
+                    fetch=True
+                )
+            affected = len(changed_rows)
+            with TELEMETRY.stage('commit'):
+                conn.commit()
+            TELEMETRY.count('rows_written', len(deduped_items))
             
             skipped = len(deduped_items) - affected
             stats["total_affected"] += affected
             stats["total_skipped"] += skipped
             stats["processed_batches"] += 1
+            stats["history_rows"] += history_rows
+            stats["service_changes"].update(row[0] for row in changed_rows)
             break
             
-        except psycopg2.errors.DeadlockDetected:
+        except psycopg2.errors.DeadlockDetected as e:
             conn.rollback()
             if attempt < max_retries - 1:
                 time.sleep(1)
             else:
                 print(f"\n❌ Batch Update Failed (Deadlock).")
+                spool_records('update_prices', run_id, deduped_items, e)
         except Exception as e:
+            print(f"\n❌ Batch Update Failed: {e}")
             conn.rollback()
+            spool_records('update_prices', run_id, deduped_items, e)
             break
     
     cur.close()
 
 if __name__ == "__main__":
-    update_prices()
+    parser = argparse.ArgumentParser(description="Incremental USD price sync from the Azure Retail Prices API.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="decode pages on N processes and write through a COPY staging table")
+    parser.add_argument('--profile', action='store_true',
+                        help="write a CPU/memory profile bundle (see profiling.py); also INGEST_PROFILE=1")
+    args = parser.parse_args()
+    with profile_run('update_prices', profiling_requested(args.profile)):
+        error = update_prices(args.workers)
+    # Non-zero exit so the orchestrator holds back the stages that depend on these prices
+    if error:
+        sys.exit(1)
@@ -5,7 +5,7 @@ Downloads the daily azure_vm_types.gz export from CloudPrice's Batch Export API,
 parses the CSV, and upserts all rows into the `vm_types` Postgres table.
 
 Usage:
-    python update_vm_types.py
+    python update_vm_types.py [--profile]
 
 Environment variables required:
     DATABASE_URL          – PostgreSQL connection string
@@ -24,6 +24,9 @@ import io
 import psycopg2
 from psycopg2 import extras
 from datetime import datetime
+from catalog_epoch import publish_epoch, VM_TYPES
+from telemetry import TELEMETRY
+from profiling import profile_run
 
 # ── Configuration ──────────────────────────────────────────────────────────────
 CLOUDPRICE_VM_TYPES_URL = os.environ.get(
@@ -159,7 +162,8 @@ def download_vm_types(api_key):
     print(f"📥  Downloading {CLOUDPRICE_VM_TYPES_URL} ...")
     for attempt in range(3):
         try:
-            response = requests.get(CLOUDPRICE_VM_TYPES_URL, headers=headers, timeout=60)
+            with TELEMETRY.stage('http'):
+                response = requests.get(CLOUDPRICE_VM_TYPES_URL, headers=headers, timeout=60)
             if response.status_code == 401:
                 print("❌  401 Unauthorized – check your CLOUDPRICE_API_KEY")
                 sys.exit(1)
@@ -182,15 +186,17 @@ def download_vm_types(api_key):
 
     # Decompress
     try:
-        decompressed = gzip.decompress(response.content)
+        with TELEMETRY.stage('decode'):
+            decompressed = gzip.decompress(response.content)
     except Exception as e:
         print(f"❌  Failed to decompress gzip: {e}")
         sys.exit(1)
 
     # Parse CSV
-    text = decompressed.decode('utf-8-sig')  # strip BOM if present
-    reader = csv.DictReader(io.StringIO(text))
-    rows = list(reader)
+    with TELEMETRY.stage('decode'):
+        text = decompressed.decode('utf-8-sig')  # strip BOM if present
+        reader = csv.DictReader(io.StringIO(text))
+        rows = list(reader)
     print(f"📋  Parsed {len(rows)} VM type records")
     return rows
 
@@ -205,6 +211,7 @@ def upsert_vm_types(conn, rows):
     conn.commit()
     print("✅  vm_types table ready")
 
+    encode_start = time.perf_counter()
     records = []
     for row in rows:
         # Column names from CloudPrice CSV (case-insensitive match)
@@ -245,6 +252,7 @@ def upsert_vm_types(conn, rows):
 
     # Filter out rows with no name
     records = [rec for rec in records if rec[0]]
+    TELEMETRY.add_time('encode', time.perf_counter() - encode_start)
     print(f"🔄  Upserting {len(records)} records ...")
 
     upsert_sql = """
@@ -290,21 +298,25 @@ def upsert_vm_types(conn, rows):
 
     BATCH_SIZE = 500
     total_affected = 0
+    failed_batches = 0
 
     for i in range(0, len(records), BATCH_SIZE):
         batch = records[i:i + BATCH_SIZE]
         try:
-            extras.execute_values(cur, upsert_sql, batch, template=template, page_size=BATCH_SIZE)
+            with TELEMETRY.stage('db_write'):
+                extras.execute_values(cur, upsert_sql, batch, template=template, page_size=BATCH_SIZE)
             affected = cur.rowcount
-            conn.commit()
+            with TELEMETRY.stage('commit'):
+                conn.commit()
             total_affected += affected
             print(f"  Batch {i // BATCH_SIZE + 1}: {affected} rows upserted")
         except Exception as e:
             conn.rollback()
+            failed_batches += 1
             print(f"  ❌ Batch {i // BATCH_SIZE + 1} failed: {e}")
 
     cur.close()
-    return total_affected
+    return total_affected, failed_batches
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
@@ -316,14 +328,18 @@ def main():
     print("=" * 60)
 
     conn, api_key = get_db_connection()
+    error = None
 
     try:
         rows = download_vm_types(api_key)
         if not rows:
             print("⚠️   No records found in the downloaded file.")
-            return
+            return "no records downloaded"
 
-        affected = upsert_vm_types(conn, rows)
+        affected, failed_batches = upsert_vm_types(conn, rows)
+        if failed_batches:
+            error = f"{failed_batches} upsert batches failed"
+        publish_epoch(conn, 'update_vm_types', {VM_TYPES: affected})
 
         elapsed = (datetime.now() - start).total_seconds()
         print()
@@ -332,12 +348,20 @@ def main():
         print(f"  Records upserted : {affected}")
         print(f"  Time elapsed     : {elapsed:.1f}s")
         print("=" * 60)
+        TELEMETRY.report()
 
     except KeyboardInterrupt:
+        error = "Cancelled by user"
         print("\n⚠️  Cancelled by user")
     finally:
         conn.close()
+    return error
 
 
 if __name__ == '__main__':
-    main()
+    # --profile / INGEST_PROFILE=1: CPU and memory profile bundle (see profiling.py)
+    with profile_run('update_vm_types'):
+        error = main()
+    if error:
+        print(f"❌ {error}")
+        sys.exit(1)
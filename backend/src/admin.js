@@ -67,11 +67,12 @@ function spawnPython(scriptRelPath, job) {
 }
 
 const SYNC_ACTION_META = {
-    quick_sync:      'Quick Sync (JS)',
-    full_sync:       'Full Price Sync (JS)',
+    quick_sync:      'Quick Sync',
+    full_sync:       'Full Price Sync',
     python_prices:   'Update Prices',
     python_currency: 'Update Currencies',
     python_vm_types: 'Update VM Types',
+    python_price_matrix: 'Build VM Price Matrix',
 };
 
 // Apply auth guard to all routes (password gate is handled on the frontend)
@@ -290,11 +291,11 @@ router.post('/sync/run', async (req, res) => {
         try {
             job.logs.push(`[start] ${label} started at ${job.startedAt.toISOString()}`);
             if (action === 'quick_sync') {
-                job.logs.push('[info] Running JS quick sync...');
+                job.logs.push('[info] Running quick sync (async_sync.py)...');
                 await runQuickSync();
                 job.logs.push('[done] Quick sync complete.');
             } else if (action === 'full_sync') {
-                job.logs.push('[info] Running JS full sync (this may take 30+ min)...');
+                job.logs.push('[info] Running full sync (async_sync.py)...');
                 await runFullSync();
                 job.logs.push('[done] Full sync complete.');
             } else if (action === 'python_prices') {
@@ -303,6 +304,8 @@ router.post('/sync/run', async (req, res) => {
                 await spawnPython('../scripts/update_currency_rates.py', job);
             } else if (action === 'python_vm_types') {
                 await spawnPython('../scripts/update_vm_types.py', job);
+            } else if (action === 'python_price_matrix') {
+                await spawnPython('../scripts/build_price_matrix.py', job);
             }
             job.status = 'completed';
         } catch (err) {
@@ -1,8 +1,14 @@
 import express from 'express';
-import { query } from './db.js';
+import { query, getCatalogEpochKey } from './db.js';
 
 const router = express.Router();
 
+// ── Estimate cache keyed by catalog epoch ────────────────────────────────────
+// Results only change when an ingest job publishes a new epoch, so identical
+// requests within the same epoch are served from memory.
+const ESTIMATE_CACHE = new Map();
+const ESTIMATE_CACHE_MAX = 200;
+
 // ── Azure Region → Billing Zone Map ──────────────────────────────────────────
 const ZONE_MAP = {
     // Zone 1 — North America, Europe
@@ -37,6 +43,12 @@ router.post('/calculate_estimate', async (req, res) => {
             return res.status(400).json({ error: 'items array is required' });
         }
 
+        const cacheKey = `${await getCatalogEpochKey()}:${currency}:${JSON.stringify(items)}`;
+        if (ESTIMATE_CACHE.has(cacheKey)) {
+            res.set('X-Cache', 'HIT');
+            return res.json(ESTIMATE_CACHE.get(cacheKey));
+        }
+
         // Fetch currency rate
         const rateRes = await query('SELECT rate_from_usd FROM currency_rates WHERE currency_code = $1', [currency]);
         const rate = rateRes.rows.length > 0 ? rateRes.rows[0].rate_from_usd : 1.0;
@@ -87,7 +99,8 @@ router.post('/calculate_estimate', async (req, res) => {
                     // ── Query 1: Base compute price ──
                     let sql = `
                         SELECT sku_name, product_name, raw_data->>'meterName' AS meter_name,
-                               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure
+                               retail_price, raw_data->>'unitOfMeasure' AS unit_of_measure,
+                               term_months, effective_monthly_price
                         FROM azure_prices
                         WHERE currency_code = 'USD'
                           AND is_active = TRUE
@@ -100,11 +113,8 @@ router.post('/calculate_estimate', async (req, res) => {
                     // Reservations only cover base compute — NEVER filter on Windows for reservations
                     if (isReserved) {
                         sql += ` AND product_name NOT ILIKE '%Windows%'`;
-                        if (is1Year) {
-                            sql += ` AND type = 'Reservation' AND reservation_term ILIKE '%1 Year%'`;
-                        } else {
-                            sql += ` AND type = 'Reservation' AND (reservation_term ILIKE '%3 Year%' OR reservation_term ILIKE '%3 Years%')`;
-                        }
+                        // term_months is precomputed by scripts/effective_rates.py
+                        sql += ` AND type = 'Reservation' AND term_months = ${is1Year ? 12 : 36}`;
                     } else {
                         // PAYG — filter on OS
                         if (isWindows) {
@@ -144,10 +154,8 @@ router.post('/calculate_estimate', async (req, res) => {
 
                     if (res.rows.length > 0) {
                         const row = res.rows[0];
-                        if (is1Year) {
-                            itemCost = (row.retail_price / 12) * qty * rate;
-                        } else if (is3Year) {
-                            itemCost = (row.retail_price / 36) * qty * rate;
+                        if (isReserved) {
+                            itemCost = (row.effective_monthly_price ?? row.retail_price / row.term_months) * qty * rate;
                         } else {
                             itemCost = row.retail_price * 730 * qty * rate;
                         }
@@ -818,11 +826,17 @@ router.post('/calculate_estimate', async (req, res) => {
         const breakdown = allBreakdowns.flat();
         const total = breakdown.reduce((sum, b) => sum + b.cost, 0);
 
-        res.json({
+        const response = {
             breakdown,
             total: parseFloat(total.toFixed(2)),
             currency,
-        });
+        };
+        if (ESTIMATE_CACHE.size >= ESTIMATE_CACHE_MAX) {
+            ESTIMATE_CACHE.delete(ESTIMATE_CACHE.keys().next().value);
+        }
+        ESTIMATE_CACHE.set(cacheKey, response);
+        res.set('X-Cache', 'MISS');
+        res.json(response);
 
     } catch (err) {
         console.error('Calculate estimate tool error:', err);
@@ -27,6 +27,39 @@ setInterval(() => {
     pool.query('SELECT 1').catch(() => {});
 }, 4 * 60 * 1000);
 
+// ── Catalog epoch ───────────────────────────────
+// Bumped by every Python ingest job (scripts/catalog_epoch.py). Response caches
+// embed the epoch of the services they depend on, so a sync only invalidates
+// what actually changed. Re-read from the DB at most once a minute.
+const CATALOG_EPOCH_REFRESH_MS = 60 * 1000;
+const catalogEpochs = { epoch: 0, services: {}, fetchedAt: 0 };
+
+// ── Price snapshot service ──────────────────────
+// scripts/price_snapshot_service.py answers queryPrices() from an in-memory,
+// columnar copy of the active catalog. Used when PRICE_SNAPSHOT_URL is set;
+// if the service is down, slow, or still on an older epoch than the one we
+// know about, the query falls back to Postgres.
+const PRICE_SNAPSHOT_URL = process.env.PRICE_SNAPSHOT_URL;
+const PRICE_SNAPSHOT_TIMEOUT_MS = 2000;
+
+async function querySnapshot(filters) {
+    const params = new URLSearchParams();
+    for (const [key, value] of Object.entries(filters)) {
+        if (value !== undefined && value !== null && value !== '') params.set(key, String(value));
+    }
+    try {
+        const res = await fetch(`${PRICE_SNAPSHOT_URL}/prices?${params}`, {
+            signal: AbortSignal.timeout(PRICE_SNAPSHOT_TIMEOUT_MS),
+        });
+        if (!res.ok) return null;
+        const body = await res.json();
+        if (body.epoch < catalogEpochs.epoch) return null;
+        return body.items;
+    } catch (err) {
+        return null;
+    }
+}
+
 /**
  * Execute a query with the pool
  */
@@ -76,6 +109,12 @@ export async function initDB() {
     );
   `);
 
+    // Effective-rate columns (maintained by scripts/effective_rates.py after each sync)
+    await query(`ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS term_months SMALLINT;`);
+    await query(`ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS effective_hourly_price DOUBLE PRECISION;`);
+    await query(`ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS effective_monthly_price DOUBLE PRECISION;`);
+    await query(`ALTER TABLE azure_prices ADD COLUMN IF NOT EXISTS savings_pct DOUBLE PRECISION;`);
+
     // Currency Rates Table
     await query(`
     CREATE TABLE IF NOT EXISTS currency_rates (
@@ -185,6 +224,41 @@ export async function initDB() {
     );
     `);
 
+    // ── vm_price_matrix table (populated by scripts/build_price_matrix.py) ──
+    // Narrow SKU × region × (os, term) matrix so VM comparisons skip azure_prices.
+    await query(`
+    CREATE TABLE IF NOT EXISTS vm_price_matrix (
+        sku_name         TEXT NOT NULL,
+        arm_region_name  TEXT NOT NULL,
+        location         TEXT,
+        os               TEXT NOT NULL,
+        term             TEXT NOT NULL,
+        price_per_hour   DOUBLE PRECISION NOT NULL,
+        is_cheapest      BOOLEAN DEFAULT FALSE,
+        generated_at     TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (sku_name, os, term, arm_region_name)
+    );
+    `);
+
+    // ── Catalog epoch tables (bumped by every Python ingest job) ──
+    await query(`
+    CREATE TABLE IF NOT EXISTS catalog_epoch (
+        epoch            BIGSERIAL PRIMARY KEY,
+        job              TEXT NOT NULL,
+        run_id           INTEGER,
+        service_changes  JSONB NOT NULL DEFAULT '{}',
+        published_at     TIMESTAMPTZ DEFAULT NOW()
+    );
+    `);
+    await query(`
+    CREATE TABLE IF NOT EXISTS catalog_service_epoch (
+        service_name  TEXT PRIMARY KEY,
+        epoch         BIGINT NOT NULL,
+        change_count  INTEGER NOT NULL,
+        updated_at    TIMESTAMPTZ DEFAULT NOW()
+    );
+    `);
+
     // 3. User Table
     await query(`
     CREATE TABLE IF NOT EXISTS users (
@@ -274,6 +348,9 @@ export async function initDB() {
       error TEXT
     );
   `);
+    // Python ingestion jobs record which job a run belongs to, and its per-stage telemetry
+    await query(`ALTER TABLE sync_log ADD COLUMN IF NOT EXISTS job TEXT;`);
+    await query(`ALTER TABLE sync_log ADD COLUMN IF NOT EXISTS stats JSONB;`);
 
     console.log('✅ PostgreSQL database schema initialized');
 }
@@ -293,6 +370,13 @@ export async function queryPrices({
     search,
     limit = 200,
 } = {}) {
+    if (PRICE_SNAPSHOT_URL) {
+        const items = await querySnapshot({
+            serviceName, armRegionName, currencyCode, type, productName, skuName, search, limit,
+        });
+        if (items) return items;
+    }
+
     const conditions = [];
     const args = [];
     let paramIndex = 1;
@@ -370,25 +454,18 @@ export async function queryPrices({
     return result.rows.map(row => rowToItemLean(row, rate, currencyCode));
 }
 
-/**
- * Upsert a batch of items
- * NOTE: This is for Node.js based syncing. 
- * Since we are moving to Python script for ingestion, this might be deprecated 
- * or needs to be updated to match new schema if we still want Node to write.
- * For now, I'll update it to match new schema roughly, but Python is primary.
- */
-export async function upsertPrices(items) {
-    if (items.length === 0) return 0;
-    console.warn("⚠️ upsertPrices in Node is deprecated. Use python script.");
-    return 0;
-}
+// sync_log jobs that sync the whole catalog. Targeted runs (restore_vms) and
+// dead-letter replays also write sync_log but say nothing about freshness;
+// rows without a job predate the column and came from the JS full sync.
+const CATALOG_SYNC_JOBS = ['update_prices', 'async_sync', 'initial_pricing_load', 'json_to_postgres'];
 
 /**
- * Get last sync info
+ * Get last sync info (latest catalog sync, see CATALOG_SYNC_JOBS)
  */
 export async function getLastSync() {
     const result = await query(
-        `SELECT * FROM sync_log ORDER BY id DESC LIMIT 1`
+        `SELECT * FROM sync_log WHERE job IS NULL OR job = ANY($1) ORDER BY id DESC LIMIT 1`,
+        [CATALOG_SYNC_JOBS]
     );
     return result.rows[0] || null;
 }
@@ -413,6 +490,82 @@ export async function completeSyncLog(id, itemsSynced, error = null) {
     );
 }
 
+/**
+ * Price change feed — deltas recorded in price_history after the keyset cursor
+ * (sinceRunId, sinceMeterId), ordered by (run_id, meter_id). Without a meter id
+ * the feed starts after the whole run. A page never splits a meter's rows, so it
+ * can run a few rows past `limit`; its last row is the next cursor.
+ * The changed_at lower bound lets Postgres prune older monthly partitions.
+ */
+export async function getPriceChangesSince(sinceRunId, sinceMeterId, serviceName, limit = 5000) {
+    const args = [sinceRunId, sinceMeterId ?? null];
+    // A NULL meter id makes the row comparison false within run $1 itself
+    let filter = `
+        (h.run_id, h.meter_id) > ($1, $2::text)
+        AND h.changed_at >= COALESCE(
+              (SELECT started_at FROM sync_log WHERE id = $1), '-infinity')
+    `;
+    if (serviceName) {
+        args.push(serviceName);
+        filter += ` AND h.service_name = $${args.length}`;
+    }
+    args.push(limit);
+    const sql = `
+        WITH page_end AS (
+            SELECT run_id, meter_id FROM (
+                SELECT h.run_id, h.meter_id FROM price_history h
+                WHERE ${filter}
+                ORDER BY h.run_id, h.meter_id LIMIT $${args.length}
+            ) page
+            ORDER BY run_id DESC, meter_id DESC LIMIT 1
+        )
+        SELECT h.run_id, h.meter_id, h.effective_start_date, h.currency_code, h.service_name,
+               h.arm_region_name, h.old_price, h.new_price, h.changed_at
+        FROM price_history h, page_end e
+        WHERE ${filter}
+          AND (h.run_id, h.meter_id) <= (e.run_id, e.meter_id)
+        ORDER BY h.run_id, h.meter_id, h.effective_start_date, h.currency_code
+    `;
+
+    const result = await query(sql, args);
+    return result.rows.map(row => ({
+        runId: row.run_id,
+        meterId: row.meter_id,
+        effectiveStartDate: row.effective_start_date,
+        currencyCode: row.currency_code,
+        serviceName: row.service_name,
+        armRegionName: row.arm_region_name,
+        oldPrice: row.old_price,
+        newPrice: row.new_price,
+        changedAt: row.changed_at,
+    }));
+}
+
+/**
+ * Cache-key fragment for the current catalog epoch.
+ * With service names: the epochs in which those services last changed.
+ * Without: the global epoch (changes whenever any job publishes).
+ */
+export async function getCatalogEpochKey(...services) {
+    if (Date.now() - catalogEpochs.fetchedAt > CATALOG_EPOCH_REFRESH_MS) {
+        catalogEpochs.fetchedAt = Date.now();
+        try {
+            const [latest, perService] = await Promise.all([
+                query('SELECT COALESCE(MAX(epoch), 0) AS epoch FROM catalog_epoch'),
+                query('SELECT service_name, epoch FROM catalog_service_epoch'),
+            ]);
+            catalogEpochs.epoch = Number(latest.rows[0].epoch);
+            catalogEpochs.services = Object.fromEntries(
+                perService.rows.map(row => [row.service_name, Number(row.epoch)])
+            );
+        } catch (err) {
+            // Tables appear after the first Python ingest run — keep epoch 0 until then
+        }
+    }
+    if (services.length === 0) return `e${catalogEpochs.epoch}`;
+    return 'e' + services.map(name => catalogEpochs.services[name] || 0).join('.');
+}
+
 /**
  * Get total price count
  */
@@ -514,10 +667,11 @@ export default {
     query,
     initDB,
     queryPrices,
-    upsertPrices,
     getLastSync,
     createSyncLog,
     completeSyncLog,
     getPriceCount,
-    getBestVmPrices
+    getBestVmPrices,
+    getPriceChangesSince,
+    getCatalogEpochKey
 };
@@ -4,7 +4,7 @@ import compression from 'compression';
 import dotenv from 'dotenv';
 import path from 'path';
 import { fileURLToPath } from 'url';
-import { initDB, queryPrices, getLastSync, getPriceCount, getBestVmPrices } from './db.js';
+import { initDB, queryPrices, getLastSync, getPriceCount, getBestVmPrices, getPriceChangesSince, getCatalogEpochKey } from './db.js';
 import { runFullSync, runQuickSync } from './sync.js';
 import { initScheduler } from './scheduler.js';
 import authRouter, { authenticateToken } from './auth.js';
@@ -20,9 +20,11 @@ dotenv.config();
 const app = express();
 const PORT = process.env.PORT || 3001;
 
-// ── Server-side in-process response cache (15-minute TTL) ────────────────────
+// ── Server-side in-process response cache ─────────────────────────────────────
+// Keys embed the catalog epoch (getCatalogEpochKey), so entries go stale only when
+// the underlying data changes; the TTL just bounds how long unused entries linger.
 const SERVER_CACHE = new Map();
-const SERVER_CACHE_TTL = 15 * 60 * 1000; // 15 minutes
+const SERVER_CACHE_TTL = 6 * 60 * 60 * 1000; // 6 hours
 
 function serverCacheGet(key) {
     const entry = SERVER_CACHE.get(key);
@@ -185,8 +187,11 @@ app.get('/api/prices', async (req, res) => {
             limit,
         } = req.query;
 
-        // Build a cache key from all significant query params
-        const cacheKey = `prices:${serviceName}:${region}:${currency}:${type}:${productName}:${skuName}:${searchText}:${limit}`;
+        // Build a cache key from the catalog epoch plus all significant query params
+        const epoch = serviceName
+            ? await getCatalogEpochKey(serviceName, 'currency_rates')
+            : await getCatalogEpochKey();
+        const cacheKey = `prices:${epoch}:${serviceName}:${region}:${currency}:${type}:${productName}:${skuName}:${searchText}:${limit}`;
         const cached = serverCacheGet(cacheKey);
         if (cached) {
             res.set('X-Cache', 'HIT');
@@ -252,6 +257,39 @@ app.get('/api/prices/search', async (req, res) => {
     }
 });
 
+/**
+ * GET /api/prices/changes
+ * Change feed of retail price deltas, paged by a (run id, meter id) keyset cursor.
+ * Params: since (run id already seen), after (optional: last meter id seen in
+ * that run), service (optional), limit
+ * Returns `cursor` {runId, meterId}; while `truncated` is true, request again
+ * with since=cursor.runId&after=cursor.meterId.
+ */
+app.get('/api/prices/changes', async (req, res) => {
+    try {
+        const since = parseInt(req.query.since);
+        if (Number.isNaN(since)) {
+            return res.status(400).json({ error: 'Query parameter "since" (run id) is required' });
+        }
+        const after = req.query.after || null;
+        const limit = Math.min(parseInt(req.query.limit) || 5000, 50000);
+
+        const changes = await getPriceChangesSince(since, after, req.query.service, limit);
+        const last = changes[changes.length - 1];
+        res.json({
+            since,
+            after,
+            cursor: last ? { runId: last.runId, meterId: last.meterId } : { runId: since, meterId: after },
+            truncated: changes.length >= limit,
+            Count: changes.length,
+            Items: changes,
+        });
+    } catch (err) {
+        console.error('Price changes error:', err);
+        res.status(500).json({ error: 'Failed to fetch price changes', message: err.message });
+    }
+});
+
 /**
  * POST /api/sync
  * Trigger a manual full sync
@@ -287,7 +325,8 @@ app.get('/api/best-vm-prices', async (req, res) => {
     try {
         const { currency = 'USD' } = req.query;
 
-        const cacheKey = `best-vm-prices:${currency}`;
+        const epoch = await getCatalogEpochKey('Virtual Machines', 'currency_rates');
+        const cacheKey = `best-vm-prices:${epoch}:${currency}`;
         const cached = serverCacheGet(cacheKey);
         if (cached) {
             res.set('X-Cache', 'HIT');
@@ -321,7 +360,8 @@ app.get('/api/vm-compare', async (req, res) => {
         const { skus, currency = 'USD', os = 'linux' } = req.query;
         if (!skus) return res.status(400).json({ error: 'skus parameter required' });
 
-        const cacheKey = `vm-compare:${skus}:${currency}:${os}`;
+        const epoch = await getCatalogEpochKey('vm_price_matrix', 'Virtual Machines', 'currency_rates');
+        const cacheKey = `vm-compare:${epoch}:${skus}:${currency}:${os}`;
         const cached = serverCacheGet(cacheKey);
         if (cached) { res.set('X-Cache', 'HIT'); return res.json(cached); }
 
@@ -337,6 +377,23 @@ app.get('/api/vm-compare', async (req, res) => {
 
         const results = {};
         for (const sku of skuList) {
+            // Fast path: precomputed SKU × region matrix (scripts/build_price_matrix.py)
+            const matrix = await query(
+                `SELECT arm_region_name, location, price_per_hour AS price
+                 FROM vm_price_matrix
+                 WHERE sku_name = $1 AND os = $2 AND term = 'payg'
+                 ORDER BY arm_region_name ASC`,
+                [sku, os === 'windows' ? 'windows' : 'linux']
+            ).catch(() => ({ rows: [] }));
+            if (matrix.rows.length > 0) {
+                results[sku] = matrix.rows.map(row => ({
+                    region: row.arm_region_name,
+                    location: row.location,
+                    price: row.price * rate,
+                }));
+                continue;
+            }
+
             const sqlRegional = `
                 SELECT arm_region_name, location, MIN(retail_price) as price
                 FROM azure_prices
@@ -384,6 +441,7 @@ app.get('/api/health', async (req, res) => {
             uptime: process.uptime(),
             totalPrices,
             lastSync: lastSync ? {
+                job: lastSync.job,
                 startedAt: lastSync.started_at,
                 completedAt: lastSync.completed_at,
                 itemsSynced: lastSync.items_synced,
@@ -412,17 +470,19 @@ async function warmUpCaches() {
 
     // 1. Warm up best-VM-prices (for VM comparison page)
     const currencies = ['USD', 'INR'];
+    const vmEpoch = await getCatalogEpochKey('Virtual Machines', 'currency_rates');
     await Promise.all(currencies.map(async (currency) => {
         try {
             const prices = await getBestVmPrices(currency);
-            serverCacheSet(`best-vm-prices:${currency}`, { count: prices.length, currency, items: prices });
+            serverCacheSet(`best-vm-prices:${vmEpoch}:${currency}`, { count: prices.length, currency, items: prices });
         } catch (e) { /* non-fatal */ }
     }));
 
     // 2. Warm up /api/prices for popular services (the modal query)
     for (const svc of popularServices) {
         try {
-            const cacheKey = `prices:${svc}:${defaultRegion}:${defaultCurrency}:undefined:undefined:undefined:undefined:all`;
+            const epoch = await getCatalogEpochKey(svc, 'currency_rates');
+            const cacheKey = `prices:${epoch}:${svc}:${defaultRegion}:${defaultCurrency}:undefined:undefined:undefined:undefined:all`;
             if (!serverCacheGet(cacheKey)) {
                 const items = await queryPrices({
                     serviceName: svc,
@@ -538,7 +598,8 @@ app.get('/api/vm-list', async (req, res) => {
         } = req.query;
 
         // Server-side cache — one key per region+currency+search combo
-        const cacheKey = `vm-list:${region}:${currency}:${search}`;
+        const epoch = await getCatalogEpochKey('Virtual Machines', 'vm_types', 'currency_rates');
+        const cacheKey = `vm-list:${epoch}:${region}:${currency}:${search}`;
         const cached = serverCacheGet(cacheKey);
         if (cached) {
             res.set('X-Cache', 'HIT');
@@ -650,7 +711,8 @@ app.post('/api/vms/compare', async (req, res) => {
 
         if (!skus.length) return res.json({ items: [], currency, skus, regions });
 
-        const cacheKey = `vms-compare:${skus.sort().join(',')}:${regions.sort().join(',')}:${currency}`;
+        const epoch = await getCatalogEpochKey('Virtual Machines', 'vm_types', 'currency_rates');
+        const cacheKey = `vms-compare:${epoch}:${skus.sort().join(',')}:${regions.sort().join(',')}:${currency}`;
         const cached = serverCacheGet(cacheKey);
         if (cached) { res.set('X-Cache', 'HIT'); return res.json(cached); }
 
@@ -26,11 +26,9 @@ async function runSyncSequence() {
     const start = new Date();
     console.log(`\n[Scheduler] ===== Nightly Sync Started at ${start.toISOString()} =====`);
     try {
-        console.log('[Scheduler] Step 1/2 — Updating currency rates...');
-        await runPythonScript('../scripts/update_currency_rates.py');
-
-        console.log('[Scheduler] Step 2/2 — Updating Azure prices (incremental)...');
-        await runPythonScript('../scripts/update_prices.py');
+        // Migrations, currency rates, prices, VM types and the price matrix run as
+        // a DAG with per-job locks, timeouts and history (scripts/orchestrate.py)
+        await runPythonScript('../scripts/orchestrate.py');
 
         const elapsed = ((Date.now() - start) / 1000 / 60).toFixed(1);
         console.log(`[Scheduler] ===== Nightly Sync Complete in ${elapsed}m =====\n`);
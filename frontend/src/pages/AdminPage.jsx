@@ -715,6 +715,7 @@ function SyncTab({ token }) {
         { key: 'python_prices',   label: 'Update Prices',        badge: 'Python', color: '#059669', icon: TrendingUp, desc: 'Fetch latest Azure retail prices from Azure API' },
         { key: 'python_currency', label: 'Update Currencies',    badge: 'Python', color: '#0891b2', icon: DollarSign, desc: 'Derive exchange rates via Azure reference SKUs' },
         { key: 'python_vm_types', label: 'Update VM Types',      badge: 'Python', color: '#6366f1', icon: Server,     desc: 'Download VM specs (CPU, GPU, memory) from CloudPrice' },
+        { key: 'python_price_matrix', label: 'Build VM Price Matrix', badge: 'Python', color: '#d97706', icon: Database, desc: 'Precompute SKU × region prices for VM comparison' },
     ];
 
     const JOB_COLOR = { running: '#f59e0b', completed: '#10b981', failed: '#ef4444' };